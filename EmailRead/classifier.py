@@ -0,0 +1,186 @@
+"""Cheap pre-LLM classification of bulk and automated mail"""
+
+from email.utils import parseaddr
+from typing import Dict, Optional
+import os
+import re
+import threading
+
+try:
+    from . import metrics
+    from .priority import sender_matches
+except ImportError:
+    import metrics
+    from priority import sender_matches
+
+# "headers" checks mailing-list/automation headers and the sender address,
+# "text" also scores the subject and content, "off" sends every email to the model
+CLASSIFIER_MODES = ("off", "headers", "text")
+CLASSIFIER_MODE = os.environ.get("AUTOMAIL_CLASSIFIER", "headers")
+
+# Email categories that are not worth an LLM call
+CATEGORY_NEWSLETTER = "newsletter"
+CATEGORY_NOTIFICATION = "notification"
+CATEGORY_RECEIPT = "receipt"
+
+# Newsletters get a one-line template summary; for notifications and receipts
+# Gmail's snippet usually already says what happened
+_SNIPPET_CATEGORIES = (CATEGORY_NOTIFICATION, CATEGORY_RECEIPT)
+
+_LABELS = {
+    CATEGORY_NEWSLETTER: "Newsletter",
+    CATEGORY_NOTIFICATION: "Automated notification",
+    CATEGORY_RECEIPT: "Receipt",
+}
+
+# Local parts of addresses that never read replies
+_NOREPLY_SENDER = re.compile(
+    r'^(no[-_.]?reply|do[-_.]?not[-_.]?reply|notifications?|alerts?|mailer-daemon|postmaster|bounces?)([-+_.].*)?$'
+)
+
+_BULK_PRECEDENCE = ("bulk", "list", "junk")
+
+# Text classifier: (pattern, category, weight); a category needs TEXT_THRESHOLD points
+TEXT_RULES = (
+    (re.compile(r'\bunsubscribe\b'), CATEGORY_NEWSLETTER, 2),
+    (re.compile(r'view (this email )?in (your|a|the) browser'), CATEGORY_NEWSLETTER, 2),
+    (re.compile(r'\b(newsletter|weekly digest|daily digest)\b'), CATEGORY_NEWSLETTER, 2),
+    (re.compile(r'\bmanage (your )?(email )?preferences\b'), CATEGORY_NEWSLETTER, 1),
+    (re.compile(r'\b(receipt|invoice)\b'), CATEGORY_RECEIPT, 2),
+    (re.compile(r'\b(order|payment) (confirmation|received|confirmed)\b'), CATEGORY_RECEIPT, 2),
+    (re.compile(r'\byour order\b'), CATEGORY_RECEIPT, 1),
+    (re.compile(r'\b(verification|security|confirmation) code\b'), CATEGORY_NOTIFICATION, 2),
+    (re.compile(r'\b(this is an automated|automatically generated|do not reply to this)\b'), CATEGORY_NOTIFICATION, 2),
+    (re.compile(r'\bnew sign-?in\b'), CATEGORY_NOTIFICATION, 1),
+)
+TEXT_THRESHOLD = 2
+
+_stats_lock = threading.Lock()
+_stats = {
+    "classified": 0,
+    "skipped": 0,
+    "llm_calls_saved": 0,
+    "by_category": {},
+    "llm_emails": 0,
+    "llm_seconds": 0.0,
+}
+
+
+def _classify_headers(email: Dict) -> Optional[Dict]:
+    """Classify an email from its mailing-list/automation headers and sender address."""
+    headers = email.get('headers') or {}
+    if headers.get('list-unsubscribe') or headers.get('list-id'):
+        return {"category": CATEGORY_NEWSLETTER, "reason": "List-Unsubscribe/List-Id header"}
+    
+    precedence = (headers.get('precedence') or '').strip().lower()
+    if precedence in _BULK_PRECEDENCE:
+        return {"category": CATEGORY_NEWSLETTER, "reason": f"Precedence: {precedence}"}
+    
+    auto_submitted = (headers.get('auto-submitted') or '').strip().lower()
+    if auto_submitted and auto_submitted != 'no':
+        return {"category": CATEGORY_NOTIFICATION, "reason": f"Auto-Submitted: {auto_submitted}"}
+    
+    address = parseaddr(email.get('from') or '')[1].lower()
+    if _NOREPLY_SENDER.match(address.split('@', 1)[0]):
+        return {"category": CATEGORY_NOTIFICATION, "reason": f"no-reply sender {address}"}
+    return None
+
+
+def _classify_text(email: Dict) -> Optional[Dict]:
+    """Score the subject and content against TEXT_RULES."""
+    text = ' '.join([email.get('subject') or '', email.get('body') or email.get('snippet') or '']).lower()
+    scores: Dict[str, int] = {}
+    for pattern, category, weight in TEXT_RULES:
+        if pattern.search(text):
+            scores[category] = scores.get(category, 0) + weight
+    if not scores:
+        return None
+    category, points = max(scores.items(), key=lambda item: item[1])
+    if points < TEXT_THRESHOLD:
+        return None
+    return {"category": category, "reason": f"text score {points}"}
+
+
+def classify(email: Dict, mode: Optional[str] = None) -> Optional[Dict]:
+    """
+    Decide whether an email can skip the LLM.
+    
+    Args:
+        email: Fetched email (from, subject, body, snippet and the headers
+            collected by parse_email_message)
+        mode: One of CLASSIFIER_MODES (default: CLASSIFIER_MODE)
+    
+    Returns:
+        {"category", "reason"} for bulk/automated mail, or None if the email
+        should be summarized by the model
+    """
+    mode = mode or CLASSIFIER_MODE
+    if mode == "off" or mode not in CLASSIFIER_MODES:
+        return None
+    # Mail from priority senders always gets a real summary
+    if sender_matches(email.get('from')):
+        return None
+    
+    classification = _classify_headers(email)
+    if classification is None and mode == "text":
+        classification = _classify_text(email)
+    return classification
+
+
+def template_result(email: Dict, classification: Dict) -> Dict:
+    """
+    Build the summary result for an email that skips the LLM.
+    
+    Returns:
+        Result in the shape of main.summarize_email's, plus the category
+    """
+    category = classification["category"]
+    sender = parseaddr(email.get('from') or '')[0] or email.get('from') or 'Unknown sender'
+    snippet = (email.get('snippet') or '').strip()
+    
+    if category in _SNIPPET_CATEGORIES and snippet:
+        summary = snippet
+    else:
+        summary = f"{_LABELS.get(category, 'Bulk email')} from {sender}: {email.get('subject') or 'No Subject'}"
+    
+    return {
+        "summary": summary,
+        "processing_time": 0,
+        "status": "success",
+        "category": category,
+        "classification_reason": classification["reason"],
+    }
+
+
+def record_skip(category: str, llm_calls: int):
+    """Count an email that was routed away from the LLM and the calls it would have made."""
+    with _stats_lock:
+        _stats["classified"] += 1
+        _stats["skipped"] += 1
+        _stats["llm_calls_saved"] += llm_calls
+        _stats["by_category"][category] = _stats["by_category"].get(category, 0) + 1
+    metrics.inc("automail_llm_skipped_total", category=category)
+
+
+def record_inference(emails: int, seconds: float):
+    """Count emails that went to the LLM, to estimate the time saved by skipping."""
+    with _stats_lock:
+        _stats["classified"] += emails
+        _stats["llm_emails"] += emails
+        _stats["llm_seconds"] += seconds
+
+
+def get_stats() -> Dict:
+    """Return classification counters and the estimated inference time saved."""
+    with _stats_lock:
+        average = _stats["llm_seconds"] / _stats["llm_emails"] if _stats["llm_emails"] else 0
+        return {
+            "mode": CLASSIFIER_MODE,
+            "classified": _stats["classified"],
+            "skipped": _stats["skipped"],
+            "skip_rate": round(_stats["skipped"] / _stats["classified"], 3) if _stats["classified"] else 0,
+            "llm_calls_saved": _stats["llm_calls_saved"],
+            "by_category": dict(_stats["by_category"]),
+            "avg_llm_seconds_per_email": round(average, 2),
+            "estimated_seconds_saved": round(_stats["skipped"] * average, 1),
+        }
@@ -0,0 +1,144 @@
+"""Prepare email content for the model: strip quoted history and signatures, enforce a token budget"""
+
+from typing import Dict, List
+import os
+import re
+
+# Maximum estimated tokens of email content put in one prompt; llama3.2 runs
+# with a 2048-token context in Ollama by default, which also has to fit the
+# instructions and the generated text. Smaller values are raised to MIN_TOKEN_BUDGET.
+MIN_TOKEN_BUDGET = 64
+TOKEN_BUDGET = max(MIN_TOKEN_BUDGET, int(os.environ.get("AUTOMAIL_TOKEN_BUDGET", "1500")))
+
+# Content longer than this (after stripping) is summarized chunk by chunk and
+# the chunk notes are then summarized together; shorter content that doesn't
+# fit the budget is truncated. 0 disables map-reduce summarization.
+MAP_REDUCE_THRESHOLD_TOKENS = int(os.environ.get("AUTOMAIL_MAP_REDUCE_TOKENS", "3000"))
+
+# Chunks summarized per email at most; content beyond that is dropped
+MAX_CHUNKS = int(os.environ.get("AUTOMAIL_MAP_REDUCE_MAX_CHUNKS", "8"))
+
+# Rough characters per token for English text with Llama tokenizers
+CHARS_PER_TOKEN = 4
+
+STRATEGY_FULL = "full"
+STRATEGY_TRUNCATED = "truncated"
+STRATEGY_MAP_REDUCE = "map_reduce"
+
+TRUNCATION_MARKER = "\n[...]"
+
+# Everything from the first of these lines on is quoted history
+_QUOTE_HEADERS = (
+    # Gmail/Apple: "On Mon, 1 Jan 2024 at 10:00, Bob <bob@example.com> wrote:" (may wrap once)
+    re.compile(r'^On\b[^\n]{0,200}(\n[^\n]{0,200})?\bwrote:[ \t]*$', re.MULTILINE),
+    # Outlook
+    re.compile(r'^-{2,}\s*Original Message\s*-{2,}[ \t]*$', re.MULTILINE | re.IGNORECASE),
+    re.compile(r'^_{10,}[ \t]*\n(From|De|Von):', re.MULTILINE),
+    re.compile(r'^From:[^\n]+\n(Sent|Date):[^\n]+\n', re.MULTILINE),
+)
+
+# Signature delimiter ("-- ") and mobile client footers
+_SIGNATURE = re.compile(
+    r'^(--[ \t]?|Sent from my [^\n]+|Get Outlook for [^\n]+)[ \t]*$',
+    re.MULTILINE
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in text."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def strip_quoted(text: str) -> str:
+    """Remove quoted replies ("> " lines and the history below a reply header)."""
+    for pattern in _QUOTE_HEADERS:
+        match = pattern.search(text)
+        if match:
+            text = text[:match.start()]
+    lines = [line for line in text.split('\n') if not line.lstrip().startswith('>')]
+    return '\n'.join(lines)
+
+
+def strip_signature(text: str) -> str:
+    """Remove the signature block and "Sent from my ..." footers."""
+    match = _SIGNATURE.search(text)
+    if match:
+        text = text[:match.start()]
+    return text
+
+
+def clean(text: str) -> str:
+    """
+    Strip quoted history and signatures from an email body.
+    
+    If nothing is left (e.g. a bare forward), the original text is returned.
+    """
+    cleaned = strip_signature(strip_quoted(text))
+    cleaned = re.sub(r'\n{3,}', '\n\n', cleaned).strip()
+    return cleaned if len(cleaned) >= 3 else text.strip()
+
+
+def truncate(text: str, max_tokens: int) -> str:
+    """Cut text to about max_tokens, preferring a paragraph or sentence boundary."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max(0, max_chars - len(TRUNCATION_MARKER))]
+    # Only back off to a boundary if that keeps most of the budget
+    for boundary in ('\n\n', '\n', '. '):
+        position = cut.rfind(boundary)
+        if position > len(cut) * 0.8:
+            cut = cut[:position + (1 if boundary == '. ' else 0)]
+            break
+    return cut.rstrip() + TRUNCATION_MARKER
+
+
+def split_chunks(text: str, max_tokens: int) -> List[str]:
+    """Split text into consecutive chunks of about max_tokens, on paragraph boundaries where possible."""
+    chunks = []
+    remaining = text
+    while remaining:
+        chunk = truncate(remaining, max_tokens)
+        if chunk.endswith(TRUNCATION_MARKER):
+            chunk = chunk[:-len(TRUNCATION_MARKER)]
+        if not chunk.strip():
+            # No room left next to the marker; cut at the budget so every pass makes progress
+            chunk = remaining[:max(1, max_tokens * CHARS_PER_TOKEN)]
+        chunks.append(chunk.strip())
+        remaining = remaining[len(chunk):].strip()
+    return [c for c in chunks if c]
+
+
+def prepare(text: str) -> Dict:
+    """
+    Turn selected email content into what is sent to the model.
+    
+    Args:
+        text: Email body (or snippet)
+    
+    Returns:
+        Dictionary with:
+            content: Cleaned text within TOKEN_BUDGET (truncated if needed)
+            strategy: "full", "truncated" or "map_reduce"
+            chunks: Chunks to summarize separately ("map_reduce" only)
+            original_tokens: Estimated tokens before cleaning
+            tokens: Estimated tokens after cleaning
+    """
+    cleaned = clean(text)
+    tokens = estimate_tokens(cleaned)
+    prepared = {
+        "content": cleaned,
+        "strategy": STRATEGY_FULL,
+        "chunks": [],
+        "original_tokens": estimate_tokens(text),
+        "tokens": tokens,
+    }
+    if tokens <= TOKEN_BUDGET:
+        return prepared
+    
+    prepared["content"] = truncate(cleaned, TOKEN_BUDGET)
+    prepared["strategy"] = STRATEGY_TRUNCATED
+    if MAP_REDUCE_THRESHOLD_TOKENS and tokens > MAP_REDUCE_THRESHOLD_TOKENS:
+        prepared["strategy"] = STRATEGY_MAP_REDUCE
+        prepared["chunks"] = split_chunks(cleaned, TOKEN_BUDGET)[:MAX_CHUNKS]
+    return prepared
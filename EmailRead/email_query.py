@@ -0,0 +1,148 @@
+"""Server-side filtering, cursor pagination and field projection for /api/emails"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+import base64
+import json
+
+try:
+    from .storage import date_timestamp
+except ImportError:
+    from storage import date_timestamp
+
+# Filters offered by the dashboard
+FILTERS = ("all", "today", "recent")
+RECENT_DAYS = 7
+
+# Fields an email can be projected to; email_id is always included
+EMAIL_FIELDS = (
+    "email_id", "from", "subject", "date", "body", "snippet",
+    "summary", "summary_time", "summary_ttft", "summary_model",
+    "draft_reply", "reply_time", "reply_ttft", "reply_model",
+    "error", "reply_error", "generation_mode", "combined_time", "category", "classification_reason",
+    "content_strategy", "content_tokens", "content_chunks", "thread_id", "thread_summary", "thread_messages",
+)
+
+MAX_LIMIT = 200
+
+
+class InvalidQueryError(ValueError):
+    """Raised for malformed cursors, filters or field lists."""
+
+
+def sort_key(email: Dict) -> Tuple[float, str]:
+    """Sort key for newest-first ordering: (date timestamp, email_id)."""
+    return date_timestamp(email.get('date')), email.get('email_id') or ''
+
+
+def encode_cursor(email: Dict) -> str:
+    """Build an opaque cursor pointing just after email."""
+    raw = json.dumps(list(sort_key(email)))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    """Decode a cursor produced by encode_cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        timestamp, email_id = json.loads(raw)
+        return float(timestamp), str(email_id)
+    except Exception:
+        raise InvalidQueryError("Invalid cursor")
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Parse a comma-separated field list (None means all fields)."""
+    if not fields:
+        return None
+    requested = [f.strip() for f in fields.split(',') if f.strip()]
+    unknown = [f for f in requested if f not in EMAIL_FIELDS]
+    if unknown:
+        raise InvalidQueryError(f"Unknown field(s): {', '.join(unknown)}")
+    return ['email_id'] + [f for f in requested if f != 'email_id']
+
+
+def matches(email: Dict, filter_name: str, search: Optional[str], tz_offset_minutes: int = 0) -> bool:
+    """
+    Check an email against the dashboard filters.
+    
+    Args:
+        email: Stored email
+        filter_name: "all", "today" (same calendar day as now) or "recent" (last 7 days)
+        search: Case-insensitive text to look for in sender, subject, summary, reply and body
+        tz_offset_minutes: Client timezone offset as returned by JS getTimezoneOffset()
+    
+    Returns:
+        True if the email should be included
+    """
+    if filter_name != "all":
+        timestamp = date_timestamp(email.get('date'))
+        if not timestamp:
+            return False
+        client_tz = timezone(-timedelta(minutes=tz_offset_minutes))
+        now = datetime.now(client_tz)
+        email_date = datetime.fromtimestamp(timestamp, client_tz)
+        if filter_name == "today" and email_date.date() != now.date():
+            return False
+        if filter_name == "recent" and now - email_date > timedelta(days=RECENT_DAYS):
+            return False
+    
+    if search:
+        searchable = ' '.join([
+            email.get('from') or '',
+            email.get('subject') or '',
+            email.get('summary') or '',
+            email.get('draft_reply') or '',
+            email.get('body') or '',
+        ]).lower()
+        if search.lower() not in searchable:
+            return False
+    
+    return True
+
+
+def query_emails(emails: Sequence[Dict], limit: Optional[int] = None, cursor: Optional[str] = None,
+                 filter_name: str = "all", search: Optional[str] = None, fields: Optional[str] = None,
+                 tz_offset_minutes: int = 0) -> Dict:
+    """
+    Filter, order and paginate emails.
+    
+    Args:
+        emails: Emails to query
+        limit: Page size (None returns every matching email)
+        cursor: Cursor from a previous page's next_cursor
+        filter_name: One of FILTERS
+        search: Text search
+        fields: Comma-separated list of fields to return
+        tz_offset_minutes: Client timezone offset for the "today"/"recent" filters
+    
+    Returns:
+        Dictionary with emails, next_cursor (None on the last page) and total
+        (number of matching emails across all pages)
+    
+    Raises:
+        InvalidQueryError: For an unknown filter or field, a bad cursor or limit
+    """
+    if filter_name not in FILTERS:
+        raise InvalidQueryError(f"Unknown filter: {filter_name}")
+    if limit is not None and not 1 <= limit <= MAX_LIMIT:
+        raise InvalidQueryError(f"limit must be between 1 and {MAX_LIMIT}")
+    projection = parse_fields(fields)
+    
+    matching = [e for e in emails if matches(e, filter_name, search, tz_offset_minutes)]
+    matching.sort(key=sort_key, reverse=True)
+    total = len(matching)
+    
+    if cursor:
+        after = decode_cursor(cursor)
+        matching = [e for e in matching if sort_key(e) < after]
+    
+    next_cursor = None
+    if limit is not None and len(matching) > limit:
+        matching = matching[:limit]
+        next_cursor = encode_cursor(matching[-1])
+    
+    if projection is not None:
+        matching = [{f: e.get(f) for f in projection if f in e} for e in matching]
+    
+    return {"emails": matching, "next_cursor": next_cursor, "total": total}
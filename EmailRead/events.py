@@ -0,0 +1,145 @@
+"""In-process event bus feeding the dashboard's Server-Sent Events stream"""
+
+from collections import deque
+from typing import Any, Dict, List, Optional, Set
+import asyncio
+import json
+import threading
+
+# Number of recent events kept so reconnecting clients can catch up via Last-Event-ID
+REPLAY_BUFFER_SIZE = 500
+
+# Maximum events queued for one slow client before it is told to resync
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+# Seconds between keepalive comments on an idle stream
+KEEPALIVE_SECONDS = 15
+
+
+class EventBus:
+    """
+    Fan-out of dashboard events to connected SSE clients.
+    
+    Every event gets an increasing integer ID. The most recent events are kept
+    in a replay buffer so a client reconnecting with Last-Event-ID receives
+    what it missed; a client that fell further behind (or whose queue
+    overflowed) gets a "reset" event telling it to reload the list.
+    publish() may be called from any thread.
+    """
+    
+    def __init__(self, replay_size: int = REPLAY_BUFFER_SIZE, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._buffer: "deque[Dict]" = deque(maxlen=replay_size)
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stats = {"published": 0, "dropped_subscribers": 0}
+    
+    def publish(self, event_type: str, data: Dict[str, Any], transient: bool = False) -> Dict:
+        """
+        Publish an event to every subscriber.
+        
+        Args:
+            event_type: Event name, e.g. "email_added"
+            data: JSON-serializable payload
+            transient: For high-frequency events that are superseded by a later
+                one (e.g. partial generations): they get no ID and are not replayed
+        
+        Returns:
+            The event, with its assigned ID
+        """
+        with self._lock:
+            if transient:
+                event = {"id": None, "type": event_type, "data": data}
+            else:
+                event = {"id": self._next_id, "type": event_type, "data": data}
+                self._next_id += 1
+                self._buffer.append(event)
+            self.stats["published"] += 1
+            loop = self._loop
+        
+        if loop is None or loop.is_closed():
+            return event
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._deliver(event)
+        else:
+            loop.call_soon_threadsafe(self._deliver, event)
+        return event
+    
+    def subscribe(self, last_event_id: Optional[str] = None) -> "asyncio.Queue":
+        """
+        Register a client. Must be called from the event loop.
+        
+        Args:
+            last_event_id: Last-Event-ID sent by a reconnecting client
+        
+        Returns:
+            Queue that receives the client's events
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._loop = asyncio.get_running_loop()
+        
+        for event in self.replay(last_event_id):
+            queue.put_nowait(event)
+        self._subscribers.add(queue)
+        return queue
+    
+    def unsubscribe(self, queue: "asyncio.Queue"):
+        """Remove a client registered with subscribe()."""
+        self._subscribers.discard(queue)
+    
+    def replay(self, last_event_id: Optional[str]) -> List[Dict]:
+        """Return the buffered events after last_event_id, or a reset event if they are gone."""
+        if not last_event_id:
+            return []
+        try:
+            last_id = int(last_event_id)
+        except ValueError:
+            return [self._reset_event()]
+        
+        with self._lock:
+            buffered = list(self._buffer)
+            next_id = self._next_id
+        if last_id == next_id - 1:
+            return []
+        # IDs from before a server restart, or events already evicted from the buffer
+        if last_id > next_id - 1 or not buffered or buffered[0]["id"] > last_id + 1:
+            return [self._reset_event()]
+        return [e for e in buffered if e["id"] > last_id][:self.queue_size - 1]
+    
+    def get_stats(self) -> Dict:
+        """Return subscriber and event counters."""
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "last_event_id": self._next_id - 1,
+                **self.stats
+            }
+    
+    def _deliver(self, event: Dict):
+        """Put an event on every subscriber queue. Runs on the event loop."""
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too far behind: drop its backlog and make it reload
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self._reset_event())
+                self.stats["dropped_subscribers"] += 1
+    
+    def _reset_event(self) -> Dict:
+        """Event telling a client its view is stale and must be reloaded."""
+        with self._lock:
+            return {"id": self._next_id - 1, "type": "reset", "data": {}}
+
+
+def format_sse(event: Dict) -> str:
+    """Serialize an event in the text/event-stream wire format."""
+    event_id = f"id: {event['id']}\n" if event.get('id') is not None else ""
+    return f"{event_id}event: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
@@ -0,0 +1,177 @@
+"""Incremental Gmail sync driven by the history IDs in Pub/Sub notifications"""
+
+from googleapiclient.errors import HttpError
+from typing import Dict, List, Optional, Tuple
+import base64
+import json
+import os
+
+try:
+    from . import logs, metrics, storage
+except ImportError:
+    import logs
+    import metrics
+    import storage
+
+log = logs.get_logger("history_sync")
+
+# File to persist the last fully processed history ID across server restarts
+_history_state_file = storage.state_path('.gmail_history_id.json')
+
+# Number of unread INBOX messages listed when a full resync is needed
+FULL_RESYNC_MAX_RESULTS = 50
+
+
+class HistoryExpiredError(Exception):
+    """Raised when Gmail no longer has history for the stored history ID."""
+
+
+def decode_pubsub_message(body: Dict) -> Dict:
+    """
+    Decode the Gmail notification carried by a Pub/Sub push request.
+    
+    Args:
+        body: JSON body of the push request ({"message": {"data": ...}, ...})
+    
+    Returns:
+        Dictionary with emailAddress and historyId (empty if the payload is missing or invalid)
+    """
+    data = (body or {}).get('message', {}).get('data')
+    if not data:
+        return {}
+    try:
+        decoded = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4)).decode('utf-8')
+        notification = json.loads(decoded)
+    except Exception as e:
+        log.warning("Could not decode Pub/Sub message data: %s", e)
+        return {}
+    if not isinstance(notification, dict):
+        return {}
+    if notification.get('historyId') is not None:
+        notification['historyId'] = str(notification['historyId'])
+    return notification
+
+
+def load_last_history_id() -> Optional[str]:
+    """Return the last processed history ID, or None if there is none."""
+    if not os.path.exists(_history_state_file):
+        return None
+    try:
+        with open(_history_state_file, 'r') as f:
+            history_id = json.load(f).get('history_id')
+            return str(history_id) if history_id else None
+    except Exception as e:
+        log.warning("Error loading history ID from disk: %s", e)
+        return None
+
+
+def save_last_history_id(history_id: Optional[str]):
+    """Persist the last processed history ID (ignores older IDs)."""
+    if not history_id:
+        return
+    current = load_last_history_id()
+    if current and int(current) >= int(history_id):
+        return
+    try:
+        os.makedirs(os.path.dirname(_history_state_file), exist_ok=True)
+        tmp_file = _history_state_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({'history_id': str(history_id)}, f)
+        os.replace(tmp_file, _history_state_file)
+    except Exception as e:
+        log.error("Error saving history ID to disk: %s", e)
+
+
+def list_history_message_ids(service, start_history_id: str) -> Tuple[List[str], str]:
+    """
+    List unread INBOX messages added since start_history_id.
+    
+    Args:
+        service: Gmail API service
+        start_history_id: History ID to list changes after
+    
+    Returns:
+        Tuple of (new message IDs in arrival order, latest history ID)
+    
+    Raises:
+        HistoryExpiredError: If start_history_id is too old (Gmail returns 404)
+    """
+    message_ids: List[str] = []
+    latest_history_id = start_history_id
+    page_token = None
+    
+    while True:
+        try:
+            response = metrics.gmail_execute(service.users().history().list(
+                userId='me',
+                startHistoryId=start_history_id,
+                historyTypes=['messageAdded'],
+                labelId='INBOX',
+                pageToken=page_token
+            ), "history.list")
+        except HttpError as e:
+            if e.resp.status == 404:
+                raise HistoryExpiredError(f"History ID {start_history_id} is no longer available") from e
+            raise
+        
+        for record in response.get('history', []):
+            for added in record.get('messagesAdded', []):
+                message = added.get('message', {})
+                labels = message.get('labelIds', [])
+                if 'UNREAD' in labels and 'INBOX' in labels and message.get('id') not in message_ids:
+                    message_ids.append(message['id'])
+        
+        latest_history_id = str(response.get('historyId', latest_history_id))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return message_ids, latest_history_id
+
+
+def list_unread_message_ids(service, max_results: int = FULL_RESYNC_MAX_RESULTS) -> List[str]:
+    """List the IDs of unread INBOX messages (used for a full resync)."""
+    messages = metrics.gmail_execute(service.users().messages().list(
+        userId='me',
+        labelIds=['INBOX', 'UNREAD'],
+        maxResults=max_results
+    ), "messages.list")
+    return [msg['id'] for msg in messages.get('messages', [])]
+
+
+def collect_new_message_ids(service, notification_history_id: Optional[str] = None) -> Tuple[List[str], Optional[str], str]:
+    """
+    Determine which messages need to be fetched for a notification.
+    
+    Uses users.history.list from the last processed history ID. Falls back to
+    listing all unread INBOX messages when no history ID is stored yet or the
+    stored one has expired.
+    
+    Args:
+        service: Gmail API service
+        notification_history_id: historyId from the Pub/Sub notification, if any
+    
+    Returns:
+        Tuple of (message IDs, history ID to save once they are processed,
+        sync mode "incremental" or "full")
+    """
+    last_history_id = load_last_history_id()
+    
+    if last_history_id:
+        if notification_history_id and int(notification_history_id) <= int(last_history_id):
+            log.info("Notification history ID %s already processed", notification_history_id)
+            return [], last_history_id, "incremental"
+        try:
+            message_ids, latest_history_id = list_history_message_ids(service, last_history_id)
+            log.info("Incremental sync from history ID %s: %d new message(s)", last_history_id, len(message_ids))
+            return message_ids, latest_history_id, "incremental"
+        except HistoryExpiredError as e:
+            log.warning("%s, falling back to full resync", e)
+    else:
+        log.info("No stored history ID, running full resync")
+    
+    # Read the current history ID before listing so nothing that arrives in between is skipped
+    profile_history_id = metrics.gmail_execute(
+        service.users().getProfile(userId='me'), "users.getProfile"
+    ).get('historyId')
+    message_ids = list_unread_message_ids(service)
+    history_id = profile_history_id or notification_history_id
+    return message_ids, str(history_id) if history_id else None, "full"
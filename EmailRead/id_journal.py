@@ -0,0 +1,197 @@
+"""Append-only journal of processed email IDs with background compaction"""
+
+from typing import Iterable, Optional, Set
+import os
+import threading
+import time
+
+try:
+    from . import logs
+except ImportError:
+    import logs
+
+log = logs.get_logger("id_journal")
+
+# Records are fsynced once this many are pending or FSYNC_INTERVAL_SECONDS have passed
+FSYNC_BATCH_SIZE = int(os.environ.get("AUTOMAIL_ID_JOURNAL_FSYNC_BATCH", "32"))
+FSYNC_INTERVAL_SECONDS = float(os.environ.get("AUTOMAIL_ID_JOURNAL_FSYNC_INTERVAL", "1.0"))
+
+# The journal is compacted (duplicates dropped) in the background above this size
+COMPACT_THRESHOLD_BYTES = int(os.environ.get("AUTOMAIL_ID_JOURNAL_COMPACT_BYTES", str(1024 * 1024)))
+
+
+class ProcessedIdJournal:
+    """
+    Append-only file with one processed email ID per line.
+    
+    Marking an email processed is a single appended line. Writes are flushed
+    immediately and fsynced in batches; a partially written last line (from a
+    crash mid-append) is ignored on replay. When the file grows past the
+    compaction threshold it is rewritten in a background thread with one line
+    per distinct ID, while appends continue.
+    """
+    
+    def __init__(self, path: str, fsync_batch_size: int = FSYNC_BATCH_SIZE,
+                 fsync_interval: float = FSYNC_INTERVAL_SECONDS,
+                 compact_threshold: int = COMPACT_THRESHOLD_BYTES):
+        self.path = path
+        self.fsync_batch_size = fsync_batch_size
+        self.fsync_interval = fsync_interval
+        self.compact_threshold = compact_threshold
+        self._lock = threading.Lock()
+        self._file = None
+        self._pending = 0
+        self._last_fsync = time.time()
+        self._compacting = False
+        # Grows after each compaction so a journal of distinct IDs isn't rewritten on every append
+        self._compact_at = compact_threshold
+        self._flusher: Optional[threading.Thread] = None
+        self.stats = {"appended": 0, "fsyncs": 0, "compactions": 0}
+    
+    def exists(self) -> bool:
+        """Return True if the journal file exists."""
+        return os.path.exists(self.path)
+    
+    def replay(self) -> Set[str]:
+        """Read every complete record in the journal and return the set of IDs."""
+        if not self.exists():
+            return set()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = f.read()
+        # Anything after the last newline is an incomplete write
+        complete = data[:data.rfind('\n') + 1]
+        return {line.strip() for line in complete.split('\n') if line.strip()}
+    
+    def append(self, email_ids: Iterable[str]):
+        """Append IDs to the journal; fsync happens in batches."""
+        lines = ''.join(f"{email_id}\n" for email_id in email_ids if email_id)
+        if not lines:
+            return
+        with self._lock:
+            handle = self._open()
+            handle.write(lines)
+            handle.flush()
+            self._pending += lines.count('\n')
+            self.stats["appended"] += lines.count('\n')
+            if self._pending >= self.fsync_batch_size or time.time() - self._last_fsync >= self.fsync_interval:
+                self._fsync()
+            size = handle.tell()
+            self._ensure_flusher()
+        if size > self._compact_at:
+            self.compact_in_background()
+    
+    def rewrite(self, email_ids: Iterable[str]):
+        """Replace the journal contents with exactly the given IDs."""
+        with self._lock:
+            self._close()
+            self._write_file(sorted(set(email_ids)))
+    
+    def flush(self):
+        """Fsync any pending records."""
+        with self._lock:
+            if self._pending:
+                self._fsync()
+    
+    def close(self):
+        """Fsync pending records and close the file."""
+        with self._lock:
+            self._close()
+    
+    def compact_in_background(self):
+        """Start a compaction thread unless one is already running."""
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+        threading.Thread(target=self._compact, name="id-journal-compact", daemon=True).start()
+    
+    def _compact(self):
+        """Rewrite the journal with one line per distinct ID."""
+        try:
+            # Snapshot the records written so far; appends continue meanwhile
+            with self._lock:
+                if self._file is not None:
+                    self._file.flush()
+                snapshot_size = os.path.getsize(self.path) if self.exists() else 0
+            with open(self.path, 'r', encoding='utf-8') as f:
+                snapshot = f.read(snapshot_size)
+            ids = {line.strip() for line in snapshot[:snapshot.rfind('\n') + 1].split('\n') if line.strip()}
+            
+            tmp_path = self.path + '.compact'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(''.join(f"{email_id}\n" for email_id in sorted(ids)))
+            
+            # Carry over records appended during compaction, then swap files
+            with self._lock:
+                self._close()
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    f.seek(snapshot_size)
+                    tail = f.read()
+                with open(tmp_path, 'a', encoding='utf-8') as f:
+                    f.write(tail)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+                self._compact_at = max(self.compact_threshold, 2 * os.path.getsize(self.path))
+                self.stats["compactions"] += 1
+            log.info("Compacted processed ID journal to %d ID(s)", len(ids))
+        except Exception as e:
+            log.error("Error compacting processed ID journal: %s", e)
+        finally:
+            with self._lock:
+                self._compacting = False
+    
+    def _open(self):
+        """Return the append handle, opening it if needed. Caller holds the lock."""
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+            # Terminate a torn record left by a crash so it doesn't merge with the next ID
+            if self._file.tell() > 0:
+                with open(self.path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        self._file.write('\n')
+        return self._file
+    
+    def _close(self):
+        """Fsync and close the append handle. Caller holds the lock."""
+        if self._file is not None:
+            if self._pending:
+                self._fsync()
+            self._file.close()
+            self._file = None
+    
+    def _fsync(self):
+        """Fsync the append handle. Caller holds the lock."""
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_fsync = time.time()
+        self.stats["fsyncs"] += 1
+    
+    def _write_file(self, email_ids):
+        """Atomically write a fresh journal. Caller holds the lock."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(''.join(f"{email_id}\n" for email_id in email_ids))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+    
+    def _ensure_flusher(self):
+        """Start the thread that fsyncs records left pending by a quiet period. Caller holds the lock."""
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        self._flusher = threading.Thread(target=self._flush_loop, name="id-journal-fsync", daemon=True)
+        self._flusher.start()
+    
+    def _flush_loop(self):
+        """Periodically fsync pending records."""
+        while True:
+            time.sleep(self.fsync_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                log.error("Error flushing processed ID journal: %s", e)
@@ -0,0 +1,395 @@
+"""Persistent SQLite work queue for Gmail sync and email processing jobs"""
+
+from collections import deque
+from typing import Callable, Dict, List, Optional
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+try:
+    from . import logs, metrics, storage
+except ImportError:
+    import logs
+    import metrics
+    import storage
+
+log = logs.get_logger("job_queue")
+
+# Number of worker tasks draining the queue
+QUEUE_WORKERS = int(os.environ.get("AUTOMAIL_QUEUE_WORKERS", "2"))
+
+# Maximum number of process jobs a worker claims and runs as one batch
+QUEUE_BATCH_SIZE = int(os.environ.get("AUTOMAIL_QUEUE_BATCH_SIZE", "10"))
+
+# A failed job is retried after BACKOFF_BASE * 2^(attempt - 1) seconds (capped,
+# with jitter) and dead-lettered after MAX_ATTEMPTS attempts
+MAX_ATTEMPTS = int(os.environ.get("AUTOMAIL_JOB_MAX_ATTEMPTS", "5"))
+BACKOFF_BASE_SECONDS = float(os.environ.get("AUTOMAIL_JOB_BACKOFF_BASE", "5"))
+BACKOFF_MAX_SECONDS = float(os.environ.get("AUTOMAIL_JOB_BACKOFF_MAX", "600"))
+
+# A running job not finished within its lease (e.g. the server was killed) is picked up again
+LEASE_SECONDS = float(os.environ.get("AUTOMAIL_JOB_LEASE", "900"))
+
+# Finished jobs are kept this long so re-delivered work is recognised as done
+RETENTION_SECONDS = 7 * 24 * 3600
+PURGE_INTERVAL_SECONDS = 3600
+
+_connection: Optional[sqlite3.Connection] = None
+_lock = threading.RLock()
+_last_purge = 0.0
+
+# Seconds between enqueue and claim of recently claimed jobs, per kind (retries excluded)
+_wait_times: Dict[str, "deque[float]"] = {}
+WAIT_SAMPLES = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    dedupe_key TEXT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    last_error TEXT,
+    group_key TEXT,
+    merged INTEGER NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (kind, dedupe_key) WHERE dedupe_key IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (kind, status, available_at, id);
+"""
+
+# Columns added after the jobs table was first created
+_ADDED_COLUMNS = {
+    "group_key": "TEXT",
+    "merged": "INTEGER NOT NULL DEFAULT 0",
+    "priority": "INTEGER NOT NULL DEFAULT 0",
+}
+
+
+def get_connection() -> sqlite3.Connection:
+    """Return the queue's database connection, creating the schema on first use."""
+    global _connection
+    with _lock:
+        if _connection is None:
+            # Same database as storage.py, on its own connection
+            os.makedirs(os.path.dirname(storage.DB_FILE), exist_ok=True)
+            _connection = sqlite3.connect(storage.DB_FILE, check_same_thread=False, isolation_level=None)
+            _connection.execute("PRAGMA journal_mode=WAL")
+            _connection.execute("PRAGMA synchronous=NORMAL")
+            _connection.executescript(_SCHEMA)
+            existing = {row[1] for row in _connection.execute("PRAGMA table_info(jobs)")}
+            for column, definition in _ADDED_COLUMNS.items():
+                if column not in existing:
+                    _connection.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+            _connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_jobs_group ON jobs (kind, group_key, status)"
+            )
+            _connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_jobs_priority ON jobs (kind, status, priority DESC, available_at)"
+            )
+        return _connection
+
+
+def _row_to_job(row: sqlite3.Row) -> Dict:
+    """Convert a jobs row to a dictionary with the payload decoded."""
+    job = dict(row)
+    job['payload'] = json.loads(job['payload'])
+    return job
+
+
+def enqueue(kind: str, payload: Dict, dedupe_key: Optional[str] = None,
+            max_attempts: int = MAX_ATTEMPTS, priority: int = 0) -> Optional[int]:
+    """
+    Add a job to the queue.
+    
+    Args:
+        kind: Job type, e.g. "sync" or "process"
+        payload: JSON-serializable job data
+        dedupe_key: If set, the job is only added when no job of the same kind
+            with this key exists (pending, running, done or dead)
+        max_attempts: Attempts before the job is dead-lettered
+        priority: Jobs with a higher priority are claimed first
+    
+    Returns:
+        ID of the new job, or None if it was a duplicate
+    """
+    now = time.time()
+    with _lock:
+        cursor = get_connection().execute(
+            """INSERT OR IGNORE INTO jobs
+                   (kind, dedupe_key, payload, max_attempts, priority, available_at, created_at, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (kind, dedupe_key, json.dumps(payload), max_attempts, priority, now, now, now)
+        )
+        return cursor.lastrowid if cursor.rowcount else None
+
+
+def enqueue_coalesced(kind: str, group_key: str, payload: Dict, window: float,
+                      merge: Callable[[Dict, Dict], Dict], max_attempts: int = MAX_ATTEMPTS) -> Dict:
+    """
+    Add a job, or fold it into a job of the same group that hasn't started yet.
+    
+    A new job becomes ready after window seconds, so everything arriving in
+    that window collapses into one run. If the group's pending job exists, its
+    payload is replaced by merge(existing payload, payload) and its merged
+    count is incremented. Together with claim(), which never starts a job while
+    another job of its group is running, this gives at most one run in flight
+    and one queued per group.
+    
+    Args:
+        kind: Job type
+        group_key: Jobs with the same key are coalesced and run one at a time
+        payload: JSON-serializable job data
+        window: Seconds to wait for more jobs before the new job becomes ready
+        merge: Combines the queued payload with the incoming one
+        max_attempts: Attempts before the job is dead-lettered
+    
+    Returns:
+        Dictionary with the job ID, whether it was merged and the merged count
+    """
+    now = time.time()
+    with _lock:
+        conn = get_connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                """SELECT id, payload, merged FROM jobs
+                   WHERE kind = ? AND group_key = ? AND status = 'pending' AND attempts = 0
+                   ORDER BY id LIMIT 1""",
+                (kind, group_key)
+            ).fetchone()
+            if row:
+                job_id, merged = row[0], row[2] + 1
+                conn.execute(
+                    "UPDATE jobs SET payload = ?, merged = ?, updated_at = ? WHERE id = ?",
+                    (json.dumps(merge(json.loads(row[1]), payload)), merged, now, job_id)
+                )
+            else:
+                merged = 0
+                job_id = conn.execute(
+                    """INSERT INTO jobs
+                           (kind, group_key, payload, max_attempts, available_at, created_at, updated_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                    (kind, group_key, json.dumps(payload), max_attempts, now + window, now, now)
+                ).lastrowid
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return {"job_id": job_id, "coalesced": bool(row), "merged": merged}
+
+
+def claim(kind: str, limit: int = 1) -> List[Dict]:
+    """
+    Claim up to limit ready jobs of a kind, highest priority first, then oldest.
+    
+    Claimed jobs are marked running for LEASE_SECONDS; call complete() or
+    fail() for each. Running jobs whose lease expired are claimable again.
+    A job with a group_key is skipped while another job of its group runs.
+    """
+    now = time.time()
+    with _lock:
+        conn = get_connection()
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                """SELECT * FROM jobs
+                   WHERE kind = ? AND status IN ('pending', 'running') AND available_at <= ?
+                     AND (group_key IS NULL OR NOT EXISTS (
+                         SELECT 1 FROM jobs AS other
+                         WHERE other.kind = jobs.kind AND other.group_key = jobs.group_key
+                           AND other.id != jobs.id AND other.status = 'running'
+                           AND other.available_at > ?))
+                   ORDER BY priority DESC, available_at, id LIMIT ?""",
+                (kind, now, now, limit)
+            ).fetchall()
+            # Never start two jobs of one group in the same claim either
+            groups = set()
+            claimed = []
+            for row in rows:
+                if row['group_key'] is not None:
+                    if row['group_key'] in groups:
+                        continue
+                    groups.add(row['group_key'])
+                claimed.append(row)
+            rows = claimed
+            conn.executemany(
+                """UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                       available_at = ?, updated_at = ?
+                   WHERE id = ?""",
+                [(now + LEASE_SECONDS, now, row['id']) for row in rows]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.row_factory = None
+    
+    jobs = [_row_to_job(row) for row in rows]
+    waits = _wait_times.setdefault(kind, deque(maxlen=WAIT_SAMPLES))
+    for job in jobs:
+        job['attempts'] += 1
+        job['status'] = 'running'
+        if job['attempts'] == 1:
+            waits.append(now - job['created_at'])
+    return jobs
+
+
+def release(jobs: List[Dict]):
+    """Return claimed jobs to the queue unchanged, without counting the attempt."""
+    now = time.time()
+    with _lock:
+        get_connection().executemany(
+            """UPDATE jobs SET status = 'pending', attempts = MAX(attempts - 1, 0),
+                   available_at = ?, updated_at = ?
+               WHERE id = ? AND status = 'running'""",
+            [(now, now, job['id']) for job in jobs]
+        )
+
+
+def highest_ready_priority(kind: str) -> Optional[int]:
+    """Return the priority of the most urgent job of a kind that is ready to run, if any."""
+    with _lock:
+        row = get_connection().execute(
+            """SELECT MAX(priority) FROM jobs
+               WHERE kind = ? AND status = 'pending' AND available_at <= ?""",
+            (kind, time.time())
+        ).fetchone()
+    return row[0]
+
+
+def complete(job_id: int):
+    """Mark a job as done."""
+    with _lock:
+        get_connection().execute(
+            "UPDATE jobs SET status = 'done', last_error = NULL, updated_at = ? WHERE id = ?",
+            (time.time(), job_id)
+        )
+
+
+def fail(job: Dict, error: str) -> str:
+    """
+    Record a failed attempt and schedule a retry with exponential backoff.
+    
+    Args:
+        job: Job returned by claim()
+        error: Error message to store with the job
+    
+    Returns:
+        New status: "pending" if it will be retried, "dead" if it ran out of attempts
+    """
+    now = time.time()
+    if job['attempts'] >= job['max_attempts']:
+        status, available_at = 'dead', now
+    else:
+        delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (job['attempts'] - 1))
+        status, available_at = 'pending', now + delay * random.uniform(0.5, 1.0)
+    
+    with _lock:
+        get_connection().execute(
+            """UPDATE jobs SET status = ?, available_at = ?, last_error = ?, updated_at = ?
+               WHERE id = ? AND status = 'running'""",
+            (status, available_at, error, now, job['id'])
+        )
+    return status
+
+
+def retry(job_id: int) -> bool:
+    """Move a dead-lettered job back to the queue. Returns False if it isn't dead."""
+    now = time.time()
+    with _lock:
+        cursor = get_connection().execute(
+            """UPDATE jobs SET status = 'pending', attempts = 0, available_at = ?, updated_at = ?
+               WHERE id = ? AND status = 'dead'""",
+            (now, now, job_id)
+        )
+        return cursor.rowcount > 0
+
+
+def list_jobs(status: str, limit: int = 50) -> List[Dict]:
+    """Return the most recently updated jobs with a status, without payloads."""
+    with _lock:
+        conn = get_connection()
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = conn.execute(
+                """SELECT id, kind, dedupe_key, group_key, priority, status, attempts, max_attempts,
+                          merged, available_at, created_at, updated_at, last_error
+                   FROM jobs WHERE status = ? ORDER BY updated_at DESC LIMIT ?""",
+                (status, limit)
+            ).fetchall()
+        finally:
+            conn.row_factory = None
+    return [dict(row) for row in rows]
+
+
+def purge_finished(older_than: float = RETENTION_SECONDS):
+    """Delete done jobs older than older_than seconds (at most once per PURGE_INTERVAL_SECONDS)."""
+    global _last_purge
+    now = time.time()
+    if now - _last_purge < PURGE_INTERVAL_SECONDS:
+        return
+    _last_purge = now
+    with _lock:
+        cursor = get_connection().execute(
+            "DELETE FROM jobs WHERE status = 'done' AND updated_at < ?",
+            (now - older_than,)
+        )
+    if cursor.rowcount:
+        log.info("Purged %d finished job(s)", cursor.rowcount)
+
+
+def get_stats() -> Dict:
+    """
+    Return queue metrics: job counts by kind and status, ready queue depth,
+    coalesced submissions, the age of the oldest ready job and wait times
+    (enqueue to claim, retries excluded) of recently claimed jobs.
+    """
+    now = time.time()
+    with _lock:
+        conn = get_connection()
+        counts = conn.execute("SELECT kind, status, COUNT(*) FROM jobs GROUP BY kind, status").fetchall()
+        ready = conn.execute(
+            """SELECT kind, priority, COUNT(*) FROM jobs
+               WHERE status = 'pending' AND available_at <= ? GROUP BY kind, priority""",
+            (now,)
+        ).fetchall()
+        merged = conn.execute("SELECT kind, SUM(merged) FROM jobs GROUP BY kind").fetchall()
+        oldest = conn.execute(
+            "SELECT MIN(created_at) FROM jobs WHERE status = 'pending' AND available_at <= ?", (now,)
+        ).fetchone()[0]
+    
+    by_kind: Dict[str, Dict[str, int]] = {}
+    for kind, status, count in counts:
+        by_kind.setdefault(kind, {})[status] = count
+    depth: Dict[str, Dict] = {}
+    for kind, priority, count in ready:
+        entry = depth.setdefault(kind, {"ready": 0, "by_priority": {}})
+        entry["ready"] += count
+        entry["by_priority"][str(priority)] = count
+    waits = {
+        kind: {
+            "samples": len(values),
+            "p50": round(metrics.percentile(list(values), 50), 2),
+            "p95": round(metrics.percentile(list(values), 95), 2),
+            "max": round(max(values), 2) if values else 0,
+        }
+        for kind, values in _wait_times.items()
+    }
+    return {
+        "workers": QUEUE_WORKERS,
+        "jobs": by_kind,
+        "depth": depth,
+        "wait_seconds": waits,
+        "coalesced": {kind: total for kind, total in merged if total},
+        "oldest_ready_age": round(now - oldest, 2) if oldest else 0,
+    }
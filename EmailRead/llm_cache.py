@@ -0,0 +1,185 @@
+"""Persistent cache of Ollama results keyed by a hash of the model, tone and prompt"""
+
+from collections import OrderedDict
+from typing import Dict, Optional
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+try:
+    from . import logs, metrics, storage
+except ImportError:
+    import logs
+    import metrics
+    import storage
+
+log = logs.get_logger("llm_cache")
+
+# Set AUTOMAIL_LLM_CACHE=0 to disable the cache entirely
+CACHE_ENABLED = os.environ.get("AUTOMAIL_LLM_CACHE", "1") != "0"
+CACHE_MAX_ENTRIES = int(os.environ.get("AUTOMAIL_LLM_CACHE_MAX_ENTRIES", "500"))
+CACHE_TTL_SECONDS = float(os.environ.get("AUTOMAIL_LLM_CACHE_TTL", str(7 * 24 * 3600)))
+
+# File to persist cached results across server restarts
+_cache_file = storage.state_path('.llm_cache.json')
+
+# Changes are written to disk by a background timer this many seconds after
+# the first unsaved change, so storing a result never waits on file I/O
+SAVE_DELAY_SECONDS = 2.0
+
+# key -> {"value": result dict, "created_at": timestamp}, least recently used first
+_entries: "OrderedDict[str, Dict]" = OrderedDict()
+_loaded = False
+_dirty = False
+_save_timer: Optional[threading.Timer] = None
+_lock = threading.Lock()
+# Serializes writes so an older snapshot never replaces a newer one
+_save_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+
+def make_key(model: str, tone: Optional[str], prompt: str) -> str:
+    """
+    Build the cache key for a generation.
+    
+    Whitespace in the prompt is normalized so that formatting-only differences
+    (trailing spaces, CRLF line endings, re-wrapped quoted text) still hit.
+    
+    Args:
+        model: Ollama model name
+        tone: Reply tone, or None for tasks without one
+        prompt: Prompt sent to the model
+    
+    Returns:
+        Hex SHA-256 digest identifying the generation
+    """
+    normalized = re.sub(r'\s+', ' ', prompt).strip()
+    payload = json.dumps([model, tone or "", normalized], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _load():
+    """Load cached entries from disk (once)."""
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    if not os.path.exists(_cache_file):
+        return
+    try:
+        with open(_cache_file, 'r') as f:
+            data = json.load(f)
+        for key, entry in data.get('entries', []):
+            _entries[key] = entry
+        log.info("Loaded %d cached LLM result(s)", len(_entries))
+    except Exception as e:
+        log.warning("Error loading LLM cache from disk: %s", e)
+        _entries.clear()
+
+
+def _save(entries: list):
+    """Write a snapshot of the cache to disk atomically."""
+    try:
+        tmp_file = _cache_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({'entries': entries}, f)
+        os.replace(tmp_file, _cache_file)
+    except Exception as e:
+        log.error("Error saving LLM cache to disk: %s", e)
+
+
+def _schedule_save():
+    """Mark the cache changed and start the background save timer (caller holds _lock)."""
+    global _dirty, _save_timer
+    _dirty = True
+    if _save_timer is None:
+        _save_timer = threading.Timer(SAVE_DELAY_SECONDS, flush)
+        _save_timer.daemon = True
+        _save_timer.start()
+
+
+def flush():
+    """Write unsaved changes to disk now."""
+    global _dirty, _save_timer
+    with _save_lock:
+        with _lock:
+            if _save_timer is not None:
+                _save_timer.cancel()
+                _save_timer = None
+            if not _dirty:
+                return
+            _dirty = False
+            entries = list(_entries.items())
+        _save(entries)
+
+
+atexit.register(flush)
+
+
+def get(key: str) -> Optional[Dict]:
+    """Return the cached result for key, or None on a miss or expired entry."""
+    if not CACHE_ENABLED:
+        return None
+    
+    with _lock:
+        _load()
+        entry = _entries.get(key)
+        if entry is None:
+            _stats["misses"] += 1
+            metrics.inc("automail_llm_cache_lookups_total", result="miss")
+            return None
+        
+        if time.time() - entry.get('created_at', 0) > CACHE_TTL_SECONDS:
+            del _entries[key]
+            _stats["expired"] += 1
+            _stats["misses"] += 1
+            metrics.inc("automail_llm_cache_lookups_total", result="expired")
+            return None
+        
+        _entries.move_to_end(key)
+        _stats["hits"] += 1
+        metrics.inc("automail_llm_cache_lookups_total", result="hit")
+        return dict(entry['value'])
+
+
+def put(key: str, value: Dict):
+    """Store a result, evicting the least recently used entries beyond CACHE_MAX_ENTRIES."""
+    if not CACHE_ENABLED:
+        return
+    
+    with _lock:
+        _load()
+        _entries[key] = {"value": value, "created_at": time.time()}
+        _entries.move_to_end(key)
+        _stats["stores"] += 1
+        
+        while len(_entries) > CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats["evictions"] += 1
+        
+        _schedule_save()
+
+
+def clear():
+    """Remove every cached entry."""
+    with _lock:
+        _entries.clear()
+        _schedule_save()
+
+
+def get_stats() -> Dict:
+    """Return hit/miss counters and the current size of the cache."""
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            "enabled": CACHE_ENABLED,
+            "size": len(_entries),
+            "max_entries": CACHE_MAX_ENTRIES,
+            "ttl_seconds": CACHE_TTL_SECONDS,
+            "hit_rate": round(_stats["hits"] / lookups, 3) if lookups else 0,
+            **_stats
+        }
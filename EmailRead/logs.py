@@ -0,0 +1,228 @@
+"""Leveled, structured logging written by a background thread, so a slow log sink never blocks the caller"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Callable, Dict, Iterator, Optional
+import asyncio
+import atexit
+import copy
+import functools
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+
+# Minimum level logged: DEBUG, INFO, WARNING or ERROR
+LOG_LEVEL = os.environ.get("AUTOMAIL_LOG_LEVEL", "INFO").upper()
+
+# "json" writes one JSON object per line, "text" writes readable lines
+LOG_FORMAT = os.environ.get("AUTOMAIL_LOG_FORMAT", "json").lower()
+
+# Also append the log to this file (same format as stdout)
+LOG_FILE = os.environ.get("AUTOMAIL_LOG_FILE") or None
+
+# Hot-path debug messages (extra=HOT) are logged once every this many times per call site
+SAMPLE_EVERY = max(1, int(os.environ.get("AUTOMAIL_LOG_SAMPLE_EVERY", "100")))
+
+# Records waiting for the writer thread; beyond this, new records are dropped
+QUEUE_SIZE = int(os.environ.get("AUTOMAIL_LOG_QUEUE_SIZE", "10000"))
+
+# extra= marker for sampled debug messages
+HOT = {"hot": True}
+
+# Name of the logger every AutoMail logger is a child of
+ROOT_LOGGER = "automail"
+
+# ID of the email the current thread or task is working on
+_email_id: ContextVar[Optional[str]] = ContextVar("automail_email_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed with extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+_INTERNAL_FIELDS = {"hot", "email_id", "sampled"}
+
+_lock = threading.Lock()
+_listener: Optional[QueueListener] = None
+_sample_counts: Dict[tuple, int] = {}
+_stats = {"dropped": 0, "sampled_out": 0}
+
+
+def _extra_fields(record: logging.LogRecord) -> Dict:
+    """Fields passed to a logging call with extra=."""
+    return {key: value for key, value in vars(record).items()
+            if key not in _RECORD_ATTRIBUTES and key not in _INTERNAL_FIELDS}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object: ts, level, logger, msg, email_id, extra fields, exc."""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, 'email_id', None):
+            entry['email_id'] = record.email_id
+        if getattr(record, 'sampled', None):
+            entry['sampled'] = record.sampled
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Formats a record as a readable line, with the email ID and extra fields appended."""
+    
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+    
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if getattr(record, 'email_id', None):
+            fields = {"email_id": record.email_id, **fields}
+        if fields:
+            first, newline, rest = line.partition('\n')
+            line = first + ' ' + ' '.join(f"{key}={value}" for key, value in fields.items()) + newline + rest
+        return line
+
+
+class _ContextFilter(logging.Filter):
+    """Stamps records with the current email ID (unless one was passed with extra=)."""
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, 'email_id', None) is None:
+            record.email_id = _email_id.get()
+        return True
+
+
+class _SamplingFilter(logging.Filter):
+    """Keeps the first and then every SAMPLE_EVERY-th hot debug record of each call site."""
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, 'hot', False) or record.levelno > logging.DEBUG or SAMPLE_EVERY == 1:
+            return True
+        site = (record.pathname, record.lineno)
+        with _lock:
+            count = _sample_counts.get(site, 0)
+            _sample_counts[site] = count + 1
+            if count % SAMPLE_EVERY:
+                _stats['sampled_out'] += 1
+                return False
+        record.sampled = SAMPLE_EVERY
+        return True
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of blocking."""
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments now (they may change later), leave formatting to the writer thread
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with _lock:
+                _stats['dropped'] += 1
+
+
+def _formatter() -> logging.Formatter:
+    """Formatter for LOG_FORMAT."""
+    return TextFormatter() if LOG_FORMAT == "text" else JsonFormatter()
+
+
+def configure():
+    """Install the queue handler and start the writer thread (only once)."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        formatter = _formatter()
+        handlers = [logging.StreamHandler(sys.stdout)]
+        if LOG_FILE:
+            handlers.append(logging.FileHandler(LOG_FILE, encoding='utf-8'))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        
+        records = queue.Queue(maxsize=QUEUE_SIZE)
+        queue_handler = _NonBlockingQueueHandler(records)
+        queue_handler.addFilter(_ContextFilter())
+        queue_handler.addFilter(_SamplingFilter())
+        
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+        root.handlers = [queue_handler]
+        root.propagate = False
+        
+        _listener = QueueListener(records, *handlers)
+        _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown():
+    """Write out the queued records and stop the writer thread."""
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Return the logger of an AutoMail module, configuring logging on first use."""
+    configure()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def current_email_id() -> Optional[str]:
+    """ID of the email the current thread or task is working on, if any."""
+    return _email_id.get()
+
+
+@contextmanager
+def email_context(email_id: Optional[str]) -> Iterator[None]:
+    """
+    Attach email_id to every record logged in the enclosed block.
+    
+    Asyncio tasks created inside the block keep the ID; threads do not (use
+    with_email_id on the function they run).
+    """
+    token = _email_id.set(email_id)
+    try:
+        yield
+    finally:
+        _email_id.reset(token)
+
+
+def with_email_id(func: Callable) -> Callable:
+    """Decorator running func(email, ...) in the email_context of the email's "id" (or "email_id")."""
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(email: Dict, *args, **kwargs):
+            with email_context(email.get('id') or email.get('email_id')):
+                return await func(email, *args, **kwargs)
+        return async_wrapper
+    
+    @functools.wraps(func)
+    def wrapper(email: Dict, *args, **kwargs):
+        with email_context(email.get('id') or email.get('email_id')):
+            return func(email, *args, **kwargs)
+    return wrapper
+
+
+def get_stats() -> Dict:
+    """Return logging counters: records dropped on a full queue, sampled out, and still queued."""
+    with _lock:
+        stats = dict(_stats)
+        stats['queued'] = _listener.queue.qsize() if _listener is not None else 0
+    return stats
@@ -1,22 +1,166 @@
 """This script will read the current email the user just received and make a summary for the user"""
 
-from ollama import generate
-from typing import Dict, List, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import re
+import threading
 import time
 
+try:
+    from . import classifier, content_prep, llm_cache, logs, metrics, model_manager, model_router, storage, threads
+except ImportError:
+    import classifier
+    import content_prep
+    import llm_cache
+    import logs
+    import metrics
+    import model_manager
+    import model_router
+    import storage
+    import threads
 
-def summarize_email(email_data: Dict) -> Dict:
+# Model used when no route in model_router.ROUTES matches
+MODEL_NAME = model_router.DEFAULT_MODEL
+
+# "separate" runs one LLM call for the summary and one for the reply,
+# "combined" produces both from a single structured call.
+GENERATION_MODES = ("separate", "combined")
+DEFAULT_GENERATION_MODE = os.environ.get("AUTOMAIL_GENERATION_MODE", "separate")
+
+# Maximum number of Ollama requests in flight at once, across every batch,
+# queue worker, stream and prefetch in the process
+DEFAULT_MAX_IN_FLIGHT = int(os.environ.get("AUTOMAIL_MAX_IN_FLIGHT", "2"))
+
+# Throughput/latency stats of the most recent process_emails batch
+_last_batch_stats: Dict = {}
+
+log = logs.get_logger("main")
+
+
+class InFlightLimiter:
     """
-    Generate a summary of an email using Ollama.
+    Process-wide bound on concurrent Ollama requests.
+    
+    Works from threads (``with limiter:``) and from any event loop
+    (``async with limiter:``); waiters get freed slots first come, first served.
+    """
+    
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self._active = 0
+        self._lock = threading.Lock()
+        # threading.Event for threads, (loop, future) for coroutines
+        self._waiters: deque = deque()
+    
+    def acquire(self):
+        """Take a slot, blocking the calling thread until one is free."""
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        # release() hands its slot straight to us
+        event.wait()
+    
+    async def acquire_async(self):
+        """Take a slot, waiting without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            # The slot was handed over just before the cancellation
+            if waiter[1].done() and not waiter[1].cancelled():
+                self.release()
+            raise
+    
+    def release(self):
+        """Free a slot, handing it to the longest waiting thread or coroutine."""
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                loop, future = waiter
+                try:
+                    loop.call_soon_threadsafe(self._grant, future)
+                    return
+                except RuntimeError:
+                    # Its event loop is closed
+                    continue
+            self._active -= 1
+    
+    def _grant(self, future: asyncio.Future):
+        """Give a handed-over slot to a waiting coroutine (runs on its loop)."""
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+    
+    def get_stats(self) -> Dict:
+        """Slots in use and requests waiting for one."""
+        with self._lock:
+            return {"limit": self.limit, "in_flight": self._active, "waiting": len(self._waiters)}
+    
+    def __enter__(self):
+        self.acquire()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.release()
+    
+    async def __aenter__(self):
+        await self.acquire_async()
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+
+# Every Ollama generation holds one of these slots while it runs
+ollama_slots = InFlightLimiter(DEFAULT_MAX_IN_FLIGHT)
+
+# Models of the Ollama requests made for the running process_emails batch, one
+# entry per request (fallbacks included); None outside a batch
+_batch_llm_calls: contextvars.ContextVar[Optional[List[str]]] = contextvars.ContextVar(
+    "batch_llm_calls", default=None
+)
+
+
+def _count_llm_call(model: str):
+    """Count an Ollama request towards the process_emails batch it was made for."""
+    calls = _batch_llm_calls.get()
+    if calls is not None:
+        calls.append(model)
+
+
+def _select_email_content(email_data: Dict) -> str:
+    """
+    Pick the content to send to the model for an email.
     
     Args:
-        email_data: Dictionary containing email information (from, subject, body, etc.)
+        email_data: Dictionary containing email information
     
     Returns:
-        Dictionary with summary and processing time
+        The selected content, or an empty string if the email is too short to process
     """
-    from_email = email_data.get('from', 'Unknown')
-    subject = email_data.get('subject', 'No Subject')
     body = email_data.get('body', '')
     snippet = email_data.get('snippet', '')
     
@@ -24,155 +168,719 @@ def summarize_email(email_data: Dict) -> Dict:
     # Gmail snippets are often more reliable for short emails
     # Prefer body if it has substantial content (>30 chars), otherwise use snippet
     if body and len(body.strip()) > 30:
-        email_content = body
-        print(f"   📝 Using email body ({len(body)} chars)")
+        log.debug("Using email body (%d chars)", len(body), extra=logs.HOT)
+        return body
     elif snippet and len(snippet.strip()) > 0:
-        email_content = snippet
-        print(f"   📝 Using email snippet ({len(snippet)} chars) - body was too short or empty")
+        log.debug("Using email snippet (%d chars), body was too short or empty", len(snippet), extra=logs.HOT)
+        return snippet
     elif body and len(body.strip()) > 0:
         # Use body even if short (at least it's something)
-        email_content = body
-        print(f"   📝 Using short email body ({len(body)} chars)")
-    else:
-        # Last resort: try to combine or use whatever we have
-        email_content = (body + " " + snippet).strip() if (body and snippet) else (body or snippet or "")
-        
-        if len(email_content.strip()) < 3:
-            print(f"   ⚠️  Warning: Email content is too short. Body: {len(body)} chars, Snippet: {len(snippet)} chars")
-            return {
-                "summary": "Unable to generate summary: email content is too short or empty.",
-                "processing_time": 0,
-                "status": "error",
-                "error": "Email content too short"
-            }
-        else:
-            print(f"   📝 Using combined/fallback content ({len(email_content)} chars)")
+        log.debug("Using short email body (%d chars)", len(body), extra=logs.HOT)
+        return body
+    
+    # Last resort: try to combine or use whatever we have
+    email_content = (body + " " + snippet).strip() if (body and snippet) else (body or snippet or "")
     
-    prompt = f"""Summarize this email in 2-3 sentences. Focus on the main request, action items, or important information.
+    if len(email_content.strip()) < 3:
+        log.warning("Email content is too short: body %d chars, snippet %d chars", len(body), len(snippet))
+        return ""
+    
+    log.debug("Using combined body and snippet (%d chars)", len(email_content), extra=logs.HOT)
+    return email_content
+
+
+_TOO_SHORT_MESSAGES = {
+    "summary": "Unable to generate summary: email content is too short or empty.",
+    "draft_reply": "Unable to generate reply: email content is too short or empty.",
+}
+
+
+@metrics.timed("automail_prompt_build_seconds", step="clean")
+def _prepare_content(email_data: Dict) -> Optional[Dict]:
+    """
+    Select an email's content and fit it to the token budget (see content_prep.prepare).
+    
+    Returns:
+        The prepared content, or None if the email is too short to process
+    """
+    email_content = _select_email_content(email_data)
+    if not email_content:
+        return None
+    
+    prepared = content_prep.prepare(email_content)
+    if prepared['strategy'] != content_prep.STRATEGY_FULL or prepared['tokens'] < prepared['original_tokens']:
+        log.debug("Content reduced from ~%d to ~%d tokens", prepared['original_tokens'], prepared['tokens'],
+                  extra={"strategy": prepared['strategy']})
+    return prepared
+
 
-From: {from_email}
-Subject: {subject}
+def _with_strategy(result: Dict, prepared: Dict) -> Dict:
+    """Record how the email content was prepared in a generation result."""
+    result['content_strategy'] = prepared['strategy']
+    result['content_tokens'] = prepared['tokens']
+    if prepared['chunks']:
+        result['content_chunks'] = len(prepared['chunks'])
+    return result
+
+
+@metrics.timed("automail_prompt_build_seconds", step="summary")
+def _build_summary_prompt(email_data: Dict, email_content: str) -> str:
+    """Build the summary prompt."""
+    return f"""Summarize this email in 2-3 sentences. Focus on the main request, action items, or important information.
+
+From: {email_data.get('from', 'Unknown')}
+Subject: {email_data.get('subject', 'No Subject')}
 Content: {email_content}
 
 Summary:"""
-    
-    try:
-        start_time = time.time()
-        response = generate(model="llama3.2:latest", prompt=prompt)
-        end_time = time.time()
-        
-        # Ollama returns a dict, access 'response' key
-        summary = response.get('response', '').strip()
-        processing_time = end_time - start_time
-        
+
+
+@metrics.timed("automail_prompt_build_seconds", step="thread_update")
+def _build_thread_update_prompt(email_data: Dict, previous_summary: str, email_content: str) -> str:
+    """Build the prompt folding a new message into its thread's rolling summary."""
+    return f"""Here is a summary of an email thread so far, followed by a new message in the thread. Write an updated 2-3 sentence summary of the whole thread. Focus on the main request, action items, or important information, and on what the new message changes.
+
+Thread summary so far: {previous_summary}
+
+New message:
+From: {email_data.get('from', 'Unknown')}
+Subject: {email_data.get('subject', 'No Subject')}
+Content: {email_content}
+
+Updated summary:"""
+
+
+@metrics.timed("automail_prompt_build_seconds", step="chunk")
+def _build_chunk_prompt(email_data: Dict, chunk: str, index: int, count: int) -> str:
+    """Build the prompt taking notes on one chunk of a long email (map step)."""
+    return f"""This is part {index} of {count} of a long email. List the key points, requests and action items in this part in 2-4 short sentences.
+
+From: {email_data.get('from', 'Unknown')}
+Subject: {email_data.get('subject', 'No Subject')}
+Content (part {index} of {count}): {chunk}
+
+Key points:"""
+
+
+@metrics.timed("automail_prompt_build_seconds", step="reduce")
+def _build_reduce_prompt(email_data: Dict, notes: List[str]) -> str:
+    """Build the prompt summarizing the notes on every chunk of a long email (reduce step)."""
+    joined = "\n\n".join(f"Part {i}: {note}" for i, note in enumerate(notes, 1))
+    return f"""These are notes on consecutive parts of one long email. Summarize the whole email in 2-3 sentences. Focus on the main request, action items, or important information.
+
+From: {email_data.get('from', 'Unknown')}
+Subject: {email_data.get('subject', 'No Subject')}
+Notes:
+{joined}
+
+Summary:"""
+
+
+@metrics.timed("automail_prompt_build_seconds", step="reply")
+def _build_reply_prompt(email_data: Dict, tone: str, email_content: str) -> str:
+    """Build the draft reply prompt."""
+    return f"""Write a concise, {tone} reply to this email. Keep it brief and to the point.
+
+Original Email:
+From: {email_data.get('from', 'Unknown')}
+Subject: {email_data.get('subject', 'No Subject')}
+Content: {email_content}
+
+Draft Reply:"""
+
+
+@metrics.timed("automail_prompt_build_seconds", step="combined")
+def _build_combined_prompt(email_data: Dict, tone: str, email_content: str) -> str:
+    """Build the combined summary + reply prompt."""
+    return f"""Read this email and respond with a JSON object with exactly two keys:
+"summary": a 2-3 sentence summary focusing on the main request, action items, or important information.
+"draft_reply": a concise, {tone} reply to the email. Keep it brief and to the point.
+
+From: {email_data.get('from', 'Unknown')}
+Subject: {email_data.get('subject', 'No Subject')}
+Content: {email_content}
+
+JSON:"""
+
+
+def _too_short_result(*keys: str) -> Dict:
+    """Result returned when an email has no usable content."""
+    result = {key: _TOO_SHORT_MESSAGES[key] for key in keys}
+    result.update({
+        "processing_time": 0,
+        "status": "error",
+        "error": "Email content too short"
+    })
+    return result
+
+
+def _too_long_result() -> Dict:
+    """Combined result for emails that need a map-reduce summary, which a single call can't do."""
+    return {
+        "summary": None,
+        "draft_reply": None,
+        "processing_time": 0,
+        "status": "too_long",
+        "error": "Email too long for a combined call"
+    }
+
+
+def _error_result(error: Exception, *keys: str) -> Dict:
+    """Result returned when the Ollama call fails."""
+    result = {key: None for key in keys}
+    result.update({
+        "processing_time": 0,
+        "status": "error",
+        "error": str(error)
+    })
+    return result
+
+
+def _text_result(key: str, response: Dict, processing_time: float,
+                 time_to_first_token: Optional[float] = None) -> Dict:
+    """Result for a successful single-output generation."""
+    # Ollama returns a dict, access 'response' key
+    result = {
+        key: response.get('response', '').strip(),
+        "processing_time": round(processing_time, 2),
+        "status": "success"
+    }
+    if time_to_first_token is not None:
+        result['time_to_first_token'] = round(time_to_first_token, 2)
+    if response.get('model'):
+        result['model'] = response['model']
+    return result
+
+
+def _combined_result(response: Dict, processing_time: float,
+                     time_to_first_token: Optional[float] = None) -> Dict:
+    """Result for a combined generation, with status "parse_error" if it can't be split."""
+    parsed = _parse_combined_response(response.get('response', ''))
+    if parsed is None:
         return {
-            "summary": summary,
+            "summary": None,
+            "draft_reply": None,
             "processing_time": round(processing_time, 2),
-            "status": "success"
+            "status": "parse_error",
+            "error": "Could not parse combined summary/reply output"
         }
+    
+    summary, draft_reply = parsed
+    result = {
+        "summary": summary,
+        "draft_reply": draft_reply,
+        "processing_time": round(processing_time, 2),
+        "status": "success"
+    }
+    if time_to_first_token is not None:
+        result['time_to_first_token'] = round(time_to_first_token, 2)
+    if response.get('model'):
+        result['model'] = response['model']
+    return result
+
+
+def _route(email_data: Dict, task: str, prepared: Dict) -> Dict:
+    """Pick the models for a task on an email (see model_router.route)."""
+    return model_router.route(task, prepared['tokens'], email_data.get('priority') or 0)
+
+
+def _generate(prompt: str, route: Optional[Dict] = None, **options) -> Dict:
+    """
+    Run a non-streamed generation on a route's models, falling back to the
+    next model when one fails or times out.
+    
+    Args:
+        prompt: Prompt to send
+        route: Result of model_router.route (default: the default model)
+        **options: Extra arguments for generate (e.g. format='json')
+    
+    Returns:
+        Response of the first model that answered, with its name under "model"
+    """
+    route = route or model_router.route("summary")
+    last_error: Optional[Exception] = None
+    for attempt, model in enumerate(route['models']):
+        try:
+            with ollama_slots:
+                _count_llm_call(model)
+                start_time = time.time()
+                response = dict(model_manager.generate(model, prompt, timeout=route['timeout'], **options))
+        except Exception as e:
+            model_router.record_failure(model, e)
+            last_error = e
+            if attempt + 1 < len(route['models']):
+                log.warning("%s failed (%s), falling back to %s", model, e, route['models'][attempt + 1])
+            continue
+        model_router.record_success(model, response, time.time() - start_time, fallback=attempt > 0)
+        response['model'] = model
+        return response
+    raise last_error
+
+
+async def _stream_generate_async(prompt: str, on_token: Optional[Callable[[str], None]] = None,
+                                 route: Optional[Dict] = None, **options) -> Tuple[Dict, Optional[float]]:
+    """
+    Run a generation with Ollama's stream API on a route's models.
+    
+    A model that fails or times out before producing any text is replaced by
+    the next model of the route; once text has been streamed, errors are raised.
+    
+    Args:
+        prompt: Prompt to send
+        on_token: Called with each piece of text as it is generated
+        route: Result of model_router.route (default: the default model)
+        **options: Extra arguments for generate (e.g. format='json')
+    
+    Returns:
+        Tuple of (response dict like a non-streamed generate, seconds until the
+        first token arrived or None if nothing was generated)
+    """
+    route = route or model_router.route("summary")
+    start_time = time.time()
+    last_error: Optional[Exception] = None
+    streamed = []
+    
+    def forward(token: str):
+        streamed.append(token)
+        if on_token is not None:
+            on_token(token)
+    
+    for attempt, model in enumerate(route['models']):
+        try:
+            async with ollama_slots:
+                _count_llm_call(model)
+                attempt_start = time.time()
+                final, time_to_first_token = await asyncio.wait_for(
+                    _stream_model_async(model, prompt, forward, **options), route['timeout']
+                )
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                e = TimeoutError(f"{model} timed out after {route['timeout']:g}s")
+            model_router.record_failure(model, e)
+            last_error = e
+            if streamed:
+                raise e
+            if attempt + 1 < len(route['models']):
+                log.warning("%s failed (%s), falling back to %s", model, e, route['models'][attempt + 1])
+            continue
+        model_router.record_success(model, final, time.time() - attempt_start, fallback=attempt > 0)
+        final['model'] = model
+        if time_to_first_token is not None:
+            time_to_first_token += attempt_start - start_time
+        return final, time_to_first_token
+    raise last_error
+
+
+async def _stream_model_async(model: str, prompt: str, on_token: Optional[Callable[[str], None]] = None,
+                              **options) -> Tuple[Dict, Optional[float]]:
+    """Stream one generation from one model; returns like _stream_generate_async."""
+    start_time = time.time()
+    time_to_first_token = None
+    parts = []
+    final: Dict = {}
+    
+    stream = await model_manager.get_async_client().generate(
+        model=model, prompt=prompt, stream=True, keep_alive=model_manager.KEEP_ALIVE, **options
+    )
+    async for chunk in stream:
+        token = chunk.get('response', '')
+        if token:
+            if time_to_first_token is None:
+                time_to_first_token = time.time() - start_time
+            parts.append(token)
+            if on_token is not None:
+                on_token(token)
+        if chunk.get('done'):
+            final = dict(chunk)
+    
+    final['response'] = ''.join(parts)
+    model_manager.record_call(final, time.time() - start_time)
+    return final, time_to_first_token
+
+
+def _cache_lookup(prompt: str, tone: Optional[str], use_cache: bool,
+                  model: str = MODEL_NAME) -> Tuple[Optional[str], Optional[Dict]]:
+    """Return (cache key, cached result) for a prompt; both are None when caching is off."""
+    if not use_cache:
+        return None, None
+    key = llm_cache.make_key(model, tone, prompt)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        log.debug("Using cached result", extra=logs.HOT)
+        cached['processing_time'] = 0
+        if 'time_to_first_token' in cached:
+            cached['time_to_first_token'] = 0
+        cached['cached'] = True
+    return key, cached
+
+
+def _cache_store(key: Optional[str], result: Dict) -> Dict:
+    """Cache a successful result under key and return it."""
+    if key is not None and result.get('status') == 'success':
+        llm_cache.put(key, result)
+    return result
+
+
+@logs.with_email_id
+def summarize_email(email_data: Dict, use_cache: bool = True) -> Dict:
+    """
+    Generate a summary of an email using Ollama.
+    
+    In thread mode (threads.THREAD_SUMMARIES) a new message in a known thread
+    is summarized as an update of the thread's rolling summary, from that
+    summary and the message's own content only.
+    
+    Args:
+        email_data: Dictionary containing email information (from, subject, body, etc.)
+        use_cache: Whether to reuse/store the result in the LLM cache (default: True)
+    
+    Returns:
+        Dictionary with summary, processing time and content_strategy
+        ("full", "truncated" or "map_reduce", see content_prep.prepare)
+    """
+    thread_id = threads.thread_key(email_data)
+    if thread_id is None:
+        return _summarize_email(email_data, use_cache)
+    
+    with threads.lock(thread_id):
+        thread = storage.get_thread(thread_id)
+        previous = threads.previous_summary(thread, email_data)
+        result = _summarize_email(email_data, use_cache, previous)
+        threads.record(thread_id, thread, email_data, result)
+    return _with_thread(result, thread, previous)
+
+
+def _with_thread(result: Dict, thread: Optional[Dict], previous: Optional[str]) -> Dict:
+    """Mark a summary that updated its thread's rolling summary."""
+    if previous is None or result.get('status') != 'success':
+        return result
+    return {**result, "thread_summary": True, "thread_messages": len(thread['message_ids'])}
+
+
+def _prepare_summary(email_data: Dict, previous: Optional[str]) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Prepare the content and build the prompt of a summary.
+    
+    Returns:
+        Tuple of (prepared content, prompt), both None if the email is too short
+    """
+    prepared = _prepare_content(email_data)
+    if prepared is None:
+        return None, None
+    if previous is None:
+        return prepared, _build_summary_prompt(email_data, prepared['content'])
+    
+    # A thread update only reads the new message, so one call always suffices
+    if prepared['chunks']:
+        prepared = {**prepared, "chunks": [], "strategy": content_prep.STRATEGY_TRUNCATED}
+    return prepared, _build_thread_update_prompt(email_data, previous, prepared['content'])
+
+
+def _summarize_email(email_data: Dict, use_cache: bool = True, previous: Optional[str] = None) -> Dict:
+    """Summarize an email, or update its thread's previous summary with it."""
+    prepared, prompt = _prepare_summary(email_data, previous)
+    if prepared is None:
+        return _too_short_result("summary")
+    
+    route = _route(email_data, "summary", prepared)
+    cache_key, cached = _cache_lookup(prompt, _summary_cache_tone(prepared), use_cache, route['models'][0])
+    if cached is not None:
+        return cached
+    
+    try:
+        start_time = time.time()
+        if prepared['chunks']:
+            response = _map_reduce_generate(email_data, prepared['chunks'], route)
+        else:
+            response = _generate(prompt, route)
+        result = _text_result("summary", response, time.time() - start_time)
+        return _cache_store(cache_key, _with_strategy(result, prepared))
     except Exception as e:
-        return {
-            "summary": None,
-            "processing_time": 0,
-            "status": "error",
-            "error": str(e)
-        }
+        return _error_result(e, "summary")
+
+
+def _summary_cache_tone(prepared: Dict) -> Optional[str]:
+    """
+    Cache "tone" of a summary.
+    
+    The prompt only holds the TOKEN_BUDGET-truncated content, so map-reduce
+    summaries add a hash of every chunk: two long emails that share their
+    beginning don't get the same summary. This also keeps them apart from
+    single-call summaries of the same text.
+    """
+    if not prepared['chunks']:
+        return None
+    digest = hashlib.sha256("\x00".join(prepared['chunks']).encode('utf-8')).hexdigest()
+    return f"{content_prep.STRATEGY_MAP_REDUCE}:{digest}"
+
+
+def _map_reduce_generate(email_data: Dict, chunks: List[str], route: Optional[Dict] = None) -> Dict:
+    """Summarize a long email by taking notes on each chunk, then summarizing the notes."""
+    notes = []
+    for index, chunk in enumerate(chunks, 1):
+        log.debug("Summarizing part %d/%d", index, len(chunks))
+        response = _generate(_build_chunk_prompt(email_data, chunk, index, len(chunks)), route)
+        notes.append(response.get('response', '').strip())
+    return _generate(_build_reduce_prompt(email_data, notes), route)
+
+
+@logs.with_email_id
+async def summarize_email_async(email_data: Dict, use_cache: bool = True,
+                                on_token: Optional[Callable[[str], None]] = None) -> Dict:
+    """
+    Async counterpart of summarize_email; does not block the event loop.
+    
+    The summary is streamed: on_token, if given, receives the text as it is
+    generated (a cached summary arrives as a single token), and the result
+    includes time_to_first_token.
+    """
+    thread_id = threads.thread_key(email_data)
+    if thread_id is None:
+        return await _summarize_email_async(email_data, use_cache, on_token)
+    
+    async with threads.async_lock(thread_id):
+        thread = await asyncio.to_thread(storage.get_thread, thread_id)
+        previous = threads.previous_summary(thread, email_data)
+        result = await _summarize_email_async(email_data, use_cache, on_token, previous)
+        await asyncio.to_thread(threads.record, thread_id, thread, email_data, result)
+    return _with_thread(result, thread, previous)
 
 
-def generate_draft_reply(email_data: Dict, tone: str = "professional") -> Dict:
+async def _summarize_email_async(email_data: Dict, use_cache: bool = True,
+                                 on_token: Optional[Callable[[str], None]] = None,
+                                 previous: Optional[str] = None) -> Dict:
+    """Async counterpart of _summarize_email."""
+    prepared, prompt = _prepare_summary(email_data, previous)
+    if prepared is None:
+        return _too_short_result("summary")
+    
+    route = _route(email_data, "summary", prepared)
+    cache_key, cached = _cache_lookup(prompt, _summary_cache_tone(prepared), use_cache, route['models'][0])
+    if cached is not None:
+        if on_token is not None:
+            on_token(cached.get('summary') or '')
+        return cached
+    
+    try:
+        start_time = time.time()
+        if prepared['chunks']:
+            response, ttft = await _map_reduce_generate_async(email_data, prepared['chunks'], on_token, route)
+        else:
+            response, ttft = await _stream_generate_async(prompt, on_token, route)
+        result = _text_result("summary", response, time.time() - start_time, ttft)
+        return _cache_store(cache_key, _with_strategy(result, prepared))
+    except Exception as e:
+        return _error_result(e, "summary")
+
+
+async def _map_reduce_generate_async(email_data: Dict, chunks: List[str],
+                                     on_token: Optional[Callable[[str], None]] = None,
+                                     route: Optional[Dict] = None) -> Tuple[Dict, Optional[float]]:
+    """
+    Async counterpart of _map_reduce_generate.
+    
+    Chunks are summarized one after the other so an email holds a single
+    Ollama slot. Only the final summary is streamed; its time to first
+    token is measured from the start of the first chunk.
+    """
+    start_time = time.time()
+    notes = []
+    for index, chunk in enumerate(chunks, 1):
+        log.debug("Summarizing part %d/%d", index, len(chunks))
+        response, _ = await _stream_generate_async(
+            _build_chunk_prompt(email_data, chunk, index, len(chunks)), route=route
+        )
+        notes.append(response.get('response', '').strip())
+    
+    reduce_start = time.time()
+    response, ttft = await _stream_generate_async(_build_reduce_prompt(email_data, notes), on_token, route)
+    if ttft is not None:
+        ttft += reduce_start - start_time
+    return response, ttft
+
+
+@logs.with_email_id
+def generate_draft_reply(email_data: Dict, tone: str = "professional", use_cache: bool = True) -> Dict:
     """
     Generate a draft reply to an email using Ollama.
     
     Args:
         email_data: Dictionary containing email information
         tone: Tone of the reply (professional, casual, friendly)
+        use_cache: Whether to reuse/store the result in the LLM cache (default: True)
     
     Returns:
         Dictionary with draft reply and processing time
     """
-    from_email = email_data.get('from', 'Unknown')
-    subject = email_data.get('subject', 'No Subject')
-    body = email_data.get('body', '')
-    snippet = email_data.get('snippet', '')
+    prepared = _prepare_content(email_data)
+    if prepared is None:
+        return _too_short_result("draft_reply")
     
-    # Use body if available, otherwise use snippet
-    # Gmail snippets are often more reliable for short emails
-    # Prefer body if it has substantial content (>30 chars), otherwise use snippet
-    if body and len(body.strip()) > 30:
-        email_content = body
-        print(f"   📝 Using email body ({len(body)} chars)")
-    elif snippet and len(snippet.strip()) > 0:
-        email_content = snippet
-        print(f"   📝 Using email snippet ({len(snippet)} chars) - body was too short or empty")
-    elif body and len(body.strip()) > 0:
-        # Use body even if short (at least it's something)
-        email_content = body
-        print(f"   📝 Using short email body ({len(body)} chars)")
-    else:
-        # Last resort: try to combine or use whatever we have
-        email_content = (body + " " + snippet).strip() if (body and snippet) else (body or snippet or "")
-        
-        if len(email_content.strip()) < 3:
-            print(f"   ⚠️  Warning: Email content is too short. Body: {len(body)} chars, Snippet: {len(snippet)} chars")
-            return {
-                "draft_reply": "Unable to generate reply: email content is too short or empty.",
-                "processing_time": 0,
-                "status": "error",
-                "error": "Email content too short"
-            }
-        else:
-            print(f"   📝 Using combined/fallback content ({len(email_content)} chars)")
+    # Long emails are truncated to the budget here; only summaries use map-reduce
+    prompt = _build_reply_prompt(email_data, tone, prepared['content'])
+    route = _route(email_data, "reply", prepared)
+    cache_key, cached = _cache_lookup(prompt, tone, use_cache, route['models'][0])
+    if cached is not None:
+        return cached
     
-    prompt = f"""Write a concise, {tone} reply to this email. Keep it brief and to the point.
+    try:
+        start_time = time.time()
+        response = _generate(prompt, route)
+        result = _text_result("draft_reply", response, time.time() - start_time)
+        return _cache_store(cache_key, _with_strategy(result, prepared))
+    except Exception as e:
+        return _error_result(e, "draft_reply")
 
-Original Email:
-From: {from_email}
-Subject: {subject}
-Content: {email_content}
 
-Draft Reply:"""
+@logs.with_email_id
+async def generate_draft_reply_async(email_data: Dict, tone: str = "professional",
+                                     use_cache: bool = True,
+                                     on_token: Optional[Callable[[str], None]] = None) -> Dict:
+    """Async counterpart of generate_draft_reply; streamed like summarize_email_async."""
+    prepared = _prepare_content(email_data)
+    if prepared is None:
+        return _too_short_result("draft_reply")
+    
+    prompt = _build_reply_prompt(email_data, tone, prepared['content'])
+    route = _route(email_data, "reply", prepared)
+    cache_key, cached = _cache_lookup(prompt, tone, use_cache, route['models'][0])
+    if cached is not None:
+        if on_token is not None:
+            on_token(cached.get('draft_reply') or '')
+        return cached
     
     try:
         start_time = time.time()
-        response = generate(model="llama3.2:latest", prompt=prompt)
-        end_time = time.time()
-        
-        # Ollama returns a dict, access 'response' key
-        draft_reply = response.get('response', '').strip()
-        processing_time = end_time - start_time
-        
-        return {
-            "draft_reply": draft_reply,
-            "processing_time": round(processing_time, 2),
-            "status": "success"
-        }
+        response, ttft = await _stream_generate_async(prompt, on_token, route)
+        result = _text_result("draft_reply", response, time.time() - start_time, ttft)
+        return _cache_store(cache_key, _with_strategy(result, prepared))
     except Exception as e:
-        return {
-            "draft_reply": None,
-            "processing_time": 0,
-            "status": "error",
-            "error": str(e)
-        }
+        return _error_result(e, "draft_reply")
 
 
-def process_email(email_data: Dict, generate_reply: bool = True) -> Dict:
+def _parse_combined_response(text: str) -> Optional[Tuple[str, str]]:
     """
-    Process an email: generate summary and optionally a draft reply.
+    Extract the summary and draft reply from a combined generation.
+    
+    Accepts a JSON object (optionally wrapped in extra text or code fences)
+    and falls back to "Summary:" / "Draft Reply:" section headings.
+    
+    Args:
+        text: Raw model output
+    
+    Returns:
+        Tuple of (summary, draft_reply), or None if the output could not be parsed
+    """
+    if not text:
+        return None
+    
+    candidates = [text.strip()]
+    start, end = text.find('{'), text.rfind('}')
+    if start != -1 and end > start:
+        candidates.append(text[start:end + 1])
+    
+    for candidate in candidates:
+        try:
+            data = json.loads(candidate)
+        except ValueError:
+            continue
+        if not isinstance(data, dict):
+            continue
+        summary = data.get('summary')
+        reply = data.get('draft_reply') or data.get('reply') or data.get('draft')
+        if isinstance(summary, str) and isinstance(reply, str) and summary.strip() and reply.strip():
+            return summary.strip(), reply.strip()
+    
+    match = re.search(
+        r'summary\s*:\s*(.+?)\s*(?:draft\s*reply|reply)\s*:\s*(.+)',
+        text,
+        re.IGNORECASE | re.DOTALL
+    )
+    if match:
+        summary = match.group(1).strip().strip('*').strip()
+        reply = match.group(2).strip().strip('*').strip()
+        if summary and reply:
+            return summary, reply
+    
+    return None
+
+
+@logs.with_email_id
+def generate_summary_and_reply(email_data: Dict, tone: str = "professional", use_cache: bool = True) -> Dict:
+    """
+    Generate a summary and a draft reply from a single Ollama call.
     
     Args:
         email_data: Dictionary containing email information
-        generate_reply: Whether to generate a draft reply (default: True)
+        tone: Tone of the reply (professional, casual, friendly)
+        use_cache: Whether to reuse/store the result in the LLM cache (default: True)
     
     Returns:
-        Dictionary with processed email data including summary and reply
+        Dictionary with summary, draft reply and processing time.
+        Status is "parse_error" when the model output could not be split
+        into a summary and a reply, and "too_long" (without calling the
+        model) when the email needs a map-reduce summary.
     """
-    print(f"\n📧 Processing email: {email_data.get('subject', 'No Subject')}")
-    print(f"   From: {email_data.get('from', 'Unknown')}")
+    prepared = _prepare_content(email_data)
+    if prepared is None:
+        return _too_short_result("summary", "draft_reply")
+    if prepared['chunks']:
+        return _too_long_result()
     
-    # Generate summary
-    print("   Generating summary...")
-    summary_result = summarize_email(email_data)
+    # Long emails are truncated to the budget here; only summaries use map-reduce
+    prompt = _build_combined_prompt(email_data, tone, prepared['content'])
+    route = _route(email_data, "combined", prepared)
+    cache_key, cached = _cache_lookup(prompt, tone, use_cache, route['models'][0])
+    if cached is not None:
+        return cached
     
+    try:
+        start_time = time.time()
+        response = _generate(prompt, route, format='json')
+        result = _combined_result(response, time.time() - start_time)
+        return _cache_store(cache_key, _with_strategy(result, prepared))
+    except Exception as e:
+        return _error_result(e, "summary", "draft_reply")
+
+
+@logs.with_email_id
+async def generate_summary_and_reply_async(email_data: Dict, tone: str = "professional",
+                                           use_cache: bool = True) -> Dict:
+    """Async counterpart of generate_summary_and_reply; does not block the event loop."""
+    prepared = _prepare_content(email_data)
+    if prepared is None:
+        return _too_short_result("summary", "draft_reply")
+    if prepared['chunks']:
+        return _too_long_result()
+    
+    prompt = _build_combined_prompt(email_data, tone, prepared['content'])
+    route = _route(email_data, "combined", prepared)
+    cache_key, cached = _cache_lookup(prompt, tone, use_cache, route['models'][0])
+    if cached is not None:
+        return cached
+    
+    try:
+        # Streamed only to measure time to first token; partial JSON isn't useful to show
+        start_time = time.time()
+        response, ttft = await _stream_generate_async(prompt, route=route, format='json')
+        result = _combined_result(response, time.time() - start_time, ttft)
+        return _cache_store(cache_key, _with_strategy(result, prepared))
+    except Exception as e:
+        return _error_result(e, "summary", "draft_reply")
+
+
+def _build_processed_result(email_data: Dict, summary_result: Dict, reply_result: Optional[Dict]) -> Dict:
+    """
+    Assemble the stored result for an email from its generation results.
+    
+    Args:
+        email_data: Dictionary containing email information
+        summary_result: Result of summarize_email (or the summary half of a combined call)
+        reply_result: Result of generate_draft_reply, or None if no reply was requested
+    
+    Returns:
+        Dictionary with processed email data including summary and reply
+    """
     result = {
         "email_id": email_data.get('id'),
         "from": email_data.get('from'),
@@ -183,56 +891,506 @@ def process_email(email_data: Dict, generate_reply: bool = True) -> Dict:
         "summary": summary_result.get('summary'),
         "summary_time": summary_result.get('processing_time'),
     }
+    if summary_result.get('time_to_first_token') is not None:
+        result['summary_ttft'] = summary_result.get('time_to_first_token')
+    if summary_result.get('model'):
+        result['summary_model'] = summary_result['model']
+    if email_data.get('threadId'):
+        result['thread_id'] = email_data.get('threadId')
+    for key in ('content_strategy', 'content_tokens', 'content_chunks', 'thread_summary', 'thread_messages'):
+        if summary_result.get(key) is not None:
+            result[key] = summary_result[key]
     
     if summary_result.get('status') == 'error':
         result['error'] = summary_result.get('error')
-        print(f"   ❌ Error generating summary: {summary_result.get('error')}")
+        log.error("Error generating summary: %s", summary_result.get('error'))
     else:
-        summary_text = summary_result.get('summary', '')
-        print(f"   ✅ Summary generated ({summary_result.get('processing_time')}s)")
-        print(f"   Summary:\n   {summary_text}")
+        log.info("Summary generated in %ss", summary_result.get('processing_time'))
+        log.debug("Summary text", extra={**logs.HOT, "summary": summary_result.get('summary', '')})
     
-    # Generate draft reply if requested
-    if generate_reply:
-        print("   Generating draft reply...")
-        reply_result = generate_draft_reply(email_data)
-        
+    if reply_result is not None:
         result['draft_reply'] = reply_result.get('draft_reply')
         result['reply_time'] = reply_result.get('processing_time')
+        if reply_result.get('time_to_first_token') is not None:
+            result['reply_ttft'] = reply_result.get('time_to_first_token')
+        if reply_result.get('model'):
+            result['reply_model'] = reply_result['model']
         
         if reply_result.get('status') == 'error':
             result['reply_error'] = reply_result.get('error')
-            print(f"   ❌ Error generating reply: {reply_result.get('error')}")
+            log.error("Error generating reply: %s", reply_result.get('error'))
         else:
-            reply_text = reply_result.get('draft_reply', '')
-            print(f"   ✅ Draft reply generated ({reply_result.get('processing_time')}s)")
-            print(f"   Draft Reply:\n   {reply_text}")
+            log.info("Draft reply generated in %ss", reply_result.get('processing_time'))
+            log.debug("Draft reply text", extra={**logs.HOT, "draft_reply": reply_result.get('draft_reply', '')})
+    
+    return result
+
+
+def _split_combined_result(combined_result: Dict) -> Tuple[Dict, Dict]:
+    """Split a combined generation result into summary and reply results."""
+    status = combined_result.get('status')
+    summary_result = {
+        "summary": combined_result.get('summary'),
+        "processing_time": combined_result.get('processing_time'),
+        "time_to_first_token": combined_result.get('time_to_first_token'),
+        "model": combined_result.get('model'),
+        "content_strategy": combined_result.get('content_strategy'),
+        "content_tokens": combined_result.get('content_tokens'),
+        "status": status
+    }
+    # The whole call is attributed to the summary so summary_time + reply_time
+    # still adds up to the total inference time.
+    reply_result = {
+        "draft_reply": combined_result.get('draft_reply'),
+        "processing_time": 0,
+        "status": status
+    }
+    if status == 'error':
+        summary_result['error'] = combined_result.get('error')
+        reply_result['error'] = combined_result.get('error')
+    return summary_result, reply_result
+
+
+def _start_processing(email_data: Dict, mode: Optional[str]) -> str:
+    """Validate the generation mode and log the start of processing an email."""
+    mode = mode or DEFAULT_GENERATION_MODE
+    if mode not in GENERATION_MODES:
+        raise ValueError(f"Unknown generation mode: {mode}")
+    
+    log.info("Processing email", extra={"subject": email_data.get('subject', 'No Subject'),
+                                        "sender": email_data.get('from', 'Unknown'), "mode": mode})
+    return mode
+
+
+def _finish_combined(email_data: Dict, combined_result: Dict) -> Optional[Dict]:
+    """Build the result of a combined generation, or return None to fall back to separate calls."""
+    combined_time = combined_result.get('processing_time')
+    if combined_result.get('status') in ('parse_error', 'too_long'):
+        log.warning("%s (%ss), falling back to separate calls", combined_result.get('error'), combined_time)
+        return None
     
+    summary_result, reply_result = _split_combined_result(combined_result)
+    result = _build_processed_result(email_data, summary_result, reply_result)
+    result['generation_mode'] = "combined"
+    result['combined_time'] = combined_time
+    return result
+
+
+def _finish_separate(email_data: Dict, summary_result: Dict, reply_result: Optional[Dict],
+                     combined_result: Optional[Dict] = None) -> Dict:
+    """Build the result of separate summary/reply generations."""
+    result = _build_processed_result(email_data, summary_result, reply_result)
+    result['generation_mode'] = "separate"
+    if combined_result is not None:
+        result['combined_fallback'] = True
+        result['combined_time'] = combined_result.get('processing_time')
     return result
 
 
-def process_emails(emails: List[Dict], generate_reply: bool = True) -> List[Dict]:
+def _use_combined(email_data: Dict, generate_reply: bool, mode: str) -> bool:
+    """Whether an email gets a combined call; thread summaries always use a separate summary call."""
+    return mode == "combined" and generate_reply and threads.thread_key(email_data) is None
+
+
+def _expected_llm_calls(email_data: Dict, generate_reply: bool, mode: str) -> int:
+    """Number of Ollama calls an email takes when nothing falls back (for skip stats)."""
+    return 1 if _use_combined(email_data, generate_reply, mode) or not generate_reply else 2
+
+
+def _skip_llm(email_data: Dict, generate_reply: bool, mode: str) -> Optional[Dict]:
+    """Return a template result for bulk/automated mail, or None if the email needs the model."""
+    classification = classifier.classify(email_data)
+    if classification is None:
+        return None
+    
+    log.info("%s (%s), skipping the model", classification['category'], classification['reason'])
+    classifier.record_skip(classification['category'], _expected_llm_calls(email_data, generate_reply, mode))
+    result = _build_processed_result(email_data, classifier.template_result(email_data, classification), None)
+    result['generation_mode'] = "skipped"
+    result['category'] = classification['category']
+    result['classification_reason'] = classification['reason']
+    return result
+
+
+@logs.with_email_id
+def process_email(email_data: Dict, generate_reply: bool = True, mode: Optional[str] = None) -> Dict:
+    """
+    Process an email: generate summary and optionally a draft reply.
+    
+    Args:
+        email_data: Dictionary containing email information
+        generate_reply: Whether to generate a draft reply (default: True)
+        mode: "separate" or "combined" (default: DEFAULT_GENERATION_MODE).
+            Combined mode only applies when a reply is requested and falls
+            back to separate calls if the model output cannot be parsed or the
+            email is long enough to need a map-reduce summary.
+    
+    Bulk and automated mail (see classifier.py) gets a template summary and
+    no reply, without calling the model.
+    
+    Returns:
+        Dictionary with processed email data including summary and reply
+    """
+    mode = _start_processing(email_data, mode)
+    skipped = _skip_llm(email_data, generate_reply, mode)
+    if skipped is not None:
+        return skipped
+    return _generate_result(email_data, generate_reply, mode)
+
+
+@logs.with_email_id
+def _generate_result(email_data: Dict, generate_reply: bool, mode: str) -> Dict:
+    """Generate the summary and reply of an email the classifier sent to the model."""
+    combined_result = None
+    
+    if _use_combined(email_data, generate_reply, mode):
+        log.debug("Generating summary and draft reply (combined)")
+        combined_result = generate_summary_and_reply(email_data)
+        result = _finish_combined(email_data, combined_result)
+        if result is not None:
+            return result
+    
+    # Generate summary
+    log.debug("Generating summary")
+    summary_result = summarize_email(email_data)
+    
+    # Generate draft reply if requested
+    reply_result = None
+    if generate_reply:
+        log.debug("Generating draft reply")
+        reply_result = generate_draft_reply(email_data)
+    
+    return _finish_separate(email_data, summary_result, reply_result, combined_result)
+
+
+@logs.with_email_id
+async def process_email_async(email_data: Dict, generate_reply: bool = True, mode: Optional[str] = None) -> Dict:
+    """
+    Async counterpart of process_email.
+    
+    In separate mode the summary and the reply are requested concurrently.
+    After a failed combined call they run one after the other, so an email
+    never has more Ollama requests in flight than process_emails_async
+    counted for it (one).
+    """
+    mode = _start_processing(email_data, mode)
+    skipped = _skip_llm(email_data, generate_reply, mode)
+    if skipped is not None:
+        return skipped
+    return await _generate_result_async(email_data, generate_reply, mode)
+
+
+@logs.with_email_id
+async def _generate_result_async(email_data: Dict, generate_reply: bool, mode: str) -> Dict:
+    """Async counterpart of _generate_result."""
+    combined_result = None
+    
+    if _use_combined(email_data, generate_reply, mode):
+        log.debug("Generating summary and draft reply (combined)")
+        combined_result = await generate_summary_and_reply_async(email_data)
+        result = _finish_combined(email_data, combined_result)
+        if result is not None:
+            return result
+    
+    if generate_reply and combined_result is not None:
+        log.debug("Generating summary and draft reply")
+        summary_result = await summarize_email_async(email_data)
+        reply_result = await generate_draft_reply_async(email_data)
+    elif generate_reply:
+        log.debug("Generating summary and draft reply")
+        summary_result, reply_result = await asyncio.gather(
+            summarize_email_async(email_data),
+            generate_draft_reply_async(email_data)
+        )
+    else:
+        log.debug("Generating summary")
+        summary_result, reply_result = await summarize_email_async(email_data), None
+    
+    return _finish_separate(email_data, summary_result, reply_result, combined_result)
+
+
+def _timed_call(func: Callable, *args) -> Tuple[Dict, float, float]:
+    """Run func(*args) and return its result with start and end timestamps."""
+    start_time = time.time()
+    result = func(*args)
+    return result, start_time, time.time()
+
+
+async def _timed_call_async(func: Callable, *args) -> Tuple[Dict, float, float]:
+    """Await func(*args) and return its result with start and end timestamps."""
+    start_time = time.time()
+    result = await func(*args)
+    return result, start_time, time.time()
+
+
+def _record_batch_stats(results: List[Dict], latencies: List[float], wall_time: float,
+                        max_in_flight: int, llm_calls: int) -> Dict:
+    """Compute and store the stats for a finished process_emails batch."""
+    failed = sum(1 for r in results if r.get('error') and not r.get('summary'))
+    skipped = sum(1 for r in results if r.get('generation_mode') == "skipped")
+    ttfts = [r[key] for r in results for key in ('summary_ttft', 'reply_ttft') if r.get(key)]
+    stats = {
+        "emails": len(results),
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "skipped_llm": skipped,
+        "llm_calls": llm_calls,
+        "max_in_flight": max_in_flight,
+        "wall_time": round(wall_time, 2),
+        "emails_per_minute": round(len(results) / wall_time * 60, 2) if wall_time > 0 else 0,
+        "latency_avg": round(sum(latencies) / len(latencies), 2) if latencies else 0,
+        "latency_p50": round(metrics.percentile(latencies, 50), 2),
+        "latency_p95": round(metrics.percentile(latencies, 95), 2),
+        "latency_p99": round(metrics.percentile(latencies, 99), 2),
+        "latency_max": round(max(latencies), 2) if latencies else 0,
+        "ttft_p50": round(metrics.percentile(ttfts, 50), 2),
+        "ttft_p95": round(metrics.percentile(ttfts, 95), 2),
+        "finished_at": time.time(),
+    }
+    _last_batch_stats.clear()
+    _last_batch_stats.update(stats)
+    # Latencies only cover emails sent to the model
+    classifier.record_inference(len(latencies), sum(latencies))
+    
+    if results:
+        log.info("Batch: %d email(s) in %ss", stats['emails'], stats['wall_time'], extra={"batch": stats})
+    return stats
+
+
+def get_last_batch_stats() -> Dict:
+    """Return throughput/latency stats of the most recent process_emails batch."""
+    return dict(_last_batch_stats)
+
+
+def process_emails(emails: List[Dict], generate_reply: bool = True, mode: Optional[str] = None,
+                   max_in_flight: Optional[int] = None) -> List[Dict]:
     """
     Process multiple emails.
     
+    Summary and reply generation for all emails is dispatched to a thread
+    pool that keeps at most max_in_flight Ollama requests running (and never
+    more than ollama_slots allows across the whole process). Results are
+    returned in input order and a failure only affects its own email.
+    
     Args:
         emails: List of email dictionaries
         generate_reply: Whether to generate draft replies (default: True)
+        mode: Generation mode passed to process_email
+        max_in_flight: Maximum concurrent Ollama requests (default: DEFAULT_MAX_IN_FLIGHT)
     
     Returns:
         List of processed email results
     """
+    mode = mode or DEFAULT_GENERATION_MODE
+    max_in_flight = max(1, max_in_flight or DEFAULT_MAX_IN_FLIGHT)
     results = []
+    latencies = []
+    llm_calls: List[str] = []
+    batch_start = time.time()
+    
+    if mode not in GENERATION_MODES:
+        raise ValueError(f"Unknown generation mode: {mode}")
     
-    for email_data in emails:
+    calls_token = _batch_llm_calls.set(llm_calls)
+    try:
+        if max_in_flight == 1:
+            for email_data in emails:
+                with logs.email_context(email_data.get('id')):
+                    _start_processing(email_data, mode)
+                    skipped = _skip_llm(email_data, generate_reply, mode)
+                if skipped is not None:
+                    results.append(skipped)
+                    continue
+                start_time = time.time()
+                try:
+                    results.append(_generate_result(email_data, generate_reply, mode))
+                except Exception as e:
+                    log.error("Error processing email: %s", e, extra={"email_id": email_data.get('id')})
+                    results.append({
+                        "email_id": email_data.get('id'),
+                        "error": str(e)
+                    })
+                latencies.append(time.time() - start_time)
+        else:
+            results = _process_emails_pooled(emails, generate_reply, mode, max_in_flight, latencies)
+    finally:
+        _batch_llm_calls.reset(calls_token)
+    
+    _record_batch_stats(results, latencies, time.time() - batch_start, max_in_flight, len(llm_calls))
+    return results
+
+
+def _process_emails_pooled(emails: List[Dict], generate_reply: bool, mode: str, max_in_flight: int,
+                           latencies: List[float]) -> List[Dict]:
+    """Thread pool path of process_emails; appends each model-processed email's latency to latencies."""
+    results = []
+    log.info("Processing %d email(s) with up to %d concurrent Ollama request(s)", len(emails), max_in_flight)
+    
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="automail-llm") as executor:
+        def submit(func: Callable, *args):
+            # Run in a copy of this context, so the call is counted towards the batch
+            return executor.submit(contextvars.copy_context().run, _timed_call, func, *args)
+        
+        # Submit every LLM call up front; the pool size bounds how many run at once.
+        # Each task is a leaf call, so no task ever waits on another.
+        pending = []
+        for email_data in emails:
+            with logs.email_context(email_data.get('id')):
+                _start_processing(email_data, mode)
+                skipped = _skip_llm(email_data, generate_reply, mode)
+            if skipped is not None:
+                pending.append((email_data, {}, skipped))
+                continue
+            if _use_combined(email_data, generate_reply, mode):
+                futures = {"email": submit(_generate_result, email_data, True, mode)}
+            else:
+                futures = {"summary": submit(summarize_email, email_data)}
+                if generate_reply:
+                    futures["reply"] = submit(generate_draft_reply, email_data)
+            pending.append((email_data, futures, None))
+        
+        for email_data, futures, skipped in pending:
+            if skipped is not None:
+                results.append(skipped)
+                continue
+            try:
+                timed = {name: future.result() for name, future in futures.items()}
+                if "email" in timed:
+                    processed = timed["email"][0]
+                else:
+                    with logs.email_context(email_data.get('id')):
+                        _log_processed(email_data)
+                        reply_result = timed["reply"][0] if "reply" in timed else None
+                        processed = _finish_separate(email_data, timed["summary"][0], reply_result)
+                results.append(processed)
+                latencies.append(
+                    max(end for _, _, end in timed.values()) - min(start for _, start, _ in timed.values())
+                )
+            except Exception as e:
+                log.error("Error processing email: %s", e, extra={"email_id": email_data.get('id')})
+                results.append({
+                    "email_id": email_data.get('id'),
+                    "error": str(e)
+                })
+    return results
+
+
+def _log_processed(email_data: Dict):
+    """Log an email whose separate summary and reply calls have finished."""
+    log.info("Processed email", extra={"subject": email_data.get('subject', 'No Subject'),
+                                       "sender": email_data.get('from', 'Unknown')})
+
+
+def _bind_token_callback(on_token: Optional[Callable[[str, str, str], None]], email_data: Dict,
+                         key: str) -> Optional[Callable[[str], None]]:
+    """Adapt a batch-level on_token callback to a single email's generation."""
+    if on_token is None:
+        return None
+    email_id = email_data.get('id')
+    
+    def callback(token: str):
         try:
-            processed = process_email(email_data, generate_reply)
-            results.append(processed)
+            on_token(email_id, key, token)
         except Exception as e:
-            print(f"❌ Error processing email {email_data.get('id', 'unknown')}: {e}")
-            results.append({
-                "email_id": email_data.get('id'),
-                "error": str(e)
-            })
+            log.warning("Error in token callback: %s", e, extra={"email_id": email_id})
+    return callback
+
+
+async def process_emails_async(emails: List[Dict], generate_reply: bool = True, mode: Optional[str] = None,
+                               max_in_flight: Optional[int] = None,
+                               on_result: Optional[Callable[[Dict], None]] = None,
+                               on_token: Optional[Callable[[str, str, str], None]] = None) -> List[Dict]:
+    """
+    Async counterpart of process_emails for use from the FastAPI handlers.
+    
+    Ollama requests go through the async client, so the event loop keeps
+    serving other requests during inference. At most max_in_flight requests
+    of this batch run at once, and ollama_slots bounds them together with
+    every other generation in the process; results keep input order and
+    failures stay per email.
+    on_result, if given, is called with each email's result as soon as it is
+    ready, in completion order, so a slow email doesn't hold back the ones
+    after it. on_token, if given, is called as
+    on_token(email_id, "summary" | "draft_reply", text) while separate-mode
+    generations stream.
+    """
+    mode = mode or DEFAULT_GENERATION_MODE
+    if mode not in GENERATION_MODES:
+        raise ValueError(f"Unknown generation mode: {mode}")
+    max_in_flight = max(1, max_in_flight or DEFAULT_MAX_IN_FLIGHT)
+    semaphore = asyncio.Semaphore(max_in_flight)
+    latencies = []
+    llm_calls: List[str] = []
+    batch_start = time.time()
+    
+    async def limited(func: Callable, *args) -> Tuple[Dict, float, float]:
+        async with semaphore:
+            return await _timed_call_async(func, *args)
+    
+    log.info("Processing %d email(s) with up to %d concurrent Ollama request(s)", len(emails), max_in_flight)
+    
+    # Tasks copy the context they are created in, so their calls count towards the batch
+    calls_token = _batch_llm_calls.set(llm_calls)
+    try:
+        pending = []
+        for email_data in emails:
+            with logs.email_context(email_data.get('id')):
+                _start_processing(email_data, mode)
+                skipped = _skip_llm(email_data, generate_reply, mode)
+            if skipped is not None:
+                pending.append((email_data, {}, skipped))
+                continue
+            if _use_combined(email_data, generate_reply, mode):
+                tasks = {"email": asyncio.ensure_future(limited(_generate_result_async, email_data, True, mode))}
+            else:
+                tasks = {"summary": asyncio.ensure_future(limited(
+                    summarize_email_async, email_data, True, _bind_token_callback(on_token, email_data, "summary")
+                ))}
+                if generate_reply:
+                    tasks["reply"] = asyncio.ensure_future(limited(
+                        generate_draft_reply_async, email_data, "professional", True,
+                        _bind_token_callback(on_token, email_data, "draft_reply")
+                    ))
+            pending.append((email_data, tasks, None))
+    finally:
+        _batch_llm_calls.reset(calls_token)
+    
+    async def finish(email_data: Dict, tasks: Dict[str, asyncio.Future], skipped: Optional[Dict]) -> Dict:
+        """Wait for one email's generations, build its result and hand it to on_result."""
+        if skipped is not None:
+            processed = skipped
+        else:
+            try:
+                outcomes = await asyncio.gather(*tasks.values(), return_exceptions=True)
+                for outcome in outcomes:
+                    if isinstance(outcome, Exception):
+                        raise outcome
+                timed = dict(zip(tasks.keys(), outcomes))
+                if "email" in timed:
+                    processed = timed["email"][0]
+                else:
+                    with logs.email_context(email_data.get('id')):
+                        _log_processed(email_data)
+                        reply_result = timed["reply"][0] if "reply" in timed else None
+                        processed = _finish_separate(email_data, timed["summary"][0], reply_result)
+                latencies.append(
+                    max(end for _, _, end in timed.values()) - min(start for _, start, _ in timed.values())
+                )
+            except Exception as e:
+                log.error("Error processing email: %s", e, extra={"email_id": email_data.get('id')})
+                processed = {
+                    "email_id": email_data.get('id'),
+                    "error": str(e)
+                }
+        
+        if on_result is not None:
+            try:
+                on_result(processed)
+            except Exception as e:
+                log.warning("Error in result callback: %s", e, extra={"email_id": email_data.get('id')})
+        return processed
     
+    # Each email finishes on its own; gather only restores input order for the return value
+    results = list(await asyncio.gather(*(finish(*entry) for entry in pending)))
+    _record_batch_stats(results, latencies, time.time() - batch_start, max_in_flight, len(llm_calls))
     return results
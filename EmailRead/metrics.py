@@ -0,0 +1,172 @@
+"""Per-stage latency histograms and counters, exposed in the Prometheus text format"""
+
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Sequence, Tuple
+import functools
+import threading
+import time
+
+# Upper bounds (seconds) of the latency histogram buckets; from sub-millisecond
+# parsing and SQLite writes up to multi-minute CPU inference
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300
+)
+
+# name -> (help text, label names)
+HISTOGRAMS = {
+    "automail_gmail_request_seconds": ("Gmail API request latency (a batch counts as one request)", ("method",)),
+    "automail_mime_parse_seconds": ("Time to parse a Gmail message into an email dictionary", ()),
+    "automail_prompt_build_seconds": ("Time to clean email content and build a prompt", ("step",)),
+    "automail_llm_request_seconds": ("End-to-end Ollama generation latency", ("model",)),
+    "automail_llm_load_seconds": ("Time Ollama spent loading the model for a request", ("model",)),
+    "automail_llm_prompt_eval_seconds": ("Time Ollama spent evaluating the prompt", ("model",)),
+    "automail_llm_generation_seconds": ("Time Ollama spent generating the response", ("model",)),
+    "automail_persistence_seconds": ("SQLite and journal write latency", ("operation",)),
+    "automail_http_request_seconds": ("HTTP request handling time until the response starts",
+                                      ("method", "route", "status")),
+}
+
+COUNTERS = {
+    "automail_gmail_api_calls_total": ("Gmail API method calls, including those sent in batches", ("method",)),
+    "automail_gmail_api_errors_total": ("Gmail API requests that raised an error", ("method",)),
+    "automail_llm_requests_total": ("Ollama generations by outcome", ("model", "outcome")),
+    "automail_llm_prompt_tokens_total": ("Prompt tokens evaluated by Ollama", ("model",)),
+    "automail_llm_eval_tokens_total": ("Tokens generated by Ollama", ("model",)),
+    "automail_llm_cache_lookups_total": ("LLM result cache lookups", ("result",)),
+    "automail_llm_skipped_total": ("Emails that skipped the model (classifier.py)", ("category",)),
+}
+
+_lock = threading.Lock()
+# name -> label values -> [bucket counts..., +Inf count, sum]
+_histogram_values: Dict[str, Dict[Tuple[str, ...], list]] = {name: {} for name in HISTOGRAMS}
+# name -> label values -> value
+_counter_values: Dict[str, Dict[Tuple[str, ...], float]] = {name: {} for name in COUNTERS}
+
+
+def _label_values(label_names: Tuple[str, ...], labels: Dict[str, object]) -> Tuple[str, ...]:
+    """Label values in the order of the metric's label names."""
+    return tuple(str(labels.get(name, '')) for name in label_names)
+
+
+def observe(name: str, seconds: float, **labels):
+    """Record a duration in a histogram."""
+    key = _label_values(HISTOGRAMS[name][1], labels)
+    with _lock:
+        values = _histogram_values[name].get(key)
+        if values is None:
+            values = _histogram_values[name][key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                values[index] += 1
+        values[-2] += 1
+        values[-1] += seconds
+
+
+def inc(name: str, amount: float = 1, **labels):
+    """Increase a counter."""
+    key = _label_values(COUNTERS[name][1], labels)
+    with _lock:
+        _counter_values[name][key] = _counter_values[name].get(key, 0) + amount
+
+
+@contextmanager
+def timer(name: str, **labels) -> Iterator[None]:
+    """Time the enclosed block into a histogram (also when it raises)."""
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start_time, **labels)
+
+
+def timed(name: str, **labels) -> Callable:
+    """Decorator timing every call of a function into a histogram."""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def gmail_execute(request, method: str, calls: int = 1):
+    """
+    Execute a Gmail API request (or batch), timing it and counting the calls.
+    
+    Args:
+        request: googleapiclient request or BatchHttpRequest
+        method: API method, e.g. "messages.list"; "batch" for a batch request
+        calls: Number of method calls the request carries (for batches)
+    
+    Returns:
+        The request's result
+    """
+    counted = "messages.get" if method == "batch" else method
+    inc("automail_gmail_api_calls_total", calls, method=counted)
+    try:
+        with timer("automail_gmail_request_seconds", method=method):
+            return request.execute()
+    except Exception:
+        inc("automail_gmail_api_errors_total", method=method)
+        raise
+
+
+def record_llm(model: str, response: Dict, latency: float):
+    """Record the latency breakdown and token counts of a finished Ollama generation."""
+    observe("automail_llm_request_seconds", latency, model=model)
+    for name, field in (("automail_llm_load_seconds", 'load_duration'),
+                        ("automail_llm_prompt_eval_seconds", 'prompt_eval_duration'),
+                        ("automail_llm_generation_seconds", 'eval_duration')):
+        if response.get(field) is not None:
+            observe(name, response[field] / 1e9, model=model)
+    inc("automail_llm_prompt_tokens_total", response.get('prompt_eval_count') or 0, model=model)
+    inc("automail_llm_eval_tokens_total", response.get('eval_count') or 0, model=model)
+
+
+def percentile(values: Sequence[float], percent: float) -> float:
+    """Nearest-rank percentile of a list of values."""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(percent / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def _escape(value: str) -> str:
+    """Escape a label value."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(label_names: Tuple[str, ...], values: Tuple[str, ...], le: str = '') -> str:
+    """Format a label set, e.g. {model="llama3.2:latest",le="0.5"}."""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, values)]
+    if le:
+        pairs.append(f'le="{le}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value: float) -> str:
+    """Format a sample value, without a trailing .0 for whole numbers."""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render() -> str:
+    """Return every metric in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    with _lock:
+        for name, (help_text, label_names) in HISTOGRAMS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, values in sorted(_histogram_values[name].items()):
+                for bound, count in zip(LATENCY_BUCKETS, values):
+                    lines.append(f"{name}_bucket{_format_labels(label_names, key, str(bound))} {count}")
+                lines.append(f"{name}_bucket{_format_labels(label_names, key, '+Inf')} {values[-2]}")
+                lines.append(f"{name}_sum{_format_labels(label_names, key)} {_format_number(values[-1])}")
+                lines.append(f"{name}_count{_format_labels(label_names, key)} {values[-2]}")
+        for name, (help_text, label_names) in COUNTERS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(_counter_values[name].items()):
+                lines.append(f"{name}{_format_labels(label_names, key)} {_format_number(value)}")
+    return '\n'.join(lines) + '\n'
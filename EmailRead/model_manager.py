@@ -0,0 +1,157 @@
+"""Shared Ollama clients, model keep-alive and warm-up, cold/warm latency tracking"""
+
+from collections import deque
+from ollama import AsyncClient, Client
+from typing import Dict, Mapping, Optional, Union
+import os
+import threading
+import time
+
+try:
+    from . import logs, metrics
+except ImportError:
+    import logs
+    import metrics
+
+log = logs.get_logger("model_manager")
+
+# How long Ollama keeps the model loaded after a request ("30m", "1h", seconds,
+# or -1 to keep it loaded until Ollama stops); sent with every request
+_keep_alive_setting = os.environ.get("AUTOMAIL_KEEP_ALIVE", "30m")
+KEEP_ALIVE: Union[float, str] = (
+    float(_keep_alive_setting) if _keep_alive_setting.lstrip('-').replace('.', '', 1).isdigit()
+    else _keep_alive_setting
+)
+
+# Set AUTOMAIL_WARMUP=0 to skip loading the model when the server starts
+WARMUP_ENABLED = os.environ.get("AUTOMAIL_WARMUP", "1") != "0"
+
+# A call whose model load took longer than this counts as cold
+COLD_LOAD_SECONDS = 0.5
+
+# Number of recent latencies kept per kind for the percentiles
+LATENCY_SAMPLES = 200
+
+# One client of each kind for the whole process (one sync client per request
+# timeout), so HTTP connections to Ollama are pooled and reused instead of
+# opened per request
+_clients: Dict[Optional[float], Client] = {}
+_async_client: Optional[AsyncClient] = None
+_client_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_latencies: Dict[str, "deque[float]"] = {
+    "cold": deque(maxlen=LATENCY_SAMPLES),
+    "warm": deque(maxlen=LATENCY_SAMPLES),
+}
+_stats = {
+    "cold_calls": 0,
+    "warm_calls": 0,
+    "last_load_seconds": None,
+    "warmup": None,
+}
+
+
+def get_client(timeout: Optional[float] = None) -> Client:
+    """Return the shared sync Ollama client for a request timeout in seconds (None: no timeout)."""
+    with _client_lock:
+        if timeout not in _clients:
+            _clients[timeout] = Client(host=os.environ.get("OLLAMA_HOST"), timeout=timeout)
+        return _clients[timeout]
+
+
+def get_async_client() -> AsyncClient:
+    """Return the shared async Ollama client."""
+    global _async_client
+    with _client_lock:
+        if _async_client is None:
+            _async_client = AsyncClient(host=os.environ.get("OLLAMA_HOST"))
+        return _async_client
+
+
+def generate(model: str, prompt: str, timeout: Optional[float] = None, **options) -> Mapping:
+    """
+    Run a non-streamed generation with the shared client and keep-alive.
+    
+    Args:
+        model: Ollama model name
+        prompt: Prompt to send
+        timeout: Seconds to wait for the response (default: no limit)
+        **options: Extra arguments for generate (e.g. format='json')
+    
+    Returns:
+        Ollama's response
+    """
+    start_time = time.time()
+    response = get_client(timeout).generate(model=model, prompt=prompt, keep_alive=KEEP_ALIVE, **options)
+    record_call(response, time.time() - start_time)
+    return response
+
+
+def record_call(response: Mapping, latency: float):
+    """
+    Count a finished generation as cold or warm.
+    
+    Args:
+        response: Final (done) response from Ollama, with load_duration in nanoseconds
+        latency: Seconds the whole call took
+    """
+    load_seconds = (response.get('load_duration') or 0) / 1e9
+    kind = "cold" if load_seconds >= COLD_LOAD_SECONDS else "warm"
+    with _stats_lock:
+        _latencies[kind].append(latency)
+        _stats[f"{kind}_calls"] += 1
+        if kind == "cold":
+            _stats["last_load_seconds"] = round(load_seconds, 2)
+    if kind == "cold":
+        log.info("Model was not loaded: %.2fs of %.2fs spent loading it", load_seconds, latency)
+
+
+async def warm_up(model: str) -> Optional[Dict]:
+    """
+    Load the model into Ollama and pin it with KEEP_ALIVE.
+    
+    An empty prompt makes Ollama load the model without generating anything.
+    
+    Returns:
+        {"model", "seconds", "load_seconds", "finished_at"}, or None if warming up failed
+    """
+    log.info("Warming up %s (keep_alive=%s)", model, KEEP_ALIVE)
+    start_time = time.time()
+    try:
+        response = await get_async_client().generate(model=model, prompt='', keep_alive=KEEP_ALIVE)
+    except Exception as e:
+        log.warning("Could not warm up %s: %s", model, e)
+        return None
+    
+    warmup = {
+        "model": model,
+        "seconds": round(time.time() - start_time, 2),
+        "load_seconds": round((response.get('load_duration') or 0) / 1e9, 2),
+        "finished_at": time.time(),
+    }
+    with _stats_lock:
+        _stats["warmup"] = warmup
+    log.info("%s loaded in %ss", model, warmup['seconds'])
+    return warmup
+
+
+def get_stats() -> Dict:
+    """Return keep-alive settings and cold vs warm call latencies."""
+    with _stats_lock:
+        latencies = {kind: list(values) for kind, values in _latencies.items()}
+        stats = dict(_stats)
+    
+    return {
+        "keep_alive": KEEP_ALIVE,
+        "warmup": stats["warmup"],
+        "last_load_seconds": stats["last_load_seconds"],
+        **{
+            kind: {
+                "calls": stats[f"{kind}_calls"],
+                "latency_p50": round(metrics.percentile(values, 50), 2),
+                "latency_p95": round(metrics.percentile(values, 95), 2),
+            }
+            for kind, values in latencies.items()
+        }
+    }
@@ -0,0 +1,196 @@
+"""Choose the Ollama model for each generation from a routing table, with fallbacks and per-model stats"""
+
+from collections import deque
+from typing import Dict, List, Mapping
+import asyncio
+import json
+import os
+import threading
+
+try:
+    from . import logs, metrics
+except ImportError:
+    import logs
+    import metrics
+
+log = logs.get_logger("model_router")
+
+# Model used when no route matches (and the only one without a routing table)
+DEFAULT_MODEL = os.environ.get("AUTOMAIL_MODEL", "llama3.2:latest")
+
+# Seconds a model gets to answer before the next model of the route is tried
+DEFAULT_TIMEOUT_SECONDS = float(os.environ.get("AUTOMAIL_MODEL_TIMEOUT", "300"))
+
+# Tasks a route can be restricted to; map-reduce steps and thread updates are summaries
+TASKS = ("summary", "reply", "combined")
+
+# Keys a route may have; "models" is required
+_ROUTE_KEYS = ("task", "min_tokens", "max_tokens", "min_priority", "models", "timeout")
+
+# Number of recent latencies kept per model for the percentiles
+LATENCY_SAMPLES = 200
+
+_stats_lock = threading.Lock()
+_model_stats: Dict[str, Dict] = {}
+
+
+def _load_routes() -> List[Dict]:
+    """
+    Read the routing table from AUTOMAIL_MODEL_ROUTES (JSON, or the path of a JSON file).
+    
+    Each route is {"task", "min_tokens", "max_tokens", "min_priority", "models", "timeout"};
+    everything but models (the model to use followed by its fallbacks) is optional.
+    Routes are checked in order and the first match wins.
+    """
+    setting = os.environ.get("AUTOMAIL_MODEL_ROUTES", "").strip()
+    if not setting:
+        return []
+    try:
+        if not setting.startswith('['):
+            with open(setting, 'r') as f:
+                setting = f.read()
+        routes = json.loads(setting)
+    except Exception as e:
+        log.warning("Ignoring AUTOMAIL_MODEL_ROUTES: %s", e)
+        return []
+    
+    valid = []
+    for index, route in enumerate(routes):
+        if not isinstance(route, dict) or not route.get('models'):
+            log.warning("Ignoring model route %d: it needs a non-empty \"models\" list", index)
+            continue
+        unknown = [key for key in route if key not in _ROUTE_KEYS]
+        if unknown:
+            log.warning("Ignoring model route %d: unknown key(s) %s", index, ', '.join(unknown))
+            continue
+        if route.get('task') not in (None,) + TASKS:
+            log.warning("Ignoring model route %d: task must be one of %s", index, ', '.join(TASKS))
+            continue
+        valid.append(route)
+    return valid
+
+
+ROUTES = _load_routes()
+
+
+def route(task: str, tokens: int = 0, priority: int = 0) -> Dict:
+    """
+    Pick the models for a generation.
+    
+    Args:
+        task: "summary", "reply" or "combined"
+        tokens: Estimated tokens of the email content
+        priority: Priority score of the email (priority.score)
+    
+    Returns:
+        {"models": [model, *fallbacks], "timeout": seconds, "rule": index of the
+        matching route, or None for the default model}
+    """
+    for index, rule in enumerate(ROUTES):
+        if rule.get('task') not in (None, task):
+            continue
+        if tokens < rule.get('min_tokens', 0):
+            continue
+        if rule.get('max_tokens') is not None and tokens > rule['max_tokens']:
+            continue
+        if priority < rule.get('min_priority', float('-inf')):
+            continue
+        return {
+            "models": list(rule['models']),
+            "timeout": float(rule.get('timeout', DEFAULT_TIMEOUT_SECONDS)),
+            "rule": index,
+        }
+    return {"models": [DEFAULT_MODEL], "timeout": DEFAULT_TIMEOUT_SECONDS, "rule": None}
+
+
+def primary_models() -> List[str]:
+    """Return the first model of every route and the default model, without duplicates."""
+    models = [rule['models'][0] for rule in ROUTES] + [DEFAULT_MODEL]
+    return list(dict.fromkeys(models))
+
+
+def _stats_for(model: str) -> Dict:
+    """Counters of a model, created on first use. Caller holds _stats_lock."""
+    if model not in _model_stats:
+        _model_stats[model] = {
+            "calls": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "fallbacks": 0,
+            "prompt_tokens": 0,
+            "prompt_seconds": 0.0,
+            "eval_tokens": 0,
+            "eval_seconds": 0.0,
+            "latencies": deque(maxlen=LATENCY_SAMPLES),
+        }
+    return _model_stats[model]
+
+
+def record_success(model: str, response: Mapping, latency: float, fallback: bool = False):
+    """
+    Count a successful generation.
+    
+    Args:
+        model: Model that answered
+        response: Final response from Ollama (prompt_eval_* and eval_* counts and
+            durations give the prompt and generation throughput)
+        latency: Seconds the call took
+        fallback: True if an earlier model of the route failed first
+    """
+    with _stats_lock:
+        stats = _stats_for(model)
+        stats["calls"] += 1
+        stats["fallbacks"] += 1 if fallback else 0
+        stats["prompt_tokens"] += response.get('prompt_eval_count') or 0
+        stats["prompt_seconds"] += (response.get('prompt_eval_duration') or 0) / 1e9
+        stats["eval_tokens"] += response.get('eval_count') or 0
+        stats["eval_seconds"] += (response.get('eval_duration') or 0) / 1e9
+        stats["latencies"].append(latency)
+    metrics.record_llm(model, response, latency)
+    metrics.inc("automail_llm_requests_total", model=model, outcome="fallback" if fallback else "success")
+
+
+def record_failure(model: str, error: Exception):
+    """Count a generation that failed or timed out."""
+    with _stats_lock:
+        stats = _stats_for(model)
+        stats["calls"] += 1
+        timed_out = isinstance(error, asyncio.TimeoutError) or 'timed out' in str(error).lower()
+        stats["timeouts" if timed_out else "errors"] += 1
+    metrics.inc("automail_llm_requests_total", model=model, outcome="timeout" if timed_out else "error")
+
+
+def reset_stats():
+    """Clear the per-model counters (e.g. between benchmark runs)."""
+    with _stats_lock:
+        _model_stats.clear()
+
+
+def get_stats() -> Dict:
+    """Return the routing table and latency/throughput counters per model."""
+    with _stats_lock:
+        models = {}
+        for model, stats in _model_stats.items():
+            latencies = list(stats["latencies"])
+            models[model] = {
+                "calls": stats["calls"],
+                "errors": stats["errors"],
+                "timeouts": stats["timeouts"],
+                "fallbacks": stats["fallbacks"],
+                "latency_p50": round(metrics.percentile(latencies, 50), 2),
+                "latency_p95": round(metrics.percentile(latencies, 95), 2),
+                "prompt_tokens": stats["prompt_tokens"],
+                "eval_tokens": stats["eval_tokens"],
+                "prompt_tokens_per_second": (
+                    round(stats["prompt_tokens"] / stats["prompt_seconds"], 1) if stats["prompt_seconds"] else None
+                ),
+                "tokens_per_second": (
+                    round(stats["eval_tokens"] / stats["eval_seconds"], 1) if stats["eval_seconds"] else None
+                ),
+            }
+    return {
+        "default_model": DEFAULT_MODEL,
+        "default_timeout": DEFAULT_TIMEOUT_SECONDS,
+        "routes": ROUTES,
+        "models": models,
+    }
@@ -1,93 +1,623 @@
 """This script should take care of getting the new emails and make it ready for the main.py"""
 
-from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 import base64
 import json
 import os
 import re
+import time
+import threading
 import asyncio
-from typing import Any, List, Dict, Optional
+from typing import Any, Callable, List, Dict, Optional, Set, Tuple
+from google.auth.credentials import AnonymousCredentials
 from google.auth.transport.requests import Request as GoogleRequest
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build, build_from_document
 from googleapiclient.errors import HttpError
 from email.header import decode_header
 from pathlib import Path
 
+try:
+    from . import email_query, events, history_sync, job_queue, logs, metrics, priority, storage, unread_status
+    from .id_journal import ProcessedIdJournal
+except ImportError:
+    import email_query
+    import events
+    import history_sync
+    import job_queue
+    import logs
+    import metrics
+    import priority
+    import storage
+    import unread_status
+    from id_journal import ProcessedIdJournal
+
 # Gmail API scopes - need modify scope to mark emails as read
 SCOPES = [
     'https://www.googleapis.com/auth/gmail.readonly',
     'https://www.googleapis.com/auth/gmail.modify'
 ]
 
+# Set AUTOMAIL_GMAIL_API_URL to use a local Gmail API stand-in (e.g.
+# benchmarks/fake_gmail.py) instead of Google; no OAuth token is needed then
+GMAIL_API_URL = os.environ.get("AUTOMAIL_GMAIL_API_URL")
+
+log = logs.get_logger("notify")
+
 app = FastAPI()
 
+
+class RequestMetricsMiddleware:
+    """Times each HTTP request until its response starts, labelled by route template."""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        start_time = time.perf_counter()
+        
+        async def send_with_metrics(message):
+            if message['type'] == 'http.response.start':
+                # The router stores the matched route in the scope
+                route = getattr(scope.get('route'), 'path', 'unmatched')
+                metrics.observe("automail_http_request_seconds", time.perf_counter() - start_time,
+                                method=scope['method'], route=route, status=message['status'])
+            await send(message)
+        
+        await self.app(scope, receive, send_with_metrics)
+
+
+app.add_middleware(RequestMetricsMiddleware)
+
 # Store processed emails in memory (in production, use a database)
 processed_emails_store: List[Dict] = []
 
-# File to persist emails across server restarts
-_emails_store_file = os.path.join(os.path.dirname(__file__), '..', '.processed_emails.json')
-_processed_ids_file = os.path.join(os.path.dirname(__file__), '..', '.processed_email_ids.json')
+# Legacy JSON files, migrated into the SQLite store (storage.py) on first start
+_emails_store_file = storage.state_path('.processed_emails.json')
+_processed_ids_file = storage.state_path('.processed_email_ids.json')
+
+# Maximum number of messages fetched per Gmail HTTP batch request (API limit is 100)
+GMAIL_BATCH_SIZE = 100
 
-# Global variable to store Gmail service
-_gmail_service = None
+# Headers kept on fetched emails for the pre-LLM classifier (classifier.py)
+_CLASSIFIER_HEADERS = ("list-unsubscribe", "list-id", "precedence", "auto-submitted")
+
+# Gmail clients send requests through httplib2.Http, which is not thread-safe,
+# and the queue workers call Gmail from asyncio.to_thread. Each thread gets its
+# own client; the OAuth credentials are shared.
+_gmail_local = threading.local()
+_gmail_credentials = None
+_gmail_credentials_lock = threading.Lock()
 
 # Track processed email IDs to prevent reprocessing
 _processed_email_ids: set = set[Any]()
 
+# Append-only journal persisting _processed_email_ids (one ID per line)
+_processed_ids_journal = ProcessedIdJournal(storage.state_path('.processed_email_ids.journal'))
+
+# Pushes store changes to dashboards connected to /api/events
+_event_bus = events.EventBus()
+
+# Fields left out of email_added events; the dashboard never shows them
+_EVENT_EXCLUDED_FIELDS = ("body", "snippet")
+
+# Minimum seconds between "partial" events for one summary/reply while it streams
+PARTIAL_EVENT_INTERVAL_SECONDS = 0.25
+
+# "eager" drafts a reply for every email while processing it; "lazy" only
+# summarizes, and the reply is drafted the first time it is requested
+REPLY_MODES = ("eager", "lazy")
+REPLY_MODE = os.environ.get("AUTOMAIL_REPLY_MODE", "eager")
+
+# In lazy mode, set AUTOMAIL_PREFETCH_REPLIES=1 to draft missing replies in the background while idle
+PREFETCH_REPLIES = os.environ.get("AUTOMAIL_PREFETCH_REPLIES", "0") == "1"
+PREFETCH_INTERVAL_SECONDS = 10.0
+
+# email_id -> in-flight reply generation, so concurrent requests share one
+_reply_tasks: Dict[str, asyncio.Task] = {}
+
+# email_id -> (text streamed so far, token listeners) of the in-flight reply,
+# so /stream clients can follow a generation started elsewhere
+_reply_streams: Dict[str, Tuple[List[str], List[Callable[[str], None]]]] = {}
+
+# Number of process_and_store_emails calls running; prefetching waits for zero
+_active_processing = 0
+
+# Set when jobs are enqueued so idle queue workers wake up immediately
+_jobs_available = asyncio.Event()
+
+# Idle workers also poll this often, to pick up jobs whose retry backoff has elapsed
+JOB_POLL_SECONDS = 1.0
+
+# Pub/Sub notifications for a mailbox arriving within this many seconds share one sync run
+SYNC_COALESCE_WINDOW_SECONDS = float(os.environ.get("AUTOMAIL_SYNC_COALESCE_WINDOW", "2"))
+
 
 def load_emails_from_disk():
-    """Load processed emails from disk."""
+    """Load processed emails from the SQLite store and replay the processed ID journal."""
     global processed_emails_store, _processed_email_ids
-    if os.path.exists(_emails_store_file):
-        try:
-            with open(_emails_store_file, 'r') as f:
-                data = json.load(f)
-                processed_emails_store = data.get('emails', [])
-                print(f"📂 Loaded {len(processed_emails_store)} emails from disk")
-        except Exception as e:
-            print(f"⚠️  Error loading emails from disk: {e}")
-            processed_emails_store = []
+    legacy_ids: Set[str] = set()
+    json_ids: Optional[Set[str]] = None
+    try:
+        json_ids = storage.migrate_from_json(_emails_store_file, _processed_ids_file)
+        legacy_ids = (json_ids or set()) | storage.load_legacy_processed_ids()
+    except Exception as e:
+        log.warning("Error migrating JSON files to SQLite: %s", e)
     
-    # Load processed email IDs
-    if os.path.exists(_processed_ids_file):
-        try:
-            with open(_processed_ids_file, 'r') as f:
-                data = json.load(f)
-                _processed_email_ids = set(data.get('email_ids', []))
-                print(f"📂 Loaded {len(_processed_email_ids)} processed email IDs")
-        except Exception as e:
-            print(f"⚠️  Error loading processed IDs from disk: {e}")
-            _processed_email_ids = set()
+    try:
+        processed_emails_store = storage.load_emails()
+        log.info("Loaded %d emails from disk", len(processed_emails_store))
+    except Exception as e:
+        log.warning("Error loading emails from disk: %s", e)
+        processed_emails_store = []
+    
+    # Replay the processed ID journal, seeding it from the legacy JSON file or table on first run
+    try:
+        if not _processed_ids_journal.exists():
+            _processed_ids_journal.rewrite(legacy_ids)
+        elif legacy_ids:
+            _processed_ids_journal.append(sorted(legacy_ids))
+            _processed_ids_journal.flush()
+        # Only now that the imported IDs are durable may later starts skip the import
+        if json_ids is not None:
+            storage.mark_json_migrated()
+        storage.drop_legacy_processed_ids()
+        _processed_email_ids = _processed_ids_journal.replay()
+        log.info("Loaded %d processed email IDs", len(_processed_email_ids))
+    except Exception as e:
+        log.warning("Error loading processed IDs from disk: %s", e)
+        _processed_email_ids = set()
 
 
-def save_emails_to_disk():
-    """Save processed emails to disk."""
+def save_emails_to_disk(emails: Optional[List[Dict]] = None, removed_ids: Optional[Set[str]] = None):
+    """
+    Save processed emails to disk.
+    
+    Args:
+        emails: Emails to insert or update. When neither argument is given the
+            whole in-memory store is written and stale rows are deleted.
+        removed_ids: IDs of emails removed from the store
+    """
     try:
-        os.makedirs(os.path.dirname(_emails_store_file), exist_ok=True)
-        # Sort by date (newest first) before saving
-        sorted_emails = sorted(
-            processed_emails_store,
-            key=lambda x: x.get('date', ''),
-            reverse=True
-        )
-        with open(_emails_store_file, 'w') as f:
-            json.dump({'emails': sorted_emails}, f, indent=2)
+        if emails is None and removed_ids is None:
+            store_ids = {e.get('email_id') for e in processed_emails_store}
+            storage.upsert_emails(processed_emails_store)
+            storage.delete_emails(storage.load_email_ids() - store_ids)
+            return
+        if emails:
+            storage.upsert_emails(emails)
+        if removed_ids:
+            storage.delete_emails(removed_ids)
     except Exception as e:
-        print(f"⚠️  Error saving emails to disk: {e}")
+        log.error("Error saving emails to disk: %s", e)
 
 
-def save_processed_ids_to_disk():
-    """Save processed email IDs to disk."""
+def save_processed_ids_to_disk(email_ids: Optional[List[str]] = None):
+    """Append processed email IDs to the journal (rewrites it with all IDs if none are given)."""
     try:
-        os.makedirs(os.path.dirname(_processed_ids_file), exist_ok=True)
-        with open(_processed_ids_file, 'w') as f:
-            json.dump({'email_ids': list(_processed_email_ids)}, f, indent=2)
+        with metrics.timer("automail_persistence_seconds", operation="processed_ids_journal"):
+            if email_ids is None:
+                _processed_ids_journal.rewrite(_processed_email_ids)
+            else:
+                _processed_ids_journal.append(email_ids)
     except Exception as e:
-        print(f"⚠️  Error saving processed IDs to disk: {e}")
+        log.error("Error saving processed IDs to disk: %s", e)
+
+
+def store_processed_emails(processed_emails: List[Dict]) -> List[Dict]:
+    """
+    Add processed emails with a summary or reply to the store, persist them and notify dashboards.
+    
+    An email already in the store (e.g. reprocessed after a failure) is
+    replaced rather than listed twice.
+    
+    Returns:
+        The emails that were stored
+    """
+    valid_emails = [e for e in processed_emails if e.get('summary') or e.get('draft_reply')]
+    if not valid_emails:
+        return []
+    
+    store_positions = {e.get('email_id'): i for i, e in enumerate(processed_emails_store)}
+    new_ids = []
+    for email in valid_emails:
+        email_id = email.get('email_id')
+        if email_id not in _processed_email_ids:
+            new_ids.append(email_id)
+        _processed_email_ids.add(email_id)
+        if email_id in store_positions:
+            processed_emails_store[store_positions[email_id]] = email
+        else:
+            store_positions[email_id] = len(processed_emails_store)
+            processed_emails_store.append(email)
+    
+    # Sort by date (newest first)
+    processed_emails_store.sort(key=lambda x: x.get('date', ''), reverse=True)
+    
+    save_emails_to_disk(valid_emails)
+    if new_ids:
+        save_processed_ids_to_disk(new_ids)
+    
+    for email in valid_emails:
+        _event_bus.publish("email_added", {
+            "email": {k: v for k, v in email.items() if k not in _EVENT_EXCLUDED_FIELDS}
+        })
+    return valid_emails
+
+
+async def process_and_store_emails(emails: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Summarize and draft replies for emails, storing each one as soon as it is done.
+    
+    In lazy reply mode only the summary is generated; see ensure_reply().
+    
+    Returns:
+        Tuple of (emails that were stored, every processing result)
+    """
+    global _active_processing
+    try:
+        from .main import process_emails_async
+    except ImportError:
+        from main import process_emails_async
+    
+    _event_bus.publish("processing", {
+        "count": len(emails),
+        "email_ids": [e.get('id') for e in emails],
+        "emails": [
+            {"email_id": e.get('id'), "from": e.get('from'), "subject": e.get('subject'), "date": e.get('date')}
+            for e in emails
+        ]
+    })
+    
+    # Stream partial summaries/replies to dashboards, throttled per email and field
+    partials: Dict[Tuple[str, str], Dict] = {}
+    
+    def on_token(email_id: str, field: str, token: str):
+        partial = partials.setdefault((email_id, field), {"text": "", "sent_at": 0.0})
+        partial["text"] += token
+        now = time.time()
+        if now - partial["sent_at"] >= PARTIAL_EVENT_INTERVAL_SECONDS:
+            partial["sent_at"] = now
+            _event_bus.publish("partial", {
+                "email_id": email_id,
+                "field": field,
+                "text": partial["text"]
+            }, transient=True)
+    
+    stored: List[Dict] = []
+    
+    def on_result(result: Dict):
+        stored_now = store_processed_emails([result])
+        if not stored_now:
+            # Lets dashboards drop the in-progress card
+            _event_bus.publish("processing_failed", {
+                "email_id": result.get('email_id'),
+                "error": result.get('error')
+            })
+        stored.extend(stored_now)
+    
+    _active_processing += 1
+    try:
+        results = await process_emails_async(
+            emails,
+            generate_reply=REPLY_MODE != "lazy",
+            on_result=on_result,
+            on_token=on_token
+        )
+    finally:
+        _active_processing -= 1
+    return stored, results
+
+
+def apply_generation(email: Dict, task: str, result: Dict):
+    """Store a successful summary ("summary") or reply ("reply") result on an email and notify dashboards."""
+    if result.get('status') != 'success':
+        return
+    if task == "summary":
+        email.update({
+            "summary": result['summary'],
+            "summary_time": result.get('processing_time'),
+            "summary_ttft": result.get('time_to_first_token'),
+        })
+        email.pop('error', None)
+    else:
+        email.update({
+            "draft_reply": result['draft_reply'],
+            "reply_time": result.get('processing_time'),
+            "reply_ttft": result.get('time_to_first_token'),
+        })
+        for field in ('reply_error', 'reply_attempts', 'reply_retry_at'):
+            email.pop(field, None)
+    save_emails_to_disk([email])
+    _event_bus.publish("email_added", {
+        "email": {k: v for k, v in email.items() if k not in _EVENT_EXCLUDED_FIELDS}
+    })
+
+
+async def _generate_reply(email: Dict, tone: str = "professional", use_cache: bool = True) -> Dict:
+    """Draft and store the reply for a stored email, forwarding its text to _reply_streams listeners."""
+    try:
+        from .main import generate_draft_reply_async
+    except ImportError:
+        from main import generate_draft_reply_async
+    
+    streamed, listeners = _reply_streams.setdefault(email.get('email_id'), ([], []))
+    
+    def on_token(token: str):
+        streamed.append(token)
+        for listener in list(listeners):
+            listener(token)
+    
+    result = await generate_draft_reply_async({**email, "id": email.get('email_id')}, tone, use_cache, on_token)
+    if result.get('status') == 'success':
+        apply_generation(email, "reply", result)
+    else:
+        # Idle prefetching retries with backoff, unless the email itself is the problem
+        attempts = email.get('reply_attempts', 0) + 1
+        email['reply_error'] = result.get('error')
+        email['reply_attempts'] = attempts
+        if _is_retryable_failure(result) and attempts < job_queue.MAX_ATTEMPTS:
+            delay = min(job_queue.BACKOFF_MAX_SECONDS, job_queue.BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+            email['reply_retry_at'] = time.time() + delay
+        else:
+            email.pop('reply_retry_at', None)
+        save_emails_to_disk([email])
+    return result
+
+
+def _reply_task(email: Dict, tone: str = "professional", use_cache: bool = True) -> asyncio.Task:
+    """
+    Return the in-flight reply generation of a stored email, starting one if there is none.
+    
+    A generation already running is shared even if it was started with
+    another tone.
+    """
+    email_id = email.get('email_id')
+    task = _reply_tasks.get(email_id)
+    if task is None:
+        _reply_streams[email_id] = ([], [])
+        task = asyncio.ensure_future(_generate_reply(email, tone, use_cache))
+        _reply_tasks[email_id] = task
+        
+        def forget(_):
+            _reply_tasks.pop(email_id, None)
+            _reply_streams.pop(email_id, None)
+        
+        task.add_done_callback(forget)
+    return task
+
+
+async def ensure_reply(email: Dict) -> Dict:
+    """
+    Return the draft reply of a stored email, generating it on first use.
+    
+    Concurrent calls for the same email share one generation; the result is
+    stored with the email (and in the LLM cache), so later calls are free.
+    
+    Returns:
+        Reply result with draft_reply, processing_time and status
+    """
+    if email.get('draft_reply'):
+        return {
+            "draft_reply": email['draft_reply'],
+            "processing_time": email.get('reply_time'),
+            "time_to_first_token": email.get('reply_ttft'),
+            "status": "success",
+            "cached": True
+        }
+    
+    # A client disconnecting doesn't cancel the shared generation
+    return await asyncio.shield(_reply_task(email))
+
+
+def _wants_reply_prefetch(email: Dict, now: float) -> bool:
+    """True if idle prefetching should draft this email's reply (now, or again after a failure)."""
+    if not email.get('email_id') or email.get('draft_reply') or email.get('email_id') in _reply_tasks:
+        return False
+    # Bulk/automated mail skipped by the classifier isn't worth a reply
+    if email.get('category'):
+        return False
+    if email.get('reply_error'):
+        # No reply_retry_at: the error isn't retryable or attempts ran out
+        return email.get('reply_retry_at') is not None and email['reply_retry_at'] <= now
+    return True
+
+
+async def reply_prefetch_loop():
+    """
+    In lazy reply mode, draft missing replies one at a time while nothing else is queued.
+    
+    Failed replies are retried with the job queue's backoff and attempt limit;
+    emails that can't get a reply (e.g. too short) are not retried.
+    """
+    while True:
+        await asyncio.sleep(PREFETCH_INTERVAL_SECONDS)
+        try:
+            if (_active_processing
+                    or job_queue.highest_ready_priority("sync") is not None
+                    or job_queue.highest_ready_priority("process") is not None):
+                continue
+            now = time.time()
+            email = next((e for e in processed_emails_store if _wants_reply_prefetch(e, now)), None)
+            if email is not None:
+                log.info("Idle: prefetching draft reply", extra={"email_id": email.get('email_id')})
+                await ensure_reply(email)
+        except Exception as e:
+            log.warning("Error prefetching draft reply: %s", e)
+
+
+def enqueue_process_jobs(emails: List[Dict], source: str = priority.SOURCE_BACKLOG) -> int:
+    """
+    Queue emails for summarization, one job per email_id, prioritized by priority.score().
+    
+    Emails are fetched messages, or {"id": ...} for messages whose content
+    still has to be fetched. Emails already processed or already queued are
+    skipped. Returns how many jobs were added.
+    """
+    queued = 0
+    for email in emails:
+        email_id = email.get('id')
+        if not email_id or email_id in _processed_email_ids:
+            continue
+        job_id = job_queue.enqueue(
+            "process",
+            {"email": email, "source": source},
+            dedupe_key=email_id,
+            priority=priority.score(email, source)
+        )
+        if job_id is not None:
+            queued += 1
+    if queued:
+        _jobs_available.set()
+    return queued
+
+
+def _is_retryable_failure(result: Dict) -> bool:
+    """True if processing produced nothing and failed for a reason other than the email itself."""
+    if result.get('summary') or result.get('draft_reply'):
+        return False
+    return bool(result.get('error')) and result.get('error') != "Email content too short"
+
+
+def _merge_sync_payloads(queued: Dict, incoming: Dict) -> Dict:
+    """Combine two sync job payloads, keeping the newest notified history ID."""
+    history_ids = [h for h in (queued.get('history_id'), incoming.get('history_id')) if h]
+    return {
+        **queued,
+        "history_id": str(max(history_ids, key=int)) if history_ids else None,
+        "notifications": queued.get('notifications', 1) + incoming.get('notifications', 1),
+    }
+
+
+async def run_sync_job(job: Dict):
+    """Find messages added since the notified history ID and queue them for processing."""
+    # The Gmail client is synchronous; keep it off the event loop
+    message_ids, history_id, sync_mode = await asyncio.to_thread(
+        _with_gmail_service, history_sync.collect_new_message_ids, job['payload'].get('history_id')
+    )
+    new_message_ids = [m for m in message_ids if m not in _processed_email_ids]
+    
+    fetched, fetch_errors = [], {}
+    if new_message_ids:
+        fetched, fetch_errors = await asyncio.to_thread(get_email_contents_batch, new_message_ids)
+    
+    # Messages that failed to fetch are queued by ID and fetched again by their process job
+    emails = [e for e in fetched if e.get('is_unread', True)]
+    emails += [{"id": email_id} for email_id in fetch_errors]
+    queued = enqueue_process_jobs(emails, priority.SOURCE_LIVE)
+    
+    # Only advance once every new message is stored or queued; if anything above
+    # raises, the job is retried from the previous history ID
+    history_sync.save_last_history_id(history_id)
+    log.info("Sync job %s (%s, %d notification(s)): queued %d email(s)", job['id'], sync_mode,
+             job['payload'].get('notifications', 1), queued)
+
+
+async def run_process_jobs(jobs: List[Dict]):
+    """
+    Summarize and draft replies for a batch of claimed process jobs.
+    
+    Jobs run in priority order, DEFAULT_MAX_IN_FLIGHT emails at a time. Between
+    those rounds the rest of the batch is handed back to the queue if a job
+    with a higher priority has arrived, so live emails don't wait behind a
+    backlog.
+    """
+    try:
+        from .main import DEFAULT_MAX_IN_FLIGHT
+    except ImportError:
+        from main import DEFAULT_MAX_IN_FLIGHT
+    
+    pending = []
+    for job in jobs:
+        if job['dedupe_key'] in _processed_email_ids:
+            job_queue.complete(job['id'])
+        else:
+            pending.append(job)
+    
+    # Fetch content for jobs queued by ID only
+    missing = [job['dedupe_key'] for job in pending if 'body' not in job['payload']['email']]
+    fetched_by_id = {}
+    if missing:
+        fetched, _ = await asyncio.to_thread(get_email_contents_batch, missing)
+        fetched_by_id = {e['id']: e for e in fetched}
+    
+    ready = []
+    for job in pending:
+        email = fetched_by_id.get(job['dedupe_key'], job['payload']['email'])
+        if 'body' not in email:
+            status = job_queue.fail(job, "Could not fetch email content")
+            log.warning("Job %s: fetch failed (%s)", job['id'], status, extra={"email_id": job['dedupe_key']})
+        elif not email.get('is_unread', True):
+            job_queue.complete(job['id'])
+        else:
+            # The priority also picks the model (model_router)
+            ready.append((job, {**email, "priority": job['priority']}))
+    
+    round_size = max(1, DEFAULT_MAX_IN_FLIGHT)
+    for start in range(0, len(ready), round_size):
+        remaining = ready[start:]
+        if start:
+            waiting = job_queue.highest_ready_priority("process")
+            if waiting is not None and waiting > remaining[0][0]['priority']:
+                job_queue.release([job for job, _ in remaining])
+                log.info("Yielding %d job(s) to higher-priority work (priority %s)", len(remaining), waiting)
+                return
+        
+        current = remaining[:round_size]
+        _, results = await process_and_store_emails([email for _, email in current])
+        
+        results_by_id = {r.get('email_id'): r for r in results}
+        for job, email in current:
+            result = results_by_id.get(email.get('id'), {"error": "No result"})
+            if _is_retryable_failure(result):
+                status = job_queue.fail(job, result.get('error'))
+                log.warning("Job %s failed (%s): %s", job['id'], status, result.get('error'),
+                            extra={"email_id": email.get('id')})
+            else:
+                job_queue.complete(job['id'])
+
+
+async def job_worker(worker_id: int):
+    """Drain the job queue: sync jobs first, then process jobs in batches."""
+    while True:
+        _jobs_available.clear()
+        try:
+            sync_jobs = job_queue.claim("sync")
+            if sync_jobs:
+                for job in sync_jobs:
+                    try:
+                        await run_sync_job(job)
+                        job_queue.complete(job['id'])
+                    except Exception as e:
+                        status = job_queue.fail(job, str(e))
+                        log.warning("Sync job %s failed (%s): %s", job['id'], status, e)
+                continue
+            
+            process_jobs = job_queue.claim("process", job_queue.QUEUE_BATCH_SIZE)
+            if process_jobs:
+                try:
+                    await run_process_jobs(process_jobs)
+                except Exception as e:
+                    for job in process_jobs:
+                        job_queue.fail(job, str(e))
+                    log.error("Worker %d: batch of %d job(s) failed: %s", worker_id, len(process_jobs), e)
+                continue
+            
+            job_queue.purge_finished()
+        except Exception as e:
+            log.error("Worker %d: error reading job queue: %s", worker_id, e)
+        
+        try:
+            await asyncio.wait_for(_jobs_available.wait(), timeout=JOB_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
 
 
 # Load emails on startup
@@ -95,36 +625,26 @@ load_emails_from_disk()
 
 
 async def fetch_and_process_all_unread_emails():
-    """Fetch all unread emails on startup and process them."""
-    print("\n" + "="*60)
-    print("🚀 Starting AutoMail - Fetching all unread emails...")
-    print("="*60)
+    """Fetch all unread emails on startup and queue them for processing."""
+    log.info("Starting AutoMail, fetching all unread emails")
     
     try:
-        service = get_gmail_service()
-        
-        # Get all unread emails from INBOX
-        messages = service.users().messages().list(
-            userId='me',
-            labelIds=['INBOX', 'UNREAD'],
-            maxResults=50
-        ).execute()
+        # Record where incremental sync starts if this is the first run (the
+        # Gmail client is synchronous; keep it off the event loop)
+        if history_sync.load_last_history_id() is None:
+            history_id = await asyncio.to_thread(_with_gmail_service, get_current_history_id)
+            history_sync.save_last_history_id(history_id)
         
-        message_list = messages.get('messages', [])
-        print(f"📬 Found {len(message_list)} unread email(s)")
+        # Get all unread emails from INBOX, fetched in batched round trips
+        fetched, _ = await asyncio.to_thread(_with_gmail_service, fetch_unread_inbox_emails, 50)
         
-        if not message_list:
-            print("✅ No unread emails to process")
+        if not fetched:
+            log.info("No unread emails to process")
             return
         
-        # Fetch email content
-        emails = []
-        for msg in message_list:
-            email_data = get_email_content(msg['id'])
-            if email_data and email_data.get('is_unread', True):
-                emails.append(email_data)
+        emails = [e for e in fetched if e.get('is_unread', True)]
         
-        print(f"📧 Processing {len(emails)} unread email(s)...")
+        log.info("Processing %d unread email(s)", len(emails))
         
         # Filter out already processed
         new_emails = [
@@ -133,49 +653,78 @@ async def fetch_and_process_all_unread_emails():
         ]
         
         if not new_emails:
-            print("✅ All unread emails have already been processed")
+            log.info("All unread emails have already been processed")
             return
         
-        print(f"🆕 {len(new_emails)} new email(s) to process")
-        
-        # Process emails
-        try:
-            from .main import process_emails
-        except ImportError:
-            from main import process_emails
-        
-        processed_emails = process_emails(new_emails, generate_reply=True)
-        
-        # Store only emails with valid content
-        valid_emails = []
-        for email in processed_emails:
-            if email.get('summary') or email.get('draft_reply'):
-                email_id = email.get('email_id')
-                _processed_email_ids.add(email_id)
-                processed_emails_store.append(email)
-                valid_emails.append(email)
-        
-        # Sort by date
-        processed_emails_store.sort(key=lambda x: x.get('date', ''), reverse=True)
+        # Queue emails; the job workers store and push each one when ready
+        queued = enqueue_process_jobs(new_emails)
         
-        # Save to disk
-        save_emails_to_disk()
-        save_processed_ids_to_disk()
+        log.info("Queued %d new email(s) for processing", queued)
         
-        print(f"✅ Processed and stored {len(valid_emails)} email(s)")
-        print("="*60 + "\n")
-        
-    except Exception as e:
-        print(f"❌ Error fetching unread emails on startup: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        log.exception("Error fetching unread emails on startup")
 
 
 @app.on_event("startup")
 async def startup_event():
     """Run on application startup."""
+    try:
+        from . import model_manager, model_router
+    except ImportError:
+        import model_manager
+        import model_router
+    
+    # Load the models before the first email needs them
+    if model_manager.WARMUP_ENABLED:
+        for model in model_router.primary_models():
+            asyncio.create_task(model_manager.warm_up(model))
     # Fetch all unread emails in background
     asyncio.create_task(fetch_and_process_all_unread_emails())
+    # Keep read/unread status of stored emails up to date in background
+    asyncio.create_task(unread_reconciliation_loop())
+    # Drain the sync/process job queue
+    for worker_id in range(job_queue.QUEUE_WORKERS):
+        asyncio.create_task(job_worker(worker_id))
+    if REPLY_MODE not in REPLY_MODES:
+        log.warning("Unknown AUTOMAIL_REPLY_MODE %r, drafting replies eagerly", REPLY_MODE)
+    if REPLY_MODE == "lazy" and PREFETCH_REPLIES:
+        asyncio.create_task(reply_prefetch_loop())
+
+
+def remove_read_emails_from_store() -> int:
+    """Drop emails the last reconciliation found to be read. Returns how many were removed."""
+    read_ids = {
+        e.get('email_id') for e in processed_emails_store
+        if e.get('email_id') and not unread_status.is_unread(e.get('email_id'))
+    }
+    if not read_ids:
+        return 0
+    
+    for email_id in read_ids:
+        log.debug("Removing read email from store", extra={"email_id": email_id})
+    processed_emails_store[:] = [
+        e for e in processed_emails_store
+        if e.get('email_id') not in read_ids
+    ]
+    save_emails_to_disk(removed_ids=read_ids)
+    _event_bus.publish("email_removed", {"email_ids": sorted(read_ids), "reason": "read"})
+    return len(read_ids)
+
+
+async def unread_reconciliation_loop():
+    """Periodically reconcile the unread status of stored emails with Gmail in bulk."""
+    while True:
+        email_ids = [e.get('email_id') for e in processed_emails_store if e.get('email_id')]
+        if email_ids:
+            try:
+                # The Gmail client is synchronous; keep it off the event loop
+                await asyncio.to_thread(_with_gmail_service, unread_status.reconcile, email_ids)
+                removed = remove_read_emails_from_store()
+                if removed:
+                    log.info("Unread reconciliation removed %d read email(s)", removed)
+            except Exception as e:
+                log.warning("Error reconciling unread status: %s", e)
+        await asyncio.sleep(unread_status.RECONCILE_INTERVAL_SECONDS)
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -198,7 +747,7 @@ async def root_post(request: Request):
         body = await request.json()
         # Check if this looks like a Pub/Sub message
         if "message" in body:
-            print("⚠️  Received Pub/Sub message at root endpoint. Redirecting to /pubsub/gmail")
+            log.warning("Received Pub/Sub message at root endpoint, redirecting to /pubsub/gmail")
             # Forward to the actual endpoint
             return await gmail_pubsub_listener(request)
         else:
@@ -215,12 +764,39 @@ async def root_post(request: Request):
 
 
 def get_gmail_service():
-    """Initialize and return Gmail API service instance."""
-    global _gmail_service
+    """Initialize and return the calling thread's Gmail API service instance."""
+    service = getattr(_gmail_local, 'service', None)
+    if service is not None:
+        return service
     
-    if _gmail_service is not None:
-        return _gmail_service
+    if GMAIL_API_URL:
+        # Google's API description with every URL (batch requests included) pointed at the stand-in
+        document = json.loads(discovery_cache.get_static_doc('gmail', 'v1'))
+        document['rootUrl'] = GMAIL_API_URL.rstrip('/') + '/'
+        service = build_from_document(document, credentials=AnonymousCredentials())
+    else:
+        service = build('gmail', 'v1', credentials=get_gmail_credentials())
+    _gmail_local.service = service
+    return service
+
+
+def _with_gmail_service(func: Callable, *args):
+    """Call func(service, *args) with the Gmail service of the thread it runs on."""
+    return func(get_gmail_service(), *args)
+
+
+def get_gmail_credentials():
+    """Load (or obtain through the OAuth flow) the credentials shared by every Gmail client."""
+    global _gmail_credentials
     
+    with _gmail_credentials_lock:
+        if _gmail_credentials is None:
+            _gmail_credentials = _load_gmail_credentials()
+        return _gmail_credentials
+
+
+def _load_gmail_credentials():
+    """Read token.json, refreshing or re-authorizing when it is no longer valid."""
     creds = None
     token_path = os.path.join(os.path.dirname(__file__), '..', 'token.json')
     credentials_path = os.path.join(os.path.dirname(__file__), '..', 'credentials.json')
@@ -247,8 +823,7 @@ def get_gmail_service():
         with open(token_path, 'w') as token:
             token.write(creds.to_json())
     
-    _gmail_service = build('gmail', 'v1', credentials=creds)
-    return _gmail_service
+    return creds
 
 
 def decode_mime_words(s):
@@ -269,137 +844,224 @@ def get_email_content(message_id: str) -> Dict:
     """Fetch and parse email content by message ID."""
     try:
         service = get_gmail_service()
-        message = service.users().messages().get(userId='me', id=message_id, format='full').execute()
-        
-        # Extract headers
-        headers = message['payload'].get('headers', [])
-        email_data = {
-            'id': message_id,
-            'threadId': message.get('threadId'),
-            'snippet': message.get('snippet', ''),
-            'from': '',
-            'to': '',
-            'subject': '',
-            'date': '',
-            'body': ''
-        }
-        
-        # Parse headers
-        for header in headers:
-            name = header['name'].lower()
-            value = header['value']
-            
-            if name == 'from':
-                email_data['from'] = decode_mime_words(value)
-            elif name == 'to':
-                email_data['to'] = decode_mime_words(value)
-            elif name == 'subject':
-                email_data['subject'] = decode_mime_words(value)
-            elif name == 'date':
-                email_data['date'] = value
-        
-        # Extract body - handle different MIME types
-        payload = message['payload']
-        body_text = ""
-        html_body = ""
-        
-        def extract_body(part):
-            """Recursively extract body from email parts."""
-            nonlocal body_text, html_body
-            mime_type = part.get('mimeType', '')
-            
-            # Get body data if available
-            if part.get('body', {}).get('data'):
-                data = part['body']['data']
-                try:
-                    decoded = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
-                    if mime_type == 'text/plain':
-                        body_text += decoded + "\n"
-                    elif mime_type == 'text/html':
-                        html_body += decoded + "\n"
-                    else:
-                        # For other types, try to extract text
-                        body_text += decoded + "\n"
-                except Exception as e:
-                    print(f"   Warning: Could not decode body part: {e}")
-            
-            # Recursively process parts
-            if 'parts' in part:
-                for subpart in part['parts']:
-                    extract_body(subpart)
-        
-        extract_body(payload)
-        
-        # Prefer plain text, fall back to HTML (stripped), then snippet
-        if body_text.strip():
-            email_data['body'] = body_text.strip()
-        elif html_body.strip():
-            # Simple HTML stripping (remove tags)
-            email_data['body'] = re.sub('<[^<]+?>', '', html_body).strip()
+        message = metrics.gmail_execute(
+            service.users().messages().get(userId='me', id=message_id, format='full'), "messages.get"
+        )
+        with logs.email_context(message_id):
+            return parse_email_message(message_id, message)
+    
+    except HttpError as error:
+        log.error("Error fetching email: %s", error, extra={"email_id": message_id})
+        return None
+
+
+def get_email_contents_batch(message_ids: List[str], service=None) -> Tuple[List[Dict], Dict[str, str]]:
+    """
+    Fetch and parse several emails using Gmail HTTP batch requests.
+    
+    Up to GMAIL_BATCH_SIZE messages are retrieved per round trip. A failure
+    for one message is reported in the returned errors and does not affect
+    the rest of the batch.
+    
+    Args:
+        message_ids: Gmail message IDs to fetch
+        service: Gmail API service (default: get_gmail_service())
+    
+    Returns:
+        Tuple of (parsed emails in input order, {message_id: error message})
+    """
+    service = service or get_gmail_service()
+    message_ids = list(dict.fromkeys(message_ids))  # batch request IDs must be unique
+    messages: Dict[str, Dict] = {}
+    errors: Dict[str, str] = {}
+    
+    def on_response(request_id, response, exception):
+        if exception is not None:
+            errors[request_id] = str(exception)
         else:
-            # Fall back to snippet if no body found
-            email_data['body'] = email_data.get('snippet', '')
-        
-        # Debug: log body extraction results
-        body_len = len(email_data['body'])
-        snippet_len = len(email_data.get('snippet', ''))
-        
-        print(f"   📄 Body extraction: body={body_len} chars, snippet={snippet_len} chars")
+            messages[request_id] = response
+    
+    for start in range(0, len(message_ids), GMAIL_BATCH_SIZE):
+        chunk = message_ids[start:start + GMAIL_BATCH_SIZE]
+        batch = service.new_batch_http_request(callback=on_response)
+        for message_id in chunk:
+            batch.add(
+                service.users().messages().get(userId='me', id=message_id, format='full'),
+                request_id=message_id
+            )
+        try:
+            metrics.gmail_execute(batch, "batch", calls=len(chunk))
+        except Exception as e:
+            # The whole round trip failed; mark whatever didn't come back
+            for message_id in chunk:
+                if message_id not in messages and message_id not in errors:
+                    errors[message_id] = str(e)
+        # Every ID ends up fetched or in errors, so callers can retry what is missing
+        for message_id in chunk:
+            if message_id not in messages and message_id not in errors:
+                errors[message_id] = "No response in batch"
+    
+    emails = []
+    for message_id in message_ids:
+        if message_id not in messages:
+            continue
+        try:
+            with logs.email_context(message_id):
+                emails.append(parse_email_message(message_id, messages[message_id]))
+        except Exception as e:
+            errors[message_id] = f"Could not parse message: {e}"
+    
+    if errors:
+        log.warning("Batch fetch: %d of %d message(s) failed", len(errors), len(message_ids),
+                    extra={"errors": errors})
+    
+    return emails, errors
+
+
+@metrics.timed("automail_mime_parse_seconds")
+def parse_email_message(message_id: str, message: Dict) -> Dict:
+    """Parse a Gmail API message (format='full') into an email dictionary."""
+    # Extract headers
+    headers = message['payload'].get('headers', [])
+    email_data = {
+        'id': message_id,
+        'threadId': message.get('threadId'),
+        'snippet': message.get('snippet', ''),
+        'is_unread': 'UNREAD' in message.get('labelIds', ['UNREAD']),
+        'from': '',
+        'to': '',
+        'subject': '',
+        'date': '',
+        'body': '',
+        # Mailing-list/automation headers used by the pre-LLM classifier
+        'headers': {}
+    }
+    
+    # Parse headers
+    for header in headers:
+        name = header['name'].lower()
+        value = header['value']
+        
+        if name == 'from':
+            email_data['from'] = decode_mime_words(value)
+        elif name == 'to':
+            email_data['to'] = decode_mime_words(value)
+        elif name == 'subject':
+            email_data['subject'] = decode_mime_words(value)
+        elif name == 'date':
+            email_data['date'] = value
+        elif name in _CLASSIFIER_HEADERS:
+            email_data['headers'][name] = value
+    
+    # Extract body - handle different MIME types
+    payload = message['payload']
+    body_text = ""
+    html_body = ""
+    
+    def extract_body(part):
+        """Recursively extract body from email parts."""
+        nonlocal body_text, html_body
+        mime_type = part.get('mimeType', '')
+        
+        # Get body data if available
+        if part.get('body', {}).get('data'):
+            data = part['body']['data']
+            try:
+                decoded = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
+                if mime_type == 'text/plain':
+                    body_text += decoded + "\n"
+                elif mime_type == 'text/html':
+                    html_body += decoded + "\n"
+                else:
+                    # For other types, try to extract text
+                    body_text += decoded + "\n"
+            except Exception as e:
+                log.warning("Could not decode body part: %s", e)
         
-        # If body is empty or very short, use snippet (which Gmail provides)
-        # Gmail snippets are usually reliable and contain the key content
-        if body_len < 30 and snippet_len > 0:
-            # Prefer snippet if body is too short, but keep both
-            if snippet_len > body_len:
-                print(f"   ⚠️  Body too short ({body_len} chars), using snippet ({snippet_len} chars) instead")
-                email_data['body'] = email_data.get('snippet', '')
-            else:
-                # Keep body even if short, but also ensure snippet is available
-                print(f"   ℹ️  Body is short ({body_len} chars), snippet available ({snippet_len} chars)")
-        elif body_len == 0 and snippet_len > 0:
-            # No body at all, use snippet
-            print(f"   ⚠️  No body found, using snippet ({snippet_len} chars)")
+        # Recursively process parts
+        if 'parts' in part:
+            for subpart in part['parts']:
+                extract_body(subpart)
+    
+    extract_body(payload)
+    
+    # Prefer plain text, fall back to HTML (stripped), then snippet
+    if body_text.strip():
+        email_data['body'] = body_text.strip()
+    elif html_body.strip():
+        # Simple HTML stripping (remove tags)
+        email_data['body'] = re.sub('<[^<]+?>', '', html_body).strip()
+    else:
+        # Fall back to snippet if no body found
+        email_data['body'] = email_data.get('snippet', '')
+    
+    # Debug: log body extraction results
+    body_len = len(email_data['body'])
+    snippet_len = len(email_data.get('snippet', ''))
+    
+    log.debug("Body extraction: body=%d chars, snippet=%d chars", body_len, snippet_len, extra=logs.HOT)
+    
+    # If body is empty or very short, use snippet (which Gmail provides)
+    # Gmail snippets are usually reliable and contain the key content
+    if body_len < 30 and snippet_len > 0:
+        # Prefer snippet if body is too short, but keep both
+        if snippet_len > body_len:
+            log.debug("Body too short (%d chars), using snippet (%d chars) instead", body_len, snippet_len)
             email_data['body'] = email_data.get('snippet', '')
-        elif body_len < 10 and snippet_len < 10:
-            # Both are very short, try to combine
-            combined = (email_data.get('body', '') + ' ' + email_data.get('snippet', '')).strip()
-            if len(combined) > 0:
-                email_data['body'] = combined
-                print(f"   ✅ Combined body and snippet: {len(combined)} chars")
-            else:
-                print(f"   ⚠️  Both body and snippet are very short. Body: {body_len} chars, Snippet: {snippet_len} chars")
-        
-        return email_data
+        else:
+            # Keep body even if short, but also ensure snippet is available
+            log.debug("Body is short (%d chars), snippet available (%d chars)", body_len, snippet_len)
+    elif body_len == 0 and snippet_len > 0:
+        # No body at all, use snippet
+        log.debug("No body found, using snippet (%d chars)", snippet_len)
+        email_data['body'] = email_data.get('snippet', '')
+    elif body_len < 10 and snippet_len < 10:
+        # Both are very short, try to combine
+        combined = (email_data.get('body', '') + ' ' + email_data.get('snippet', '')).strip()
+        if len(combined) > 0:
+            email_data['body'] = combined
+            log.debug("Combined body and snippet: %d chars", len(combined))
+        else:
+            log.warning("Both body and snippet are very short: body %d chars, snippet %d chars",
+                        body_len, snippet_len)
     
-    except HttpError as error:
-        print(f"An error occurred: {error}")
-        return None
+    return email_data
+
+
+
+def get_current_history_id(service) -> Optional[str]:
+    """Return the mailbox's current history ID."""
+    profile = metrics.gmail_execute(service.users().getProfile(userId='me'), "users.getProfile")
+    return profile.get('historyId')
 
 
+def fetch_unread_inbox_emails(service, max_results: int) -> Tuple[List[Dict], Dict[str, str]]:
+    """
+    List up to max_results unread INBOX messages and fetch them in batched round trips.
+    
+    Returns:
+        Tuple of (emails, errors), as returned by get_email_contents_batch
+    """
+    messages = metrics.gmail_execute(service.users().messages().list(
+        userId='me',
+        labelIds=['INBOX', 'UNREAD'],
+        maxResults=max_results
+    ), "messages.list")
+    
+    message_ids = [msg['id'] for msg in messages.get('messages', [])]
+    log.info("Found %d unread message(s) in INBOX", len(message_ids))
+    return get_email_contents_batch(message_ids, service)
+
 
 def get_unread_emails() -> List[Dict]:
     """Fetch all unread emails from INBOX."""
     try:
-        service = get_gmail_service()
-        
-        # Get all unread messages from INBOX
-        messages = service.users().messages().list(
-            userId='me',
-            labelIds=['INBOX', 'UNREAD'],
-            maxResults=50
-        ).execute()
+        fetched, _ = fetch_unread_inbox_emails(get_gmail_service(), 50)
         
-        emails = []
-        if 'messages' in messages:
-            for msg in messages['messages']:
-                email_data = get_email_content(msg['id'])
-                # Only include unread emails
-                if email_data and email_data.get('is_unread', True):
-                    emails.append(email_data)
-        
-        return emails
+        # Only include unread emails
+        return [e for e in fetched if e.get('is_unread', True)]
     except Exception as e:
-        print(f"   ❌ Error fetching unread emails: {e}")
+        log.error("Error fetching unread emails: %s", e)
         return []
 
 
@@ -407,40 +1069,54 @@ def check_email_unread_status(email_id: str) -> bool:
     """Check if an email is still unread in Gmail."""
     try:
         service = get_gmail_service()
-        message = service.users().messages().get(
+        message = metrics.gmail_execute(service.users().messages().get(
             userId='me', 
             id=email_id, 
             format='metadata'
-        ).execute()
+        ), "messages.get")
         labels = message.get('labelIds', [])
         is_unread = 'UNREAD' in labels
-        print(f"   📬 Email {email_id}: {'UNREAD' if is_unread else 'READ'}")
+        log.debug("Email is %s", 'UNREAD' if is_unread else 'READ', extra={"email_id": email_id})
         return is_unread
     except HttpError as e:
         if e.resp.status == 404:
             # Email not found, assume it's been deleted/archived, treat as read
-            print(f"   ⚠️  Email {email_id} not found (404), treating as read")
+            log.warning("Email not found (404), treating as read", extra={"email_id": email_id})
             return False
-        print(f"   ⚠️  Error checking unread status for {email_id}: {e}")
         # On error, assume unread to be safe (don't hide emails due to API errors)
-        print(f"   ⚠️  Assuming unread due to error (to avoid hiding valid emails)")
+        log.warning("Error checking unread status, assuming unread: %s", e, extra={"email_id": email_id})
         return True
     except Exception as e:
-        print(f"   ⚠️  Error checking unread status for {email_id}: {e}")
         # On error, assume unread to be safe (don't hide emails due to API errors)
-        print(f"   ⚠️  Assuming unread due to error (to avoid hiding valid emails)")
+        log.warning("Error checking unread status, assuming unread: %s", e, extra={"email_id": email_id})
         return True
 
 
 @app.get("/api/emails")
-async def get_emails():
-    """API endpoint to get all processed emails - only returns unread emails."""
-    print(f"   📊 get_emails called: {len(processed_emails_store)} emails in store")
+async def get_emails(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    filter_name: str = Query("all", alias="filter"),
+    q: Optional[str] = None,
+    fields: Optional[str] = None,
+    tz_offset: int = 0
+):
+    """
+    API endpoint to get processed emails - only returns unread emails (as of the last reconciliation).
+    
+    Query parameters:
+        limit: Page size; omit to get every email
+        cursor: next_cursor from the previous page
+        filter: all, today or recent
+        q: Search text (sender, subject, summary, reply, body)
+        fields: Comma-separated fields to return, e.g. "subject,summary"
+        tz_offset: Client timezone offset in minutes (JS getTimezoneOffset) for today/recent
+    """
+    log.debug("get_emails called: %d emails in store", len(processed_emails_store), extra=logs.HOT)
     
     # Clean up duplicates, failed entries, and read emails
     seen_ids = set()
     cleaned_emails = []
-    read_emails_removed = 0
     error_only_removed = 0
     
     for email in processed_emails_store:
@@ -448,7 +1124,7 @@ async def get_emails():
         
         # Skip duplicates
         if email_id and email_id in seen_ids:
-            print(f"   ⚠️  Duplicate email ID: {email_id}")
+            log.debug("Duplicate email ID", extra={**logs.HOT, "email_id": email_id})
             continue
         if email_id:
             seen_ids.add(email_id)
@@ -460,63 +1136,204 @@ async def get_emails():
         
         if has_only_error:
             # Skip emails that only have errors (like "content too short")
-            print(f"   ⚠️  Skipping email with only error (no valid content): {email_id}")
+            log.debug("Skipping email with only an error", extra={**logs.HOT, "email_id": email_id})
             error_only_removed += 1
             continue
         
         if not has_valid_content:
-            print(f"   ⚠️  Skipping email with no valid content: {email_id}")
+            log.debug("Skipping email with no valid content", extra={**logs.HOT, "email_id": email_id})
             continue
         
         cleaned_emails.append(email)
     
-    # Check unread status and remove read emails from store
-    emails_to_remove = []
-    for email in processed_emails_store:
-        email_id = email.get('email_id')
-        if email_id:
-            try:
-                is_unread = check_email_unread_status(email_id)
-                if not is_unread:
-                    print(f"   🗑️  Removing read email from store: {email_id}")
-                    emails_to_remove.append(email_id)
-                    read_emails_removed += 1
-            except Exception as e:
-                # On error, keep the email
-                pass
-    
-    # Remove read emails from store
-    if emails_to_remove:
-        processed_emails_store[:] = [
-            e for e in processed_emails_store
-            if e.get('email_id') not in emails_to_remove
-        ]
-        save_emails_to_disk()
+    # Read/unread status comes from the background reconciliation, no Gmail calls here
+    read_emails_removed = remove_read_emails_from_store()
+    if read_emails_removed:
+        cleaned_emails = [e for e in cleaned_emails if unread_status.is_unread(e.get('email_id'))]
     
     # Update store with cleaned version and sort
     processed_emails_store.sort(key=lambda x: x.get('date', ''), reverse=True)
-    cleaned_emails.sort(key=lambda x: x.get('date', ''), reverse=True)
     
-    print(f"   📊 Returning {len(cleaned_emails)} emails (removed {read_emails_removed} read, {error_only_removed} error-only)")
+    try:
+        page = email_query.query_emails(
+            cleaned_emails,
+            limit=limit,
+            cursor=cursor,
+            filter_name=filter_name,
+            search=q,
+            fields=fields,
+            tz_offset_minutes=tz_offset
+        )
+    except email_query.InvalidQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    log.debug("Returning %d of %d emails (removed %d read, %d error-only)", len(page['emails']), page['total'],
+              read_emails_removed, error_only_removed, extra=logs.HOT)
+    
+    return page
+
+
+@app.get("/api/events")
+async def stream_events(request: Request):
+    """
+    Server-Sent Events stream of store changes for the dashboard.
+    
+    Events:
+        processing: new emails were fetched and are being summarized
+        partial: text generated so far for an email being processed (not replayed)
+        email_added: an email's summary/reply is ready (payload has the email without body/snippet)
+        processing_failed: an email could not be summarized and was not stored
+        email_removed: emails were read in Gmail and left the store
+        reset: the client's list is stale and should be reloaded
+    
+    Reconnecting clients send Last-Event-ID and receive the events they missed.
+    """
+    queue = _event_bus.subscribe(request.headers.get('last-event-id'))
+    
+    async def event_stream():
+        try:
+            # Ask the browser to reconnect after 3 seconds if the connection drops
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=events.KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield events.format_sse(event)
+        finally:
+            _event_bus.unsubscribe(queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/api/emails/{email_id}/reply")
+async def get_reply(email_id: str):
+    """
+    Return an email's draft reply, generating it the first time it is requested.
+    
+    Used in lazy reply mode, where processing only produces the summary.
+    """
+    email = next((e for e in processed_emails_store if e.get('email_id') == email_id), None)
+    if email is None:
+        raise HTTPException(status_code=404, detail="Email not found")
+    
+    result = await ensure_reply(email)
+    if result.get('status') != 'success':
+        raise HTTPException(status_code=502, detail=f"Could not generate reply: {result.get('error')}")
+    return {"email_id": email_id, **result}
+
+
+@app.get("/api/emails/{email_id}/stream")
+async def stream_generation(email_id: str, task: str = "summary", tone: str = "professional",
+                            refresh: bool = False):
+    """
+    Regenerate an email's summary or draft reply, streaming the text as it is generated.
+    
+    Server-Sent Events: "token" events carry each piece of text, then a "done"
+    event carries the result (with processing_time and time_to_first_token).
+    A successful result replaces the stored summary/reply.
+    
+    Replies go through the same shared generation as ensure_reply: a reply
+    already being drafted (e.g. by prefetching) is followed instead of
+    started again, and a client disconnecting doesn't cancel it.
     
-    if read_emails_removed > 0 or error_only_removed > 0:
-        save_emails_to_disk()
+    Query parameters:
+        task: summary or reply
+        tone: Reply tone (professional, casual, friendly)
+        refresh: Skip the LLM cache and generate a new text
+    """
+    try:
+        from .main import summarize_email_async
+    except ImportError:
+        from main import summarize_email_async
+    
+    if task not in ("summary", "reply"):
+        raise HTTPException(status_code=400, detail="task must be summary or reply")
+    email = next((e for e in processed_emails_store if e.get('email_id') == email_id), None)
+    if email is None:
+        raise HTTPException(status_code=404, detail="Email not found")
+    email_data = {**email, "id": email_id}
+    
+    async def event_stream():
+        tokens: asyncio.Queue = asyncio.Queue()
+        listeners: List[Callable[[str], None]] = []
+        if task == "summary":
+            task_future = asyncio.ensure_future(summarize_email_async(email_data, not refresh, tokens.put_nowait))
+        else:
+            task_future = _reply_task(email, tone, not refresh)
+            # Catch up on the text a shared generation has already streamed
+            streamed, listeners = _reply_streams.get(email_id, ([], []))
+            for token in streamed:
+                tokens.put_nowait(token)
+            listeners.append(tokens.put_nowait)
+        # None marks the end of the token stream
+        task_future.add_done_callback(lambda _: tokens.put_nowait(None))
+        try:
+            while True:
+                token = await tokens.get()
+                if token is None:
+                    break
+                yield events.format_sse({"id": None, "type": "token", "data": {"text": token}})
+            
+            result = task_future.result()
+            if task == "summary":
+                # _generate_reply stores replies itself
+                apply_generation(email, task, result)
+            yield events.format_sse({"id": None, "type": "done", "data": {"task": task, "result": result}})
+        finally:
+            if tokens.put_nowait in listeners:
+                listeners.remove(tokens.put_nowait)
+            # Client went away mid-summary: stop it (a shared reply keeps going)
+            if task == "summary" and not task_future.done():
+                task_future.cancel()
     
-    return {"emails": cleaned_emails}
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @app.get("/api/debug")
 async def debug_info():
     """Debug endpoint to check system status."""
+    try:
+        from .main import get_last_batch_stats
+        from . import classifier, llm_cache, model_manager, threads
+    except ImportError:
+        from main import get_last_batch_stats
+        import classifier
+        import llm_cache
+        import model_manager
+        import threads
+    
     return {
         "store_count": len(processed_emails_store),
         "processed_ids_count": len(_processed_email_ids),
+        "last_batch_stats": get_last_batch_stats(),
+        "llm_cache": llm_cache.get_stats(),
+        "model": model_manager.get_stats(),
+        "classifier": classifier.get_stats(),
+        "threads": threads.get_stats(),
+        "unread_reconciliation": unread_status.get_stats(),
+        "events": _event_bus.get_stats(),
+        "job_queue": job_queue.get_stats(),
+        "priority_rules": priority.get_rules(),
+        "reply_mode": REPLY_MODE,
+        "reply_prefetch": PREFETCH_REPLIES,
+        "logging": logs.get_stats(),
         "store_emails": [
             {
                 "email_id": e.get('email_id'),
                 "subject": e.get('subject'),
                 "has_summary": bool(e.get('summary')),
                 "has_reply": bool(e.get('draft_reply')),
+                "category": e.get('category'),
                 "has_error": bool(e.get('error')),
                 "error": e.get('error')
             }
@@ -527,33 +1344,29 @@ async def debug_info():
 
 @app.post("/api/fetch-emails")
 async def fetch_emails_manually():
-    """Manually trigger email fetching - useful for testing."""
+    """
+    Manually trigger email fetching - useful for testing.
+    
+    New unread emails go through the job queue like notified ones, so an
+    email that is also being processed from a notification is only
+    processed once.
+    """
     try:
-        service = get_gmail_service()
+        # The Gmail client is synchronous; keep it off the event loop
+        current_history_id = await asyncio.to_thread(_with_gmail_service, get_current_history_id)
         
-        # Get current profile to get history ID
-        profile = service.users().getProfile(userId='me').execute()
-        current_history_id = profile.get('historyId')
-        
-        print(f"   🔍 Manual fetch triggered - History ID: {current_history_id}")
+        log.info("Manual fetch triggered, history ID %s", current_history_id)
         
         # Get recent unread messages from INBOX
-        messages = service.users().messages().list(
-            userId='me',
-            labelIds=['INBOX', 'UNREAD'],
-            maxResults=10
-        ).execute()
-        
-        print(f"   📬 Found {len(messages.get('messages', []))} unread message(s) in INBOX")
+        fetched, fetch_errors = await asyncio.to_thread(_with_gmail_service, fetch_unread_inbox_emails, 10)
         
         emails = []
-        if 'messages' in messages:
-            for msg in messages['messages']:
-                email_data = get_email_content(msg['id'])
-                # Only include unread emails
-                if email_data and email_data.get('is_unread', True):
-                    emails.append(email_data)
-                    print(f"   ✅ Found unread email: {email_data.get('subject', 'No Subject')}")
+        for email_data in fetched:
+            # Only include unread emails
+            if email_data.get('is_unread', True):
+                emails.append(email_data)
+                log.debug("Found unread email", extra={"email_id": email_data.get('id'),
+                                                       "subject": email_data.get('subject', 'No Subject')})
         
         if not emails:
             return {
@@ -562,14 +1375,6 @@ async def fetch_emails_manually():
                 "emails_count": 0
             }
         
-        # Process the emails
-        try:
-            from .main import process_emails
-        except ImportError:
-            from main import process_emails
-        
-        print(f"\n🤖 Processing {len(emails)} email(s) with Ollama...")
-        
         # Filter out already processed emails
         new_emails_to_process = []
         for email in emails:
@@ -579,11 +1384,11 @@ async def fetch_emails_manually():
                 continue
             
             if email_id in _processed_email_ids:
-                print(f"   ⚠️  Skipping already processed email ID: {email_id}")
+                log.debug("Skipping already processed email", extra={"email_id": email_id})
                 continue
             
             if any(e.get('email_id') == email_id for e in processed_emails_store):
-                print(f"   ⚠️  Skipping duplicate email ID in store: {email_id}")
+                log.debug("Skipping email already in the store", extra={"email_id": email_id})
                 continue
             
             new_emails_to_process.append(email)
@@ -595,41 +1400,20 @@ async def fetch_emails_manually():
                 "emails_count": 0
             }
         
-        processed_emails = process_emails(new_emails_to_process, generate_reply=True)
-        
-        print(f"   📊 Processing complete: {len(processed_emails)} emails processed")
-        
-        # Clean up: Only keep emails with valid content
-        valid_emails = []
-        for email in processed_emails:
-            has_summary = bool(email.get('summary'))
-            has_reply = bool(email.get('draft_reply'))
-            
-            if has_summary or has_reply:
-                valid_emails.append(email)
-                email_id = email.get('email_id')
-                _processed_email_ids.add(email_id)
-                processed_emails_store.append(email)
-                print(f"   ✅ Stored valid email: {email_id}")
-        
-        # Sort by date
-        processed_emails_store.sort(key=lambda x: x.get('date', ''), reverse=True)
+        # Emails already queued (e.g. by a notification) are not added again
+        queued = enqueue_process_jobs(new_emails_to_process, priority.SOURCE_LIVE)
         
-        # Save to disk
-        save_emails_to_disk()
-        save_processed_ids_to_disk()
+        log.info("Queued %d of %d new email(s) for processing", queued, len(new_emails_to_process))
         
         return {
             "status": "ok",
-            "message": f"Processed {len(valid_emails)} email(s)",
-            "emails_count": len(valid_emails),
-            "processed_emails": valid_emails
+            "message": f"Queued {queued} email(s) for processing",
+            "emails_count": queued,
+            "fetch_errors": fetch_errors
         }
         
     except Exception as e:
-        print(f"   ❌ Error in manual fetch: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error in manual fetch")
         return {
             "status": "error",
             "message": f"Error: {str(e)}"
@@ -667,6 +1451,9 @@ async def cleanup_emails():
     processed_emails_store[:] = cleaned_emails
     save_emails_to_disk()
     
+    # Duplicates share an ID, so dashboards reload rather than apply a delta
+    _event_bus.publish("reset", {})
+    
     return {
         "status": "ok",
         "total_before": total_before,
@@ -678,56 +1465,82 @@ async def cleanup_emails():
 
 @app.post("/pubsub/gmail")
 async def gmail_pubsub_listener(request: Request):
-    """Handle Gmail Pub/Sub notifications and fetch new unread emails."""
-    print("📩 Gmail notification received - fetching unread emails...")
+    """
+    Handle Gmail Pub/Sub notifications.
     
+    The notification is only queued as a sync job, so the push is acknowledged
+    within milliseconds; the job workers fetch and process the new emails.
+    Notifications for a mailbox that arrive while its sync job is still
+    waiting are merged into that job, and only one sync per mailbox runs at a time.
+    """
     try:
-        # Fetch all unread emails (Pub/Sub just notifies us, we fetch all unread)
-        unread_emails = get_unread_emails()
-        
-        if not unread_emails:
-            return {"status": "ok", "message": "No unread emails"}
-        
-        # Filter out already processed emails
-        new_emails = [
-            e for e in unread_emails
-            if e.get('id') not in _processed_email_ids
-        ]
-        
-        if not new_emails:
-            return {"status": "ok", "message": "All unread emails already processed"}
-        
-        print(f"🆕 Processing {len(new_emails)} new unread email(s)...")
-        
-        # Process emails
-        try:
-            from .main import process_emails
-        except ImportError:
-            from main import process_emails
-        
-        processed_emails = process_emails(new_emails, generate_reply=True)
-        
-        # Store only emails with valid content
-        valid_emails = []
-        for email in processed_emails:
-            if email.get('summary') or email.get('draft_reply'):
-                email_id = email.get('email_id')
-                _processed_email_ids.add(email_id)
-                processed_emails_store.append(email)
-                valid_emails.append(email)
-        
-        # Sort by date (newest first)
-        processed_emails_store.sort(key=lambda x: x.get('date', ''), reverse=True)
-        
-        # Save to disk
-        save_emails_to_disk()
-        save_processed_ids_to_disk()
-        
-        print(f"✅ Processed {len(valid_emails)} email(s)")
-        return {"status": "ok", "emails_count": len(valid_emails)}
+        body = await request.json()
+    except Exception:
+        body = {}
+    notification = history_sync.decode_pubsub_message(body)
+    mailbox = notification.get('emailAddress') or 'me'
     
+    try:
+        queued = job_queue.enqueue_coalesced(
+            "sync",
+            mailbox,
+            {
+                "history_id": str(notification['historyId']) if notification.get('historyId') else None,
+                "email_address": mailbox,
+                "notifications": 1
+            },
+            window=SYNC_COALESCE_WINDOW_SECONDS,
+            merge=_merge_sync_payloads
+        )
     except Exception as e:
-        print(f"❌ Error: {e}")
-        import traceback
-        traceback.print_exc()
-        return {"status": "error", "message": str(e)}
+        # Not acknowledging lets Pub/Sub redeliver the notification
+        log.error("Error queueing Gmail notification: %s", e)
+        raise HTTPException(status_code=503, detail="Could not queue notification")
+    
+    if queued['coalesced']:
+        log.info("Gmail notification for %s (history ID %s) merged into sync job %s (%d merged)",
+                 mailbox, notification.get('historyId', 'unknown'), queued['job_id'], queued['merged'])
+    else:
+        log.info("Gmail notification for %s (history ID %s) queued as sync job %s",
+                 mailbox, notification.get('historyId', 'unknown'), queued['job_id'])
+    _jobs_available.set()
+    return {"status": "ok", **queued}
+
+
+@app.get("/api/jobs")
+async def get_jobs(status: str = "dead", limit: int = 50):
+    """Job queue counts plus the most recent jobs with a status (dead-lettered by default)."""
+    return {
+        "stats": job_queue.get_stats(),
+        "jobs": job_queue.list_jobs(status, limit)
+    }
+
+
+@app.post("/api/jobs/{job_id}/retry")
+async def retry_job(job_id: int):
+    """Put a dead-lettered job back on the queue."""
+    if not job_queue.retry(job_id):
+        raise HTTPException(status_code=404, detail="No dead-lettered job with that ID")
+    _jobs_available.set()
+    return {"status": "ok", "job_id": job_id}
+
+
+@app.get("/api/models")
+async def get_models():
+    """Model routing table with latency, throughput and fallback counters per model."""
+    try:
+        from . import model_manager, model_router
+    except ImportError:
+        import model_manager
+        import model_router
+    
+    return {
+        **model_router.get_stats(),
+        "cold_warm": model_manager.get_stats()
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Stage latency histograms and API/cache counters in the Prometheus text format."""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
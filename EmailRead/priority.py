@@ -0,0 +1,95 @@
+"""Rules that decide which queued emails are summarized first"""
+
+from email.utils import parseaddr
+from typing import Dict, List, Optional
+import os
+import time
+
+try:
+    from .storage import date_timestamp
+except ImportError:
+    from storage import date_timestamp
+
+# Where an email entered the queue: a Pub/Sub notification or the startup catch-up
+SOURCE_LIVE = "live"
+SOURCE_BACKLOG = "backlog"
+
+# Points added by each rule; the highest total is processed first
+LIVE_BONUS = int(os.environ.get("AUTOMAIL_PRIORITY_LIVE_BONUS", "100"))
+SENDER_BONUS = int(os.environ.get("AUTOMAIL_PRIORITY_SENDER_BONUS", "50"))
+KEYWORD_BONUS = int(os.environ.get("AUTOMAIL_PRIORITY_KEYWORD_BONUS", "20"))
+
+# Newest first: (maximum age in seconds, points), checked in order
+RECENCY_BONUSES = (
+    (3600, 30),
+    (24 * 3600, 20),
+    (7 * 24 * 3600, 10),
+)
+
+
+def _parse_list(value: str) -> List[str]:
+    """Split a comma-separated setting into lowercase entries."""
+    return [item.strip().lower() for item in value.split(',') if item.strip()]
+
+
+# Comma-separated sender addresses or domains (e.g. "boss@example.com,example.org")
+PRIORITY_SENDERS = _parse_list(os.environ.get("AUTOMAIL_PRIORITY_SENDERS", ""))
+
+# Comma-separated words that mark a subject as urgent
+PRIORITY_KEYWORDS = _parse_list(os.environ.get("AUTOMAIL_PRIORITY_KEYWORDS", "urgent,asap,action required"))
+
+
+def sender_matches(sender: Optional[str], allow_list: Optional[List[str]] = None) -> bool:
+    """Check a From header against the sender allow-list (full addresses or domains)."""
+    allow_list = PRIORITY_SENDERS if allow_list is None else allow_list
+    address = parseaddr(sender or '')[1].lower()
+    if not address:
+        return False
+    domain = address.rsplit('@', 1)[-1]
+    return any(entry == address or entry.lstrip('@') == domain for entry in allow_list)
+
+
+def score(email: Dict, source: str = SOURCE_BACKLOG, now: Optional[float] = None) -> int:
+    """
+    Compute the priority of an email.
+    
+    Args:
+        email: Fetched email (from, subject, date)
+        source: SOURCE_LIVE for emails from a Pub/Sub notification, SOURCE_BACKLOG otherwise
+        now: Reference time for the recency rule (default: now)
+    
+    Returns:
+        Priority points; higher is processed first
+    """
+    points = 0
+    if source == SOURCE_LIVE:
+        points += LIVE_BONUS
+    
+    if sender_matches(email.get('from')):
+        points += SENDER_BONUS
+    
+    subject = (email.get('subject') or '').lower()
+    if any(keyword in subject for keyword in PRIORITY_KEYWORDS):
+        points += KEYWORD_BONUS
+    
+    timestamp = date_timestamp(email.get('date'))
+    if timestamp:
+        age = (now or time.time()) - timestamp
+        for max_age, bonus in RECENCY_BONUSES:
+            if age <= max_age:
+                points += bonus
+                break
+    
+    return points
+
+
+def get_rules() -> Dict:
+    """Return the active rules, for the debug endpoints."""
+    return {
+        "live_bonus": LIVE_BONUS,
+        "sender_bonus": SENDER_BONUS,
+        "senders": PRIORITY_SENDERS,
+        "keyword_bonus": KEYWORD_BONUS,
+        "keywords": PRIORITY_KEYWORDS,
+        "recency_bonuses": [{"max_age_seconds": age, "points": points} for age, points in RECENCY_BONUSES],
+    }
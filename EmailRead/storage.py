@@ -0,0 +1,271 @@
+"""SQLite storage for processed emails, processed email IDs and thread summaries"""
+
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterable, List, Optional, Set
+import json
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    from . import logs, metrics
+except ImportError:
+    import logs
+    import metrics
+
+log = logs.get_logger("storage")
+
+# Directory for runtime state files (default: the repository root)
+_state_dir = os.environ.get("AUTOMAIL_STATE_DIR") or os.path.join(os.path.dirname(__file__), '..')
+
+
+def state_path(name: str) -> str:
+    """Path of a runtime state file in AUTOMAIL_STATE_DIR (default: the repository root)."""
+    return os.path.join(_state_dir, name)
+
+
+# Database file, next to the legacy JSON files it replaces; job_queue.py uses it too
+DB_FILE = state_path('.automail.db')
+
+_connection: Optional[sqlite3.Connection] = None
+_lock = threading.RLock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS emails (
+    email_id TEXT PRIMARY KEY,
+    date TEXT,
+    date_ts REAL NOT NULL DEFAULT 0,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_emails_date_ts ON emails (date_ts DESC, email_id);
+
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    message_ids TEXT NOT NULL,
+    last_email_id TEXT,
+    last_date_ts REAL NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def get_connection() -> sqlite3.Connection:
+    """Return the shared database connection, creating the schema on first use."""
+    global _connection
+    with _lock:
+        if _connection is None:
+            os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
+            _connection = sqlite3.connect(DB_FILE, check_same_thread=False, isolation_level=None)
+            _connection.execute("PRAGMA journal_mode=WAL")
+            _connection.execute("PRAGMA synchronous=NORMAL")
+            _connection.executescript(_SCHEMA)
+        return _connection
+
+
+def date_timestamp(date_header: Optional[str]) -> float:
+    """Convert an email Date header to a Unix timestamp (0 if it can't be parsed)."""
+    if not date_header:
+        return 0
+    try:
+        return parsedate_to_datetime(date_header).timestamp()
+    except Exception:
+        return 0
+
+
+@metrics.timed("automail_persistence_seconds", operation="upsert_emails")
+def upsert_emails(emails: Iterable[Dict]):
+    """Insert or update processed emails, keyed by email_id."""
+    now = time.time()
+    rows = [
+        (e['email_id'], e.get('date'), date_timestamp(e.get('date')), json.dumps(e), now)
+        for e in emails if e.get('email_id')
+    ]
+    if not rows:
+        return
+    with _lock:
+        conn = get_connection()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                """INSERT INTO emails (email_id, date, date_ts, data, updated_at)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(email_id) DO UPDATE SET
+                       date = excluded.date,
+                       date_ts = excluded.date_ts,
+                       data = excluded.data,
+                       updated_at = excluded.updated_at""",
+                rows
+            )
+
+
+@metrics.timed("automail_persistence_seconds", operation="delete_emails")
+def delete_emails(email_ids: Iterable[str]):
+    """Delete processed emails by ID."""
+    rows = [(email_id,) for email_id in email_ids if email_id]
+    if not rows:
+        return
+    with _lock:
+        conn = get_connection()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany("DELETE FROM emails WHERE email_id = ?", rows)
+
+
+def load_emails() -> List[Dict]:
+    """Load every processed email, newest first."""
+    with _lock:
+        rows = get_connection().execute(
+            "SELECT data FROM emails ORDER BY date_ts DESC, email_id"
+        ).fetchall()
+    return [json.loads(row[0]) for row in rows]
+
+
+def load_email_ids() -> Set[str]:
+    """Return the IDs of every stored email."""
+    with _lock:
+        rows = get_connection().execute("SELECT email_id FROM emails").fetchall()
+    return {row[0] for row in rows}
+
+
+def load_legacy_processed_ids() -> Set[str]:
+    """
+    Return the IDs in the processed_ids table of older databases.
+    
+    Processed IDs now live in the append-only journal (id_journal.py); the
+    table is only read to seed the journal, then dropped with
+    drop_legacy_processed_ids().
+    """
+    with _lock:
+        conn = get_connection()
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'processed_ids'"
+        ).fetchone()
+        if not exists:
+            return set()
+        rows = conn.execute("SELECT email_id FROM processed_ids").fetchall()
+    return {row[0] for row in rows}
+
+
+def drop_legacy_processed_ids():
+    """Remove the processed_ids table once its IDs are journaled."""
+    with _lock:
+        conn = get_connection()
+        with conn:
+            conn.execute("DROP TABLE IF EXISTS processed_ids")
+
+
+def get_thread(thread_id: str) -> Optional[Dict]:
+    """Return the rolling summary record of a Gmail thread, or None if it has none yet."""
+    with _lock:
+        row = get_connection().execute(
+            "SELECT summary, message_ids, last_email_id, last_date_ts FROM threads WHERE thread_id = ?",
+            (thread_id,)
+        ).fetchone()
+    if row is None:
+        return None
+    return {
+        "thread_id": thread_id,
+        "summary": row[0],
+        "message_ids": json.loads(row[1]),
+        "last_email_id": row[2],
+        "last_date_ts": row[3],
+    }
+
+
+@metrics.timed("automail_persistence_seconds", operation="upsert_thread")
+def upsert_thread(thread: Dict):
+    """Insert or replace a thread's rolling summary record."""
+    with _lock:
+        get_connection().execute(
+            """INSERT INTO threads (thread_id, summary, message_ids, last_email_id, last_date_ts, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT(thread_id) DO UPDATE SET
+                   summary = excluded.summary,
+                   message_ids = excluded.message_ids,
+                   last_email_id = excluded.last_email_id,
+                   last_date_ts = excluded.last_date_ts,
+                   updated_at = excluded.updated_at""",
+            (thread['thread_id'], thread['summary'], json.dumps(thread['message_ids']),
+             thread.get('last_email_id'), thread.get('last_date_ts') or 0, time.time())
+        )
+
+
+def count_threads() -> int:
+    """Return the number of threads with a rolling summary."""
+    with _lock:
+        return get_connection().execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+
+
+def get_meta(key: str) -> Optional[str]:
+    """Read a value from the meta table."""
+    with _lock:
+        row = get_connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def set_meta(key: str, value: str):
+    """Write a value to the meta table."""
+    with _lock:
+        get_connection().execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+
+
+def migrate_from_json(emails_file: str, ids_file: str) -> Optional[Set[str]]:
+    """
+    Import the legacy .processed_emails.json / .processed_email_ids.json files once.
+    
+    The JSON files are left in place. Once the caller has journaled the
+    returned IDs it calls mark_json_migrated(), which prevents the import
+    from running again; until then it is repeated on every start.
+    
+    Args:
+        emails_file: Path of the legacy processed emails file
+        ids_file: Path of the legacy processed IDs file
+    
+    Returns:
+        The processed IDs read from ids_file, for the caller to journal, or
+        None if the import already ran or failed
+    """
+    if get_meta('json_migrated'):
+        return None
+    
+    emails: List[Dict] = []
+    email_ids: List[str] = []
+    
+    if os.path.exists(emails_file):
+        try:
+            with open(emails_file, 'r') as f:
+                emails = json.load(f).get('emails', [])
+        except Exception as e:
+            log.warning("Error reading %s for migration: %s", emails_file, e)
+            return None
+    
+    if os.path.exists(ids_file):
+        try:
+            with open(ids_file, 'r') as f:
+                email_ids = json.load(f).get('email_ids', [])
+        except Exception as e:
+            log.warning("Error reading %s for migration: %s", ids_file, e)
+            return None
+    
+    upsert_emails(emails)
+    
+    if emails or email_ids:
+        log.info("Migrated %d emails and %d processed IDs from JSON", len(emails), len(email_ids))
+    return {email_id for email_id in email_ids if email_id}
+
+
+def mark_json_migrated():
+    """Record that the legacy JSON files were imported and their processed IDs are journaled."""
+    set_meta('json_migrated', str(time.time()))
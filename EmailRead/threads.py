@@ -0,0 +1,110 @@
+"""Rolling per-thread summaries, updated from each new message instead of the whole thread"""
+
+from typing import Dict, Optional
+import asyncio
+import os
+import threading
+
+try:
+    from . import storage
+except ImportError:
+    import storage
+
+# Set AUTOMAIL_THREAD_SUMMARIES=1 to summarize a new message in a known thread
+# as an update of the thread's summary rather than on its own
+THREAD_SUMMARIES = os.environ.get("AUTOMAIL_THREAD_SUMMARIES", "0") == "1"
+
+# One lock per thread, so two messages of a thread never update its summary at once
+_locks: Dict[str, threading.Lock] = {}
+_async_locks: Dict[str, asyncio.Lock] = {}
+_locks_lock = threading.Lock()
+
+_stats = {"seeded": 0, "incremental": 0, "out_of_order": 0}
+
+
+def thread_key(email_data: Dict) -> Optional[str]:
+    """Return the Gmail thread ID to summarize an email against, or None in per-message mode."""
+    if not THREAD_SUMMARIES:
+        return None
+    # Parsed Gmail messages carry threadId, stored emails thread_id
+    return email_data.get('threadId') or email_data.get('thread_id') or None
+
+
+def lock(thread_id: str) -> threading.Lock:
+    """Lock serializing summary updates of a thread (sync callers)."""
+    with _locks_lock:
+        return _locks.setdefault(thread_id, threading.Lock())
+
+
+def async_lock(thread_id: str) -> asyncio.Lock:
+    """Lock serializing summary updates of a thread (async callers)."""
+    with _locks_lock:
+        return _async_locks.setdefault(thread_id, asyncio.Lock())
+
+
+def previous_summary(thread: Optional[Dict], email_data: Dict) -> Optional[str]:
+    """
+    Return the thread summary a new message should be folded into.
+    
+    Args:
+        thread: Record from storage.get_thread, or None
+        email_data: The message being summarized
+    
+    Returns:
+        The summary, or None if the message has to be summarized on its own:
+        the thread is new, or the message is already part of the summary or
+        older than its latest message
+    """
+    if thread is None or email_data.get('id') in thread['message_ids']:
+        return None
+    if storage.date_timestamp(email_data.get('date')) < thread['last_date_ts']:
+        return None
+    return thread['summary']
+
+
+def record(thread_id: str, thread: Optional[Dict], email_data: Dict, result: Dict):
+    """
+    Store the summary of a message as the thread's new rolling summary.
+    
+    Args:
+        thread_id: Gmail thread ID
+        thread: The record the summary was based on (None for a new thread)
+        email_data: The message that was summarized
+        result: Summary result; only successful ones are stored
+    """
+    if result.get('status') != 'success' or not result.get('summary'):
+        return
+    email_id = email_data.get('id')
+    date_ts = storage.date_timestamp(email_data.get('date'))
+    
+    if thread is None:
+        _stats["seeded"] += 1
+        thread = {"thread_id": thread_id, "message_ids": [], "last_date_ts": 0}
+    elif email_id in thread['message_ids']:
+        # Already part of the rolling summary (e.g. a retried job)
+        return
+    elif date_ts < thread['last_date_ts']:
+        # An older message found late; keep the summary of the newer ones
+        _stats["out_of_order"] += 1
+        thread['message_ids'].append(email_id)
+        storage.upsert_thread(thread)
+        return
+    else:
+        _stats["incremental"] += 1
+    
+    thread['message_ids'].append(email_id)
+    thread.update({
+        "summary": result['summary'],
+        "last_email_id": email_id,
+        "last_date_ts": max(date_ts, thread['last_date_ts']),
+    })
+    storage.upsert_thread(thread)
+
+
+def get_stats() -> Dict:
+    """Return thread summary counters, for the debug endpoint."""
+    return {
+        "enabled": THREAD_SUMMARIES,
+        "threads": storage.count_threads() if THREAD_SUMMARIES else 0,
+        **_stats
+    }
@@ -0,0 +1,151 @@
+"""Bulk read/unread reconciliation of stored emails against Gmail"""
+
+from typing import Dict, Iterable, Optional, Set
+import os
+import time
+
+try:
+    from . import logs, metrics
+except ImportError:
+    import logs
+    import metrics
+
+log = logs.get_logger("unread_status")
+
+# How often the background reconciliation runs
+RECONCILE_INTERVAL_SECONDS = float(os.environ.get("AUTOMAIL_UNREAD_RECONCILE_INTERVAL", "30"))
+
+# Listing the UNREAD label is one call per 500 messages. Mailboxes with more
+# unread mail than this many pages are reconciled with batched metadata
+# requests for the stored IDs instead.
+MAX_UNREAD_LIST_PAGES = 10
+
+# Maximum number of requests per Gmail HTTP batch (API limit is 100)
+METADATA_BATCH_SIZE = 100
+
+# email_id -> True if unread, from the most recent reconciliation
+_unread_status: Dict[str, bool] = {}
+_last_run: Dict = {}
+
+
+def list_unread_ids(service, max_pages: int = MAX_UNREAD_LIST_PAGES) -> Optional[Set[str]]:
+    """
+    List the IDs of every unread message in the mailbox.
+    
+    Args:
+        service: Gmail API service
+        max_pages: Maximum number of 500-message pages to read
+    
+    Returns:
+        Set of unread message IDs, or None if there are more than max_pages pages
+    """
+    unread_ids: Set[str] = set()
+    page_token = None
+    
+    for _ in range(max_pages):
+        response = metrics.gmail_execute(service.users().messages().list(
+            userId='me',
+            labelIds=['UNREAD'],
+            maxResults=500,
+            pageToken=page_token,
+            fields='messages/id,nextPageToken'
+        ), "messages.list")
+        unread_ids.update(msg['id'] for msg in response.get('messages', []))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return unread_ids
+    
+    return None
+
+
+def fetch_unread_flags(service, email_ids: Iterable[str]) -> Dict[str, bool]:
+    """
+    Look up the UNREAD label of specific messages with batched metadata requests.
+    
+    Messages that no longer exist (404) are reported as read; messages whose
+    lookup failed for another reason are left out so their status is kept.
+    
+    Args:
+        service: Gmail API service
+        email_ids: Message IDs to check
+    
+    Returns:
+        Dictionary mapping email_id to True if it is unread
+    """
+    email_ids = list(dict.fromkeys(email_ids))
+    flags: Dict[str, bool] = {}
+    
+    def on_response(request_id, response, exception):
+        if exception is None:
+            flags[request_id] = 'UNREAD' in response.get('labelIds', [])
+        elif getattr(getattr(exception, 'resp', None), 'status', None) == 404:
+            flags[request_id] = False
+        else:
+            log.warning("Error checking unread status: %s", exception, extra={"email_id": request_id})
+    
+    for start in range(0, len(email_ids), METADATA_BATCH_SIZE):
+        chunk = email_ids[start:start + METADATA_BATCH_SIZE]
+        batch = service.new_batch_http_request(callback=on_response)
+        for email_id in chunk:
+            batch.add(
+                service.users().messages().get(
+                    userId='me', id=email_id, format='minimal', fields='id,labelIds'
+                ),
+                request_id=email_id
+            )
+        metrics.gmail_execute(batch, "batch", calls=len(chunk))
+    
+    return flags
+
+
+def reconcile(service, email_ids: Iterable[str]) -> Dict[str, bool]:
+    """
+    Determine the read/unread status of stored emails in bulk.
+    
+    Lists the UNREAD label once and diffs it against email_ids, falling back to
+    batched metadata requests for very large unread counts. The result also
+    updates the cached status returned by is_unread().
+    
+    Args:
+        service: Gmail API service
+        email_ids: IDs of the stored emails
+    
+    Returns:
+        Dictionary mapping email_id to True if it is unread
+    """
+    email_ids = [e for e in email_ids if e]
+    start_time = time.time()
+    
+    unread_ids = list_unread_ids(service)
+    if unread_ids is not None:
+        method = "label_list"
+        status = {email_id: email_id in unread_ids for email_id in email_ids}
+    else:
+        method = "batched_metadata"
+        status = fetch_unread_flags(service, email_ids)
+    
+    _unread_status.clear()
+    _unread_status.update(status)
+    _last_run.update({
+        "method": method,
+        "checked": len(email_ids),
+        "unread": sum(1 for v in status.values() if v),
+        "read": sum(1 for v in status.values() if not v),
+        "duration": round(time.time() - start_time, 2),
+        "finished_at": time.time(),
+    })
+    return status
+
+
+def is_unread(email_id: str) -> bool:
+    """Return the cached unread status; emails not reconciled yet count as unread."""
+    return _unread_status.get(email_id, True)
+
+
+def get_stats() -> Dict:
+    """Return details of the most recent reconciliation run."""
+    return {
+        "interval_seconds": RECONCILE_INTERVAL_SECONDS,
+        "tracked": len(_unread_status),
+        "last_run": dict(_last_run),
+    }
@@ -0,0 +1,240 @@
+"""
+Offline throughput benchmark for email processing.
+
+Replays a corpus of emails (JSON list in the shape notify.get_email_content
+returns) through main.process_emails / main.process_emails_async for every
+combination of API, generation mode and concurrency, and reports latency
+percentiles, emails per minute, prompt vs generation token rates and peak
+memory. By default the emails go to a fake Ollama server (fake_ollama.py), so
+the benchmark runs anywhere, including CI; pass --ollama-host to measure a
+real Ollama instead.
+
+Examples:
+    python benchmarks/bench.py
+    python benchmarks/bench.py --concurrency 1,4,8 --modes separate,combined --repeat 5
+    python benchmarks/bench.py --ollama-host http://localhost:11434 --model llama3.2:latest
+    python benchmarks/bench.py --env AUTOMAIL_TOKEN_BUDGET=200 --json bench.json
+"""
+
+from typing import Dict, List
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from fake_ollama import FakeOllama
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CORPUS = os.path.join(BENCH_DIR, 'corpus', 'emails.json')
+
+_COLUMNS = (
+    ("api", "api", "{}"),
+    ("mode", "mode", "{}"),
+    ("in_flight", "max_in_flight", "{}"),
+    ("emails", "emails", "{}"),
+    ("failed", "failed", "{}"),
+    ("skipped", "skipped_llm", "{}"),
+    ("wall_s", "wall_time", "{:.2f}"),
+    ("emails/min", "emails_per_minute", "{:.1f}"),
+    ("p50_s", "latency_p50", "{:.2f}"),
+    ("p95_s", "latency_p95", "{:.2f}"),
+    ("p99_s", "latency_p99", "{:.2f}"),
+    ("ttft_p50", "ttft_p50", "{:.2f}"),
+    ("prompt_tok/s", "prompt_tokens_per_second", "{:.0f}"),
+    ("eval_tok/s", "eval_tokens_per_second", "{:.0f}"),
+    ("peak_mb", "peak_memory_mb", "{:.1f}"),
+)
+
+
+def load_corpus(path: str, repeat: int) -> List[Dict]:
+    """Load the corpus, repeated with unique IDs so nothing is deduplicated."""
+    with open(path, 'r') as f:
+        emails = json.load(f)
+    corpus = []
+    for copy in range(repeat):
+        for email in emails:
+            corpus.append({
+                **email,
+                "id": f"{email['id']}-{copy}" if repeat > 1 else email['id'],
+                "threadId": f"{email.get('threadId')}-{copy}" if repeat > 1 else email.get('threadId'),
+            })
+    return corpus
+
+
+def _token_rates(model_stats: Dict) -> Dict:
+    """Combine the per-model prompt and generation token rates of model_router.get_stats()."""
+    totals = {"prompt_tokens": 0, "prompt_seconds": 0.0, "eval_tokens": 0, "eval_seconds": 0.0}
+    for stats in model_stats.values():
+        for kind, rate_key in (("prompt", "prompt_tokens_per_second"), ("eval", "tokens_per_second")):
+            tokens = stats[f"{kind}_tokens"]
+            totals[f"{kind}_tokens"] += tokens
+            if stats[rate_key]:
+                totals[f"{kind}_seconds"] += tokens / stats[rate_key]
+    return {
+        "prompt_tokens": totals["prompt_tokens"],
+        "eval_tokens": totals["eval_tokens"],
+        "prompt_tokens_per_second": (
+            totals["prompt_tokens"] / totals["prompt_seconds"] if totals["prompt_seconds"] else 0
+        ),
+        "eval_tokens_per_second": totals["eval_tokens"] / totals["eval_seconds"] if totals["eval_seconds"] else 0,
+    }
+
+
+def _max_rss_mb() -> float:
+    """Peak resident memory of the process so far, in MB (0 where unavailable)."""
+    if resource is None:
+        return 0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return max_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def run_once(main, model_router, loop: asyncio.AbstractEventLoop, emails: List[Dict], api: str,
+             mode: str, max_in_flight: int, generate_reply: bool) -> Dict:
+    """Process the corpus once and return the batch stats with token rates and memory."""
+    model_router.reset_stats()
+    tracemalloc.start()
+    if api == "async":
+        loop.run_until_complete(main.process_emails_async(emails, generate_reply, mode, max_in_flight))
+    else:
+        main.process_emails(emails, generate_reply, mode, max_in_flight)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    
+    router_stats = model_router.get_stats()['models']
+    return {
+        "api": api,
+        "mode": mode,
+        **main.get_last_batch_stats(),
+        **_token_rates(router_stats),
+        "models": router_stats,
+        "peak_memory_mb": peak / (1024 * 1024),
+        "max_rss_mb": round(_max_rss_mb(), 1),
+    }
+
+
+def print_table(rows: List[Dict]):
+    """Print the results as an aligned table."""
+    cells = [[title for title, _, _ in _COLUMNS]]
+    for row in rows:
+        cells.append([fmt.format(row.get(key) or 0) for _, key, fmt in _COLUMNS])
+    widths = [max(len(line[i]) for line in cells) for i in range(len(_COLUMNS))]
+    for index, line in enumerate(cells):
+        print("  ".join(cell.rjust(width) for cell, width in zip(line, widths)))
+        if index == 0:
+            print("  ".join("-" * width for width in widths))
+
+
+def _csv(value: str) -> List[str]:
+    """Split a comma-separated option."""
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline email processing throughput benchmark")
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help="JSON list of emails")
+    parser.add_argument('--repeat', type=int, default=1, help="Replay the corpus this many times per run")
+    parser.add_argument('--concurrency', default="1,2,4", help="Comma-separated max_in_flight values")
+    parser.add_argument('--modes', default="separate", help="Comma-separated generation modes")
+    parser.add_argument('--apis', default="sync,async", help="Comma-separated: sync (process_emails), "
+                                                             "async (process_emails_async)")
+    parser.add_argument('--no-reply', action='store_true', help="Only generate summaries")
+    parser.add_argument('--model', help="Model to use (sets AUTOMAIL_MODEL)")
+    parser.add_argument('--env', action='append', default=[], metavar="KEY=VALUE",
+                        help="AutoMail setting to apply before loading it (repeatable)")
+    parser.add_argument('--cache', action='store_true', help="Keep the LLM result cache on")
+    parser.add_argument('--no-warmup', action='store_true', help="Include the model load in the first run")
+    parser.add_argument('--ollama-host', help="Benchmark this Ollama server instead of the fake one")
+    parser.add_argument('--fake-load-seconds', type=float, default=0.5, help="Fake model load time")
+    parser.add_argument('--fake-prompt-rate', type=float, default=2000, help="Fake prompt tokens per second")
+    parser.add_argument('--fake-eval-rate', type=float, default=400, help="Fake generated tokens per second")
+    parser.add_argument('--fake-response-tokens', type=int, default=40, help="Fake tokens per response")
+    parser.add_argument('--fake-parallel', type=int, default=4, help="Requests the fake server runs at once")
+    parser.add_argument('--json', help="Also write the results to this JSON file")
+    parser.add_argument('--verbose', action='store_true', help="Show the processing logs")
+    args = parser.parse_args()
+    
+    fake = None
+    if args.ollama_host:
+        os.environ["OLLAMA_HOST"] = args.ollama_host
+    else:
+        fake = FakeOllama(load_seconds=args.fake_load_seconds, prompt_tokens_per_second=args.fake_prompt_rate,
+                          eval_tokens_per_second=args.fake_eval_rate, response_tokens=args.fake_response_tokens,
+                          parallel=args.fake_parallel).start()
+        os.environ["OLLAMA_HOST"] = fake.host
+    
+    # Settings are read when the modules are imported
+    if args.model:
+        os.environ["AUTOMAIL_MODEL"] = args.model
+    if not args.cache:
+        os.environ["AUTOMAIL_LLM_CACHE"] = "0"
+    if not args.verbose:
+        os.environ["AUTOMAIL_LOG_LEVEL"] = "WARNING"
+    # Thread summaries and the LLM cache write state files; keep the real ones untouched
+    workdir = tempfile.TemporaryDirectory(prefix="automail-bench-")
+    os.environ["AUTOMAIL_STATE_DIR"] = workdir.name
+    # The process-wide limit must not cap the concurrency levels being measured
+    os.environ["AUTOMAIL_MAX_IN_FLIGHT"] = str(max(int(value) for value in _csv(args.concurrency)))
+    for setting in args.env:
+        key, _, value = setting.partition('=')
+        os.environ[key] = value
+    
+    sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'EmailRead'))
+    import main as automail
+    import llm_cache
+    import model_manager
+    import model_router
+    
+    emails = load_corpus(args.corpus, args.repeat)
+    loop = asyncio.new_event_loop()
+    print(f"📊 {len(emails)} email(s) per run against "
+          f"{'fake Ollama' if fake else args.ollama_host}, model {model_router.DEFAULT_MODEL}")
+    
+    if not args.no_warmup:
+        for model in model_router.primary_models():
+            loop.run_until_complete(model_manager.warm_up(model))
+    
+    rows = []
+    for api in _csv(args.apis):
+        for mode in _csv(args.modes):
+            for max_in_flight in [int(value) for value in _csv(args.concurrency)]:
+                start_time = time.time()
+                row = run_once(automail, model_router, loop, emails, api, mode, max_in_flight,
+                               not args.no_reply)
+                rows.append(row)
+                print(f"   {api}/{mode}/{max_in_flight}: {time.time() - start_time:.1f}s")
+    
+    print()
+    print_table(rows)
+    print(f"\nPeak RSS: {_max_rss_mb():.1f} MB (process-wide); peak_mb is Python allocations per run")
+    
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                "corpus": os.path.abspath(args.corpus),
+                "emails_per_run": len(emails),
+                "ollama": args.ollama_host or "fake",
+                "model": model_router.DEFAULT_MODEL,
+                "runs": rows,
+            }, f, indent=2)
+        print(f"💾 Results written to {args.json}")
+    
+    loop.close()
+    # Write pending cache changes now; the atexit flush would find the directory gone
+    llm_cache.flush()
+    workdir.cleanup()
+    if fake is not None:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+"""
+Fake Gmail API and Pub/Sub push generator for load tests.
+
+Serves the Gmail API calls AutoMail makes (users.getProfile, messages.list,
+messages.get, history.list and HTTP batch requests) from an in-memory mailbox,
+and counts every call. Point the server at it with
+AUTOMAIL_GMAIL_API_URL=<host>; no Google account or OAuth token is needed.
+
+Emails delivered to the mailbox are added to its history like Gmail does,
+and push_notification() posts the matching Pub/Sub push request to the
+server's /pubsub/gmail endpoint.
+
+Run it on its own (optionally generating traffic) with:
+    python benchmarks/fake_gmail.py --port 8090 --inbox-size 500
+    python benchmarks/fake_gmail.py --push-url http://localhost:8000/pubsub/gmail --rate 2 --notifications 50
+"""
+
+from collections import Counter, OrderedDict
+from email.parser import Parser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional, Tuple
+import argparse
+import base64
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CORPUS = os.path.join(BENCH_DIR, 'corpus', 'emails.json')
+
+EMAIL_ADDRESS = "alex@example.com"
+
+# Headers of corpus emails copied into Gmail messages (corpus key -> header name)
+_HEADER_NAMES = {
+    "from": "From",
+    "to": "To",
+    "subject": "Subject",
+    "date": "Date",
+}
+
+# Page size when a list request has no maxResults (Gmail's default)
+DEFAULT_PAGE_SIZE = 100
+
+_NOT_FOUND = {"error": {"code": 404, "message": "Requested entity was not found.", "status": "NOT_FOUND"}}
+
+
+def _b64(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+
+def pubsub_push_body(history_id: int, email_address: str = EMAIL_ADDRESS) -> Dict:
+    """Build the JSON body of a Gmail Pub/Sub push request."""
+    return {
+        "message": {
+            "data": _b64(json.dumps({"emailAddress": email_address, "historyId": history_id})),
+            "messageId": uuid.uuid4().hex,
+            "publishTime": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        },
+        "subscription": "projects/fake-project/subscriptions/gmail-push",
+    }
+
+
+def push_notification(push_url: str, history_id: int, timeout: float = 30) -> Tuple[int, Dict, float]:
+    """
+    POST a Gmail notification to a Pub/Sub push endpoint.
+    
+    Returns:
+        Tuple of (HTTP status, JSON response, seconds until it was acknowledged)
+    """
+    request = urllib.request.Request(
+        push_url,
+        data=json.dumps(pubsub_push_body(history_id)).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    start_time = time.time()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            status, body = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, body = e.code, e.read()
+    try:
+        data = json.loads(body or b'{}')
+    except ValueError:
+        data = {}
+    return status, data, time.time() - start_time
+
+
+class FakeGmail:
+    """
+    In-process fake Gmail API server with one mailbox.
+    
+    Args:
+        port: Port to listen on (0 picks a free one)
+        latency_seconds: Time every HTTP request takes before it is answered
+        history_retention: Number of history records kept; older start IDs get a 404
+            like expired Gmail history
+    """
+    
+    def __init__(self, port: int = 0, latency_seconds: float = 0.0, history_retention: Optional[int] = None):
+        self.latency_seconds = latency_seconds
+        self.history_retention = history_retention
+        self.messages: "OrderedDict[str, Dict]" = OrderedDict()
+        self.history: List[Dict] = []
+        self.history_id = 1000
+        self.calls: Counter = Counter()
+        self._next_id = 0x18f0000000000000
+        self._lock = threading.Lock()
+        
+        fake = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def do_GET(self):
+                fake.handle(self, "GET")
+            
+            def do_POST(self):
+                fake.handle(self, "POST")
+            
+            def log_message(self, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+    
+    @property
+    def host(self) -> str:
+        """URL to use as AUTOMAIL_GMAIL_API_URL."""
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+    
+    def start(self) -> "FakeGmail":
+        """Serve in a background thread."""
+        threading.Thread(target=self.server.serve_forever, name="fake-gmail", daemon=True).start()
+        return self
+    
+    def stop(self):
+        """Stop serving."""
+        self.server.shutdown()
+        self.server.server_close()
+    
+    # Mailbox
+    
+    def deliver(self, email: Dict, unread: bool = True) -> str:
+        """
+        Add an email (in the shape notify.get_email_content returns) to the inbox.
+        
+        Returns:
+            The new Gmail message ID
+        """
+        headers = [{"name": name, "value": email.get(key) or ''} for key, name in _HEADER_NAMES.items()]
+        headers += [{"name": name.title(), "value": value} for name, value in (email.get('headers') or {}).items()]
+        with self._lock:
+            self._next_id += 1
+            self.history_id += 1
+            message_id = f"{self._next_id:016x}"
+            labels = ["INBOX", "UNREAD"] if unread else ["INBOX"]
+            self.messages[message_id] = {
+                "id": message_id,
+                "threadId": email.get('threadId') or message_id,
+                "labelIds": labels,
+                "snippet": email.get('snippet') or '',
+                "historyId": str(self.history_id),
+                "internalDate": str(int(time.time() * 1000)),
+                "payload": {
+                    "mimeType": "text/plain",
+                    "headers": headers,
+                    "body": {"data": _b64(email.get('body') or ''), "size": len(email.get('body') or '')},
+                },
+            }
+            self.history.append({
+                "id": str(self.history_id),
+                "messages": [{"id": message_id, "threadId": self.messages[message_id]["threadId"]}],
+                "messagesAdded": [{"message": {
+                    "id": message_id,
+                    "threadId": self.messages[message_id]["threadId"],
+                    "labelIds": list(labels),
+                }}],
+            })
+            if self.history_retention and len(self.history) > self.history_retention:
+                del self.history[:len(self.history) - self.history_retention]
+        return message_id
+    
+    def fill(self, emails: Iterable[Dict], count: int, unread: int = 0) -> List[str]:
+        """Deliver count emails cycling through emails; the last `unread` of them stay unread."""
+        emails = list(emails)
+        return [self.deliver(emails[i % len(emails)], unread=i >= count - unread) for i in range(count)]
+    
+    def mark_read(self, message_id: str):
+        """Remove the UNREAD label of a message."""
+        with self._lock:
+            message = self.messages.get(message_id)
+            if message and "UNREAD" in message["labelIds"]:
+                message["labelIds"].remove("UNREAD")
+                self.history_id += 1
+    
+    def get_stats(self) -> Dict:
+        """Return API call counts by method and the mailbox size."""
+        with self._lock:
+            return {
+                "calls": dict(self.calls),
+                "http_requests": sum(n for name, n in self.calls.items() if not name.startswith("batch.")),
+                "messages": len(self.messages),
+                "unread": sum(1 for m in self.messages.values() if "UNREAD" in m["labelIds"]),
+                "history_id": self.history_id,
+            }
+    
+    # API
+    
+    def _message_view(self, message: Dict, message_format: str) -> Dict:
+        """A message resource in the requested format."""
+        view = {k: v for k, v in message.items() if k != "payload"}
+        view["labelIds"] = list(message["labelIds"])
+        if message_format == "metadata":
+            view["payload"] = {"mimeType": message["payload"]["mimeType"], "headers": message["payload"]["headers"]}
+        elif message_format != "minimal":
+            view["payload"] = message["payload"]
+        return view
+    
+    def _page(self, items: List, query: Dict) -> Tuple[List, Optional[str]]:
+        """Apply maxResults/pageToken paging to a list."""
+        size = int(query.get('maxResults', [DEFAULT_PAGE_SIZE])[0])
+        offset = int(query.get('pageToken', ['0'])[0])
+        next_offset = offset + size
+        return items[offset:next_offset], str(next_offset) if next_offset < len(items) else None
+    
+    def api(self, method: str, path: str, query: Dict, count: bool = True) -> Tuple[int, Dict]:
+        """Answer one Gmail API request. Returns (status, JSON body)."""
+        parts = path.strip('/').split('/')
+        # gmail/v1/users/{userId}/...
+        if parts[:3] != ["gmail", "v1", "users"] or len(parts) < 5:
+            return 404, _NOT_FOUND
+        resource = parts[4:]
+        
+        with self._lock:
+            if resource == ["profile"]:
+                name = "users.getProfile"
+                status, body = 200, {
+                    "emailAddress": EMAIL_ADDRESS,
+                    "messagesTotal": len(self.messages),
+                    "threadsTotal": len({m["threadId"] for m in self.messages.values()}),
+                    "historyId": str(self.history_id),
+                }
+            elif resource == ["messages"]:
+                name = "messages.list"
+                labels = query.get('labelIds', [])
+                matching = [
+                    {"id": m["id"], "threadId": m["threadId"]}
+                    for m in reversed(self.messages.values())
+                    if all(label in m["labelIds"] for label in labels)
+                ]
+                page, token = self._page(matching, query)
+                status, body = 200, {"resultSizeEstimate": len(matching)}
+                if page:
+                    body["messages"] = page
+                if token:
+                    body["nextPageToken"] = token
+            elif len(resource) == 2 and resource[0] == "messages":
+                name = "messages.get"
+                message = self.messages.get(resource[1])
+                if message is None:
+                    status, body = 404, _NOT_FOUND
+                else:
+                    status, body = 200, self._message_view(message, query.get('format', ['full'])[0])
+            elif resource == ["history"]:
+                name = "history.list"
+                start = int(query.get('startHistoryId', ['0'])[0])
+                label = query.get('labelId', [None])[0]
+                oldest = int(self.history[0]["id"]) if self.history else self.history_id + 1
+                if self.history_retention and start < oldest - 1:
+                    status, body = 404, _NOT_FOUND
+                else:
+                    records = [
+                        record for record in self.history
+                        if int(record["id"]) > start and (
+                            label is None or all(label in added["message"]["labelIds"]
+                                                 for added in record["messagesAdded"])
+                        )
+                    ]
+                    page, token = self._page(records, query)
+                    status, body = 200, {"historyId": str(self.history_id)}
+                    if page:
+                        body["history"] = page
+                    if token:
+                        body["nextPageToken"] = token
+            else:
+                name = "unknown"
+                status, body = 404, _NOT_FOUND
+            if count:
+                self.calls[name] += 1
+        return status, body
+    
+    def _batch(self, content_type: str, payload: bytes) -> Tuple[str, bytes]:
+        """Answer a multipart/mixed batch request. Returns (content type, body)."""
+        message = Parser().parsestr(f"Content-Type: {content_type}\r\n\r\n" + payload.decode('utf-8'))
+        boundary = f"batch_{uuid.uuid4().hex}"
+        parts = []
+        for part in message.get_payload():
+            request_line = part.get_payload().lstrip().split('\n', 1)[0].strip()
+            method, target, _ = request_line.split(' ', 2)
+            url = urllib.parse.urlsplit(target)
+            status, body = self.api(method, url.path, urllib.parse.parse_qs(url.query), count=False)
+            with self._lock:
+                self.calls[f"batch.{'messages.get' if status == 200 else 'error'}"] += 1
+            content_id = part['Content-ID'].strip('<>')
+            parts.append(
+                f"--{boundary}\r\n"
+                f"Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Not Found'}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{json.dumps(body)}\r\n"
+            )
+        parts.append(f"--{boundary}--\r\n")
+        return f"multipart/mixed; boundary={boundary}", ''.join(parts).encode('utf-8')
+    
+    def handle(self, handler: BaseHTTPRequestHandler, method: str):
+        """Serve one HTTP request."""
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        url = urllib.parse.urlsplit(handler.path)
+        payload = handler.rfile.read(int(handler.headers.get('Content-Length') or 0))
+        
+        if method == "POST" and url.path.rstrip('/') == "/batch":
+            with self._lock:
+                self.calls["batch"] += 1
+            content_type, body = self._batch(handler.headers.get('Content-Type', ''), payload)
+            status = 200
+        else:
+            status, data = self.api(method, url.path, urllib.parse.parse_qs(url.query))
+            content_type, body = "application/json; charset=UTF-8", json.dumps(data).encode()
+        
+        handler.send_response(status)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+def load_corpus(path: str = DEFAULT_CORPUS) -> List[Dict]:
+    """Load a JSON list of emails."""
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Gmail API and Pub/Sub push generator")
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help="JSON list of emails to deliver")
+    parser.add_argument('--inbox-size', type=int, default=0, help="Messages in the mailbox at startup")
+    parser.add_argument('--inbox-unread', type=int, default=0, help="How many of them are unread")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds every API request takes")
+    parser.add_argument('--push-url', help="Pub/Sub push endpoint to notify (e.g. http://localhost:8000/pubsub/gmail)")
+    parser.add_argument('--rate', type=float, default=1.0, help="Notifications per second")
+    parser.add_argument('--notifications', type=int, default=10, help="Notifications to send")
+    parser.add_argument('--emails-per-notification', type=int, default=1, help="Emails delivered per notification")
+    args = parser.parse_args()
+    
+    corpus = load_corpus(args.corpus)
+    fake = FakeGmail(args.port, args.latency).start()
+    fake.fill(corpus, args.inbox_size, args.inbox_unread)
+    print(f"🧪 Fake Gmail API on {fake.host} ({args.inbox_size} message(s), {args.inbox_unread} unread)")
+    
+    try:
+        if args.push_url:
+            for index in range(args.notifications):
+                for _ in range(args.emails_per_notification):
+                    fake.deliver(corpus[(args.inbox_size + index) % len(corpus)])
+                status, _, seconds = push_notification(args.push_url, fake.history_id)
+                print(f"📩 Notification {index + 1}: HTTP {status} in {seconds * 1000:.0f} ms")
+                time.sleep(1 / args.rate)
+            print(f"📊 API calls: {json.dumps(fake.get_stats()['calls'])}")
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Fake Ollama server for benchmarks.
+
+Answers /api/generate (streamed and not) with canned text, taking as long as a
+model with the configured load time and prompt/generation speeds would, and
+reports the same timing fields Ollama does (load_duration, prompt_eval_*,
+eval_*). Needs no GPU, model or network, so benchmarks can run in CI.
+
+Run it on its own with:
+    python benchmarks/fake_ollama.py --port 11434
+or start it from a script with FakeOllama(...).start().
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+import argparse
+import json
+import threading
+import time
+
+# Characters per token used to count prompt tokens (same estimate as content_prep)
+CHARS_PER_TOKEN = 4
+
+_REPLY_WORDS = (
+    "Thanks for reaching out. I have looked at the details and will follow up with "
+    "the requested information before the end of the week. Let me know if anything "
+    "changes in the meantime or if you need something sooner."
+).split()
+
+_SUMMARY_WORDS = (
+    "The sender asks for an update on the project and wants the latest report "
+    "before the deadline. A short confirmation and a date for the report are "
+    "expected in the reply."
+).split()
+
+
+class FakeOllama:
+    """
+    In-process fake Ollama server.
+    
+    Args:
+        port: Port to listen on (0 picks a free one)
+        load_seconds: Time to "load" a model on its first request
+        prompt_tokens_per_second: Simulated prompt evaluation speed
+        eval_tokens_per_second: Simulated generation speed
+        response_tokens: Tokens generated per request
+        parallel: Requests processed at once (like OLLAMA_NUM_PARALLEL); the rest queue
+    """
+    
+    def __init__(self, port: int = 0, load_seconds: float = 0.0, prompt_tokens_per_second: float = 2000,
+                 eval_tokens_per_second: float = 400, response_tokens: int = 40, parallel: int = 4):
+        self.load_seconds = load_seconds
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.eval_tokens_per_second = eval_tokens_per_second
+        self.response_tokens = response_tokens
+        self.slots = threading.Semaphore(max(1, parallel))
+        self.loaded = set()
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        
+        fake = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                fake.handle(self)
+            
+            def do_GET(self):
+                # /api/tags, used by clients to check the server is up
+                self._send_json({"models": [{"name": name} for name in sorted(fake.loaded)]})
+            
+            def _send_json(self, data: Dict):
+                body = json.dumps(data).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+    
+    @property
+    def host(self) -> str:
+        """URL to use as OLLAMA_HOST."""
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+    
+    def start(self) -> "FakeOllama":
+        """Serve in a background thread."""
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        """Stop serving."""
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def _words(self, request: Dict) -> list:
+        """Text to generate for a request, split into tokens."""
+        if not request.get('prompt'):
+            return []
+        count = self.response_tokens
+        if request.get('format') == 'json':
+            half = max(1, count // 2)
+            text = json.dumps({
+                "summary": ' '.join((_SUMMARY_WORDS * count)[:half]),
+                "draft_reply": ' '.join((_REPLY_WORDS * count)[:half]),
+            })
+            # Stream JSON in pieces of about a token
+            return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+        words = _REPLY_WORDS if 'reply' in request['prompt'].split('\n', 1)[0].lower() else _SUMMARY_WORDS
+        return [word + ' ' for word in (words * count)[:count]]
+    
+    def handle(self, handler: BaseHTTPRequestHandler):
+        """Serve one /api/generate request."""
+        length = int(handler.headers.get('Content-Length') or 0)
+        request = json.loads(handler.rfile.read(length) or b'{}')
+        model = request.get('model') or 'fake'
+        prompt_tokens = (len(request.get('prompt') or '') + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+        words = self._words(request)
+        start_time = time.time()
+        
+        with self.slots:
+            with self._lock:
+                self.requests += 1
+                cold = model not in self.loaded
+                self.loaded.add(model)
+            load_seconds = self.load_seconds if cold else 0.0
+            prompt_seconds = prompt_tokens / self.prompt_tokens_per_second
+            eval_seconds = len(words) / self.eval_tokens_per_second
+            time.sleep(load_seconds + prompt_seconds)
+            
+            final = {
+                "model": model,
+                "created_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                "response": "",
+                "done": True,
+                "load_duration": int(load_seconds * 1e9),
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int(prompt_seconds * 1e9),
+                "eval_count": len(words),
+                "eval_duration": int(eval_seconds * 1e9),
+            }
+            
+            if request.get('stream', True):
+                handler.send_response(200)
+                handler.send_header('Content-Type', 'application/x-ndjson')
+                handler.end_headers()
+                for word in words:
+                    time.sleep(1 / self.eval_tokens_per_second)
+                    chunk = {"model": model, "response": word, "done": False}
+                    handler.wfile.write(json.dumps(chunk).encode() + b"\n")
+                    handler.wfile.flush()
+            else:
+                time.sleep(eval_seconds)
+                final["response"] = ''.join(words)
+            
+            final["total_duration"] = int((time.time() - start_time) * 1e9)
+            body = json.dumps(final).encode() + b"\n"
+            if not request.get('stream', True):
+                handler.send_response(200)
+                handler.send_header('Content-Type', 'application/json')
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+            handler.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Ollama server for benchmarks")
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--load-seconds', type=float, default=0.0, help="Model load time on first use")
+    parser.add_argument('--prompt-rate', type=float, default=2000, help="Prompt tokens per second")
+    parser.add_argument('--eval-rate', type=float, default=400, help="Generated tokens per second")
+    parser.add_argument('--response-tokens', type=int, default=40, help="Tokens generated per request")
+    parser.add_argument('--parallel', type=int, default=4, help="Requests processed at once")
+    args = parser.parse_args()
+    
+    fake = FakeOllama(args.port, args.load_seconds, args.prompt_rate, args.eval_rate,
+                      args.response_tokens, args.parallel)
+    print(f"🧪 Fake Ollama listening on {fake.host}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
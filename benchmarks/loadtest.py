@@ -0,0 +1,287 @@
+"""
+End-to-end load test of the Pub/Sub webhook.
+
+Starts the AutoMail server (uvicorn notify:app) against a fake Gmail API
+(fake_gmail.py) and a fake Ollama (fake_ollama.py), with its state in a
+temporary directory. It then delivers emails to the fake mailbox and sends
+the matching Pub/Sub push notifications to /pubsub/gmail at a fixed rate.
+Finally it reports:
+
+- email-to-dashboard latency, from delivery to the email_added event on /api/events
+- push acknowledgement latency
+- Gmail API calls per notification
+
+Examples:
+    python benchmarks/loadtest.py
+    python benchmarks/loadtest.py --rate 5 --notifications 100 --emails-per-notification 2 --inbox-size 2000
+    python benchmarks/loadtest.py --env AUTOMAIL_REPLY_MODE=lazy --env AUTOMAIL_MAX_IN_FLIGHT=4
+"""
+
+from typing import Dict, List
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+from fake_gmail import FakeGmail, load_corpus, push_notification
+from fake_ollama import FakeOllama
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+EMAILREAD_DIR = os.path.join(BENCH_DIR, '..', 'EmailRead')
+DEFAULT_CORPUS = os.path.join(BENCH_DIR, 'corpus', 'emails.json')
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    """Nearest-rank percentile of a list of values."""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(percent / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def _summary(values: List[float]) -> Dict:
+    """p50/p95/p99/max of a list of seconds."""
+    return {
+        "count": len(values),
+        "p50": round(_percentile(values, 50), 3),
+        "p95": round(_percentile(values, 95), 3),
+        "p99": round(_percentile(values, 99), 3),
+        "max": round(max(values), 3) if values else 0,
+    }
+
+
+class DashboardListener:
+    """Follows /api/events like a dashboard and records when each email shows up."""
+    
+    def __init__(self, base_url: str):
+        self.url = f"{base_url}/api/events"
+        self.added: Dict[str, float] = {}
+        self.failed: Dict[str, float] = {}
+        self.connected = threading.Event()
+        self._response = None
+    
+    def start(self) -> "DashboardListener":
+        """Listen in a background thread."""
+        threading.Thread(target=self._run, name="dashboard-listener", daemon=True).start()
+        return self
+    
+    def stop(self):
+        """Disconnect from the event stream."""
+        if self._response is not None:
+            self._response.close()
+    
+    def _run(self):
+        try:
+            self._response = urllib.request.urlopen(self.url, timeout=3600)
+            self.connected.set()
+            self._follow(self._response)
+        except (OSError, ValueError, AttributeError):
+            # Closed by stop()
+            pass
+    
+    def _follow(self, response):
+        """Record email_added and processing_failed events as they arrive."""
+        event_type = None
+        for raw_line in response:
+            line = raw_line.decode('utf-8').rstrip('\r\n')
+            if line.startswith('event:'):
+                event_type = line[6:].strip()
+            elif line.startswith('data:') and event_type in ("email_added", "processing_failed"):
+                data = json.loads(line[5:])
+                if event_type == "email_added":
+                    self.added.setdefault(data['email'].get('email_id'), time.time())
+                else:
+                    self.failed.setdefault(data.get('email_id'), time.time())
+            elif not line:
+                event_type = None
+
+
+def start_server(port: int, env: Dict[str, str], log_path: str) -> subprocess.Popen:
+    """Start the AutoMail server and wait until it answers."""
+    log = open(log_path, 'w')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'notify:app', '--app-dir', EMAILREAD_DIR,
+         '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning',
+         '--timeout-graceful-shutdown', '5'],
+        env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"AutoMail server exited with code {process.returncode}; see {log_path}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/api/jobs", timeout=1).read()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"AutoMail server did not start within 60s; see {log_path}")
+
+
+def _free_port() -> int:
+    """Return a port nothing is listening on."""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def run(args) -> Dict:
+    """Run the load test and return the report."""
+    corpus = load_corpus(args.corpus)
+    state_dir = tempfile.mkdtemp(prefix="automail-loadtest-")
+    
+    gmail = FakeGmail(latency_seconds=args.gmail_latency).start()
+    gmail.fill(corpus, args.inbox_size, args.inbox_unread)
+    ollama = None
+    if not args.ollama_host:
+        ollama = FakeOllama(load_seconds=args.fake_load_seconds, eval_tokens_per_second=args.fake_eval_rate,
+                            response_tokens=args.fake_response_tokens, parallel=args.fake_parallel).start()
+    
+    port = args.port or _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "AUTOMAIL_GMAIL_API_URL": gmail.host,
+        "AUTOMAIL_STATE_DIR": state_dir,
+        "AUTOMAIL_LLM_CACHE": "0",
+        "OLLAMA_HOST": args.ollama_host or ollama.host,
+        "PYTHONUNBUFFERED": "1",
+    }
+    for setting in args.env:
+        key, _, value = setting.partition('=')
+        env[key] = value
+    
+    log_path = os.path.join(state_dir, 'server.log')
+    print(f"🚀 Starting AutoMail on {base_url} (state and log in {state_dir})")
+    server = start_server(port, env, log_path)
+    listener = DashboardListener(base_url).start()
+    listener.connected.wait(10)
+    
+    # Let the startup fetch of unread mail finish so it isn't counted per notification
+    time.sleep(args.settle_seconds)
+    calls_before = gmail.get_stats()["calls"]
+    
+    delivered: Dict[str, float] = {}
+    acks: List[float] = []
+    statuses: Dict[int, int] = {}
+    coalesced = 0
+    index = args.inbox_size
+    start_time = time.time()
+    print(f"📩 Sending {args.notifications} notification(s) at {args.rate}/s, "
+          f"{args.emails_per_notification} email(s) each...")
+    for number in range(args.notifications):
+        target = start_time + number / args.rate
+        time.sleep(max(0, target - time.time()))
+        for _ in range(args.emails_per_notification):
+            delivered[gmail.deliver(corpus[index % len(corpus)])] = time.time()
+            index += 1
+        status, response, seconds = push_notification(f"{base_url}/pubsub/gmail", gmail.history_id)
+        acks.append(seconds)
+        statuses[status] = statuses.get(status, 0) + 1
+        coalesced += 1 if response.get('coalesced') else 0
+    send_time = time.time() - start_time
+    
+    print(f"⏳ Waiting up to {args.timeout:g}s for {len(delivered)} email(s) to reach the dashboard...")
+    deadline = time.time() + args.timeout
+    while time.time() < deadline:
+        if all(email_id in listener.added or email_id in listener.failed for email_id in delivered):
+            break
+        time.sleep(0.1)
+    total_time = time.time() - start_time
+    
+    calls_after = gmail.get_stats()["calls"]
+    calls = {name: calls_after.get(name, 0) - calls_before.get(name, 0) for name in calls_after}
+    calls = {name: count for name, count in calls.items() if count}
+    http_requests = sum(count for name, count in calls.items() if not name.startswith("batch."))
+    
+    latencies = [listener.added[email_id] - at for email_id, at in delivered.items() if email_id in listener.added]
+    listener.stop()
+    server.terminate()
+    try:
+        server.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+    gmail.stop()
+    if ollama is not None:
+        ollama.stop()
+    
+    return {
+        "notifications": args.notifications,
+        "rate": args.rate,
+        "emails_delivered": len(delivered),
+        "emails_on_dashboard": len(latencies),
+        "emails_failed": sum(1 for email_id in delivered if email_id in listener.failed),
+        "emails_missing": sum(1 for email_id in delivered
+                              if email_id not in listener.added and email_id not in listener.failed),
+        "inbox_size": args.inbox_size,
+        "send_seconds": round(send_time, 2),
+        "total_seconds": round(total_time, 2),
+        "emails_per_minute": round(len(latencies) / total_time * 60, 1) if total_time else 0,
+        "email_to_dashboard_seconds": _summary(latencies),
+        "push_ack_seconds": _summary(acks),
+        "push_statuses": statuses,
+        "coalesced_notifications": coalesced,
+        "gmail_calls": calls,
+        "gmail_http_requests_per_notification": round(http_requests / args.notifications, 2),
+        "gmail_calls_per_notification": {
+            name: round(count / args.notifications, 2) for name, count in sorted(calls.items())
+        },
+        "state_dir": state_dir,
+    }
+
+
+def print_report(report: Dict):
+    """Print the report in a readable form."""
+    latency = report["email_to_dashboard_seconds"]
+    acks = report["push_ack_seconds"]
+    print(f"\n📊 {report['emails_on_dashboard']}/{report['emails_delivered']} email(s) reached the dashboard "
+          f"({report['emails_failed']} failed, {report['emails_missing']} missing) in {report['total_seconds']}s "
+          f"({report['emails_per_minute']}/min)")
+    print(f"   Email to dashboard: p50 {latency['p50']}s, p95 {latency['p95']}s, p99 {latency['p99']}s, "
+          f"max {latency['max']}s")
+    print(f"   Push ack:           p50 {acks['p50'] * 1000:.0f} ms, p95 {acks['p95'] * 1000:.0f} ms, "
+          f"statuses {report['push_statuses']}, {report['coalesced_notifications']} coalesced")
+    print(f"   Gmail API: {report['gmail_http_requests_per_notification']} HTTP request(s) per notification")
+    for name, per_notification in report["gmail_calls_per_notification"].items():
+        print(f"      {name:<20} {report['gmail_calls'][name]:>6}  ({per_notification}/notification)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test of the Gmail Pub/Sub webhook")
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help="JSON list of emails to deliver")
+    parser.add_argument('--rate', type=float, default=2.0, help="Notifications per second")
+    parser.add_argument('--notifications', type=int, default=20, help="Notifications to send")
+    parser.add_argument('--emails-per-notification', type=int, default=1, help="Emails delivered per notification")
+    parser.add_argument('--inbox-size', type=int, default=200, help="Messages in the mailbox before the test")
+    parser.add_argument('--inbox-unread', type=int, default=0, help="How many of them are unread")
+    parser.add_argument('--gmail-latency', type=float, default=0.02, help="Seconds every Gmail API request takes")
+    parser.add_argument('--settle-seconds', type=float, default=2.0, help="Wait after startup before sending")
+    parser.add_argument('--timeout', type=float, default=120, help="Seconds to wait for the last email")
+    parser.add_argument('--port', type=int, help="Port for the AutoMail server (default: a free one)")
+    parser.add_argument('--env', action='append', default=[], metavar="KEY=VALUE",
+                        help="AutoMail setting for the server (repeatable)")
+    parser.add_argument('--ollama-host', help="Use this Ollama server instead of the fake one")
+    parser.add_argument('--fake-load-seconds', type=float, default=0.5, help="Fake model load time")
+    parser.add_argument('--fake-eval-rate', type=float, default=400, help="Fake generated tokens per second")
+    parser.add_argument('--fake-response-tokens', type=int, default=40, help="Fake tokens per response")
+    parser.add_argument('--fake-parallel', type=int, default=4, help="Requests the fake Ollama runs at once")
+    parser.add_argument('--json', help="Also write the report to this JSON file")
+    args = parser.parse_args()
+    
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
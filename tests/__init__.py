@@ -0,0 +1,28 @@
+"""
+Unit tests for AutoMail.
+
+Run from the repository root with:
+    
+    python -m unittest discover -s tests -t .
+
+Modules are imported the way the server runs them (EmailRead on sys.path),
+with state files in a temporary directory and the LLM cache off, so the
+tests never touch the real .automail.db. The fakes from benchmarks/ stand in
+for Gmail and Ollama.
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Settings are read when the modules are imported
+_state_dir = tempfile.TemporaryDirectory(prefix="automail-tests-")
+os.environ["AUTOMAIL_STATE_DIR"] = _state_dir.name
+os.environ.setdefault("AUTOMAIL_LLM_CACHE", "0")
+os.environ.setdefault("AUTOMAIL_LOG_LEVEL", "ERROR")
+
+for path in (os.path.join(ROOT, 'EmailRead'), os.path.join(ROOT, 'benchmarks')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
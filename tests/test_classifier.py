@@ -0,0 +1,66 @@
+import contextlib
+import io
+import unittest
+from unittest import mock
+
+import classifier
+import main
+import priority
+
+
+def _email(**fields) -> dict:
+    return {
+        "id": "m1",
+        "from": "Sam <sam@example.com>",
+        "subject": "Lunch on Friday?",
+        "body": "Are you free for lunch on Friday? There's a new place near the office.",
+        "snippet": "Are you free for lunch on Friday?",
+        "headers": {},
+        **fields,
+    }
+
+
+class ClassifyTest(unittest.TestCase):
+    
+    def test_personal_mail_goes_to_the_model(self):
+        self.assertIsNone(classifier.classify(_email(), mode="text"))
+    
+    def test_header_rules(self):
+        cases = [
+            ({"headers": {"list-unsubscribe": "<mailto:u@example.com>"}}, classifier.CATEGORY_NEWSLETTER),
+            ({"headers": {"list-id": "<news.example.com>"}}, classifier.CATEGORY_NEWSLETTER),
+            ({"headers": {"precedence": "Bulk"}}, classifier.CATEGORY_NEWSLETTER),
+            ({"headers": {"auto-submitted": "auto-generated"}}, classifier.CATEGORY_NOTIFICATION),
+            ({"from": "GitHub <noreply@github.com>"}, classifier.CATEGORY_NOTIFICATION),
+            ({"from": "Bank <do-not-reply@bank.example>"}, classifier.CATEGORY_NOTIFICATION),
+        ]
+        for fields, category in cases:
+            with self.subTest(**fields):
+                self.assertEqual(classifier.classify(_email(**fields), mode="headers")['category'], category)
+        self.assertIsNone(classifier.classify(_email(headers={"auto-submitted": "no"}), mode="headers"))
+    
+    def test_text_rules_only_in_text_mode(self):
+        receipt = _email(subject="Your receipt", body="Payment received for your order #123. Thank you!")
+        self.assertIsNone(classifier.classify(receipt, mode="headers"))
+        self.assertEqual(classifier.classify(receipt, mode="text")['category'], classifier.CATEGORY_RECEIPT)
+        # One weak signal isn't enough
+        self.assertIsNone(classifier.classify(_email(body="What about your order of pizza?"), mode="text"))
+    
+    def test_off_mode_and_priority_senders_always_use_the_model(self):
+        newsletter = _email(headers={"list-id": "<news.example.com>"})
+        self.assertIsNone(classifier.classify(newsletter, mode="off"))
+        with mock.patch.object(priority, 'PRIORITY_SENDERS', ["example.com"]):
+            self.assertIsNone(classifier.classify(newsletter, mode="headers"))
+    
+    def test_skipped_email_gets_a_template_summary_without_a_model_call(self):
+        newsletter = _email(subject="Weekly digest", headers={"list-id": "<news.example.com>"})
+        model_call = mock.Mock(side_effect=AssertionError("model called"))
+        with mock.patch.object(main, 'summarize_email', model_call), \
+                mock.patch.object(main, 'generate_draft_reply', model_call), \
+                mock.patch.object(classifier, 'CLASSIFIER_MODE', "headers"), \
+                contextlib.redirect_stdout(io.StringIO()):
+            result = main.process_email(newsletter)
+        
+        self.assertEqual(result['category'], classifier.CATEGORY_NEWSLETTER)
+        self.assertEqual(result['summary'], "Newsletter from Sam: Weekly digest")
+        self.assertIsNone(result.get('draft_reply'))
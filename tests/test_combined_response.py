@@ -0,0 +1,28 @@
+import unittest
+
+from main import _parse_combined_response
+
+
+class ParseCombinedResponseTest(unittest.TestCase):
+    
+    def test_json_object(self):
+        text = '{"summary": " Meeting moved to 3pm. ", "draft_reply": "Thanks, see you then."}'
+        self.assertEqual(_parse_combined_response(text), ("Meeting moved to 3pm.", "Thanks, see you then."))
+    
+    def test_json_in_code_fence_with_extra_text(self):
+        text = ('Here you go:\n```json\n'
+                '{"summary": "Invoice overdue.", "reply": "I will pay it today."}\n```\nHope that helps!')
+        self.assertEqual(_parse_combined_response(text), ("Invoice overdue.", "I will pay it today."))
+    
+    def test_section_headings(self):
+        text = "**Summary:** Bob needs the slides.\n\n**Draft Reply:** Hi Bob, attached are the slides."
+        self.assertEqual(_parse_combined_response(text),
+                         ("Bob needs the slides.", "Hi Bob, attached are the slides."))
+    
+    def test_json_with_an_empty_field_falls_back_to_headings(self):
+        self.assertIsNone(_parse_combined_response('{"summary": "Something", "draft_reply": ""}'))
+    
+    def test_unparseable(self):
+        self.assertIsNone(_parse_combined_response(""))
+        self.assertIsNone(_parse_combined_response("I can't help with that."))
+        self.assertIsNone(_parse_combined_response('["summary", "reply"]'))
@@ -0,0 +1,75 @@
+import unittest
+
+import content_prep
+
+
+class CleanTest(unittest.TestCase):
+    
+    def test_strips_quoted_history_and_signature(self):
+        body = (
+            "Can you send the report by Friday?\n"
+            "\n"
+            "-- \n"
+            "Sam\n"
+            "\n"
+            "On Mon, 1 Jan 2024 at 10:00, Alex <alex@example.com> wrote:\n"
+            "> Here is the draft.\n"
+        )
+        self.assertEqual(content_prep.clean(body), "Can you send the report by Friday?")
+    
+    def test_keeps_original_when_nothing_is_left(self):
+        body = "> only quoted text"
+        self.assertEqual(content_prep.clean(body), body)
+
+
+class SplitChunksTest(unittest.TestCase):
+    
+    def test_chunks_cover_text_in_order_within_budget(self):
+        paragraphs = [f"Paragraph {i}. " + "word " * 60 for i in range(20)]
+        text = "\n\n".join(paragraphs)
+        chunks = content_prep.split_chunks(text, 100)
+        
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(content_prep.estimate_tokens(chunk), 100)
+            self.assertNotIn(content_prep.TRUNCATION_MARKER, chunk)
+        # Nothing lost or reordered, apart from whitespace at the cuts
+        self.assertEqual("".join("".join(chunks).split()), "".join(text.split()))
+    
+    def test_short_text_is_one_chunk(self):
+        self.assertEqual(content_prep.split_chunks("Hello there.", 100), ["Hello there."])
+    
+    def test_empty_text_has_no_chunks(self):
+        self.assertEqual(content_prep.split_chunks("", 100), [])
+    
+    def test_budget_smaller_than_the_marker_still_makes_progress(self):
+        text = "Short words, then more of them."
+        for max_tokens in (0, 1, 2):
+            with self.subTest(max_tokens=max_tokens):
+                chunks = content_prep.split_chunks(text, max_tokens)
+                self.assertEqual("".join("".join(chunks).split()), "".join(text.split()))
+
+
+class PrepareTest(unittest.TestCase):
+    
+    def test_short_email_is_sent_in_full(self):
+        prepared = content_prep.prepare("Lunch at noon?")
+        self.assertEqual(prepared['strategy'], content_prep.STRATEGY_FULL)
+        self.assertEqual(prepared['content'], "Lunch at noon?")
+        self.assertEqual(prepared['chunks'], [])
+    
+    def test_long_email_is_truncated_to_budget(self):
+        text = "word " * (content_prep.TOKEN_BUDGET * content_prep.CHARS_PER_TOKEN // 5 + 200)
+        prepared = content_prep.prepare(text)
+        self.assertEqual(prepared['strategy'], content_prep.STRATEGY_TRUNCATED)
+        self.assertTrue(prepared['content'].endswith(content_prep.TRUNCATION_MARKER))
+        self.assertLessEqual(content_prep.estimate_tokens(prepared['content']), content_prep.TOKEN_BUDGET)
+    
+    def test_very_long_email_is_map_reduced(self):
+        words = content_prep.MAP_REDUCE_THRESHOLD_TOKENS * content_prep.CHARS_PER_TOKEN // 5 + 200
+        prepared = content_prep.prepare("word " * words)
+        self.assertEqual(prepared['strategy'], content_prep.STRATEGY_MAP_REDUCE)
+        self.assertGreater(len(prepared['chunks']), 1)
+        self.assertLessEqual(len(prepared['chunks']), content_prep.MAX_CHUNKS)
+        self.assertLessEqual(content_prep.estimate_tokens(prepared['content']), content_prep.TOKEN_BUDGET)
+
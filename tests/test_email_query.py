@@ -0,0 +1,51 @@
+import unittest
+
+import email_query
+
+
+def _email(index: int, **fields) -> dict:
+    return {
+        "email_id": f"m{index}",
+        "date": f"Mon, 1 Jan 2024 10:{index:02d}:00 +0000",
+        "from": "Sam <sam@example.com>",
+        "subject": f"Subject {index}",
+        **fields,
+    }
+
+
+class QueryEmailsTest(unittest.TestCase):
+    
+    def test_cursor_pages_through_every_email_once(self):
+        emails = [_email(i) for i in range(7)]
+        # Two emails with the same date are ordered by email_id
+        emails.append(_email(3, email_id="m3b"))
+        
+        seen, cursor = [], None
+        while True:
+            page = email_query.query_emails(emails, limit=3, cursor=cursor)
+            self.assertEqual(page['total'], 8)
+            seen += [e['email_id'] for e in page['emails']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        
+        self.assertEqual(seen, ["m6", "m5", "m4", "m3b", "m3", "m2", "m1", "m0"])
+    
+    def test_cursor_is_stable_when_newer_emails_arrive(self):
+        emails = [_email(i) for i in range(5)]
+        first = email_query.query_emails(emails, limit=2)
+        emails.append(_email(9))
+        second = email_query.query_emails(emails, limit=2, cursor=first['next_cursor'])
+        self.assertEqual([e['email_id'] for e in second['emails']], ["m2", "m1"])
+    
+    def test_search_and_projection(self):
+        emails = [_email(0, summary="Invoice overdue"), _email(1, summary="Lunch plans")]
+        page = email_query.query_emails(emails, search="INVOICE", fields="subject")
+        self.assertEqual(page['emails'], [{"email_id": "m0", "subject": "Subject 0"}])
+        self.assertEqual(page['total'], 1)
+    
+    def test_invalid_queries(self):
+        for kwargs in ({"cursor": "not-a-cursor"}, {"filter_name": "starred"},
+                       {"fields": "password"}, {"limit": 0}):
+            with self.subTest(**kwargs), self.assertRaises(email_query.InvalidQueryError):
+                email_query.query_emails([_email(0)], **kwargs)
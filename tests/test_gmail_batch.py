@@ -0,0 +1,168 @@
+import base64
+import contextlib
+import asyncio
+import io
+import threading
+import unittest
+from unittest import mock
+
+from fake_gmail import FakeGmail
+import notify
+
+
+def _message(message_id: str, subject: str) -> dict:
+    body = f"Body of {subject}, long enough to be kept over the snippet."
+    return {
+        "id": message_id,
+        "threadId": message_id,
+        "labelIds": ["INBOX", "UNREAD"],
+        "snippet": body[:20],
+        "payload": {
+            "mimeType": "text/plain",
+            "headers": [{"name": "From", "value": "Sam <sam@example.com>"}, {"name": "Subject", "value": subject}],
+            "body": {"data": base64.urlsafe_b64encode(body.encode()).decode()},
+        },
+    }
+
+
+class StubGmail:
+    """Just enough of the Gmail service for batched messages.get calls."""
+    
+    def __init__(self, messages, failing_batches=(), unanswered=()):
+        self.mailbox = {m['id']: m for m in messages}
+        self.failing_batches = set(failing_batches)
+        self.unanswered = set(unanswered)
+        self.batches = []
+    
+    def users(self):
+        return self
+    
+    def messages(self):
+        return self
+    
+    def get(self, userId, id, format):
+        return id
+    
+    def new_batch_http_request(self, callback):
+        return StubBatch(self, callback)
+
+
+class StubBatch:
+    
+    def __init__(self, gmail: StubGmail, callback):
+        self.gmail = gmail
+        self.callback = callback
+        self.requests = []
+    
+    def add(self, request, request_id):
+        self.requests.append(request_id)
+    
+    def execute(self):
+        self.gmail.batches.append(self.requests)
+        if len(self.gmail.batches) - 1 in self.gmail.failing_batches:
+            raise ConnectionError("connection reset")
+        for message_id in self.requests:
+            if message_id in self.gmail.unanswered:
+                continue
+            if message_id in self.gmail.mailbox:
+                self.callback(message_id, self.gmail.mailbox[message_id], None)
+            else:
+                self.callback(message_id, None, LookupError(f"404 {message_id} not found"))
+
+
+class GetEmailContentsBatchTest(unittest.TestCase):
+    
+    def _fetch(self, gmail: StubGmail, message_ids):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return notify.get_email_contents_batch(message_ids, gmail)
+    
+    def test_one_failed_message_does_not_affect_the_others(self):
+        gmail = StubGmail([_message("a", "First"), _message("b", "Second")])
+        
+        emails, errors = self._fetch(gmail, ["a", "missing", "b", "a"])
+        
+        # Input order, duplicates fetched once
+        self.assertEqual([e['id'] for e in emails], ["a", "b"])
+        self.assertEqual([e['subject'] for e in emails], ["First", "Second"])
+        self.assertTrue(emails[0]['body'].startswith("Body of First"))
+        self.assertEqual(list(errors), ["missing"])
+        self.assertIn("404", errors["missing"])
+    
+    def test_failed_round_trip_only_affects_its_batch(self):
+        message_ids = [f"m{i}" for i in range(notify.GMAIL_BATCH_SIZE + 5)]
+        gmail = StubGmail([_message(m, m) for m in message_ids], failing_batches={0})
+        
+        emails, errors = self._fetch(gmail, message_ids)
+        
+        self.assertEqual([len(batch) for batch in gmail.batches], [notify.GMAIL_BATCH_SIZE, 5])
+        self.assertEqual(list(errors), message_ids[:notify.GMAIL_BATCH_SIZE])
+        self.assertEqual([e['id'] for e in emails], message_ids[notify.GMAIL_BATCH_SIZE:])
+    
+    def test_message_left_out_of_the_response_is_an_error(self):
+        gmail = StubGmail([_message("a", "First"), _message("b", "Second")], unanswered={"b"})
+        
+        emails, errors = self._fetch(gmail, ["a", "b"])
+        
+        self.assertEqual([e['id'] for e in emails], ["a"])
+        self.assertEqual(errors, {"b": "No response in batch"})
+
+
+class FakeGmailBatchTest(unittest.TestCase):
+    """The same calls through the real client, against benchmarks/fake_gmail.py."""
+    
+    def setUp(self):
+        self.gmail = FakeGmail().start()
+        self.addCleanup(self.gmail.stop)
+        with mock.patch.object(notify, 'GMAIL_API_URL', self.gmail.host), \
+                mock.patch.object(notify, '_gmail_local', threading.local()):
+            self.service = notify.get_gmail_service()
+    
+    def _deliver(self, subject: str) -> str:
+        return self.gmail.deliver({
+            "from": "Sam <sam@example.com>",
+            "subject": subject,
+            "body": f"Body of {subject}, long enough to be kept over the snippet.",
+        })
+    
+    def test_large_requests_are_split_into_batches(self):
+        message_ids = [self._deliver(f"Email {i}") for i in range(notify.GMAIL_BATCH_SIZE + 5)]
+        
+        with contextlib.redirect_stdout(io.StringIO()):
+            emails, errors = notify.get_email_contents_batch(message_ids, self.service)
+        
+        self.assertEqual(errors, {})
+        self.assertEqual([e['id'] for e in emails], message_ids)
+        self.assertEqual(self.gmail.calls["batch"], 2)
+    
+    def test_each_thread_gets_its_own_client(self):
+        with mock.patch.object(notify, 'GMAIL_API_URL', self.gmail.host), \
+                mock.patch.object(notify, '_gmail_local', threading.local()):
+            services = [notify.get_gmail_service()]
+            thread = threading.Thread(target=lambda: services.append(notify.get_gmail_service()))
+            thread.start()
+            thread.join()
+            services.append(notify.get_gmail_service())
+        
+        self.assertIs(services[0], services[2])
+        self.assertIsNot(services[0], services[1])
+        self.assertIsNot(services[0]._http, services[1]._http)
+    
+    def test_manual_fetch_calls_gmail_off_the_event_loop(self):
+        self._deliver("First")
+        threads = set()
+        gmail_execute = notify.metrics.gmail_execute
+        
+        def record_thread(*args, **kwargs):
+            threads.add(threading.current_thread())
+            return gmail_execute(*args, **kwargs)
+        
+        with mock.patch.object(notify, 'GMAIL_API_URL', self.gmail.host), \
+                mock.patch.object(notify, '_gmail_local', threading.local()), \
+                mock.patch.object(notify.metrics, 'gmail_execute', record_thread), \
+                mock.patch.object(notify, 'enqueue_process_jobs', return_value=1) as enqueue:
+            result = asyncio.run(notify.fetch_emails_manually())
+        
+        self.assertEqual(result['emails_count'], 1)
+        self.assertEqual([e['subject'] for e in enqueue.call_args[0][0]], ["First"])
+        self.assertTrue(threads)
+        self.assertNotIn(threading.current_thread(), threads)
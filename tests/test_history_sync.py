@@ -0,0 +1,59 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from googleapiclient.errors import HttpError
+import httplib2
+
+import history_sync
+
+
+def _added(message_id: str, labels=("INBOX", "UNREAD")) -> dict:
+    return {"messagesAdded": [{"message": {"id": message_id, "labelIds": list(labels)}}]}
+
+
+class CollectNewMessageIdsTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        patcher = mock.patch.object(history_sync, '_history_state_file',
+                                    os.path.join(self.dir.name, 'history.json'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        
+        self.service = mock.MagicMock()
+        self.service.users().getProfile().execute.return_value = {"historyId": "500"}
+        self.service.users().messages().list().execute.return_value = {"messages": [{"id": "a"}, {"id": "b"}]}
+    
+    def _collect(self, notification_history_id=None):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return history_sync.collect_new_message_ids(self.service, notification_history_id)
+    
+    def test_lists_history_since_the_stored_id(self):
+        history_sync.save_last_history_id("100")
+        self.service.users().history().list().execute.side_effect = [
+            {"history": [_added("m1"), _added("sent", labels=("SENT",))], "nextPageToken": "p2"},
+            {"history": [_added("m2"), _added("m1")], "historyId": "130"},
+        ]
+        
+        self.assertEqual(self._collect("120"), (["m1", "m2"], "130", "incremental"))
+    
+    def test_expired_history_falls_back_to_a_full_sync(self):
+        history_sync.save_last_history_id("100")
+        self.service.users().history().list().execute.side_effect = HttpError(
+            httplib2.Response({"status": "404"}), b"Requested entity was not found."
+        )
+        
+        self.assertEqual(self._collect("120"), (["a", "b"], "500", "full"))
+    
+    def test_full_sync_without_a_stored_id(self):
+        self.assertEqual(self._collect("120"), (["a", "b"], "500", "full"))
+    
+    def test_notification_already_processed(self):
+        history_sync.save_last_history_id("100")
+        self.assertEqual(self._collect("90"), ([], "100", "incremental"))
+        self.service.users().history().list().execute.assert_not_called()
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+
+from id_journal import ProcessedIdJournal
+
+
+class ProcessedIdJournalTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'ids.journal')
+    
+    def tearDown(self):
+        self.dir.cleanup()
+    
+    def _write(self, data: str):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(data)
+    
+    def test_append_and_replay(self):
+        journal = ProcessedIdJournal(self.path)
+        journal.append(["a", "b"])
+        journal.append(["b", "c", ""])
+        journal.close()
+        self.assertEqual(ProcessedIdJournal(self.path).replay(), {"a", "b", "c"})
+    
+    def test_replay_ignores_torn_last_record(self):
+        # A crash mid-append left "de" without its newline
+        self._write("a\nb\nde")
+        self.assertEqual(ProcessedIdJournal(self.path).replay(), {"a", "b"})
+    
+    def test_append_after_torn_record_starts_a_new_line(self):
+        self._write("a\nde")
+        journal = ProcessedIdJournal(self.path)
+        journal.append(["c"])
+        journal.close()
+        # The torn record becomes a line of its own instead of merging into "dec"
+        self.assertEqual(ProcessedIdJournal(self.path).replay(), {"a", "de", "c"})
+    
+    def test_missing_journal_replays_empty(self):
+        journal = ProcessedIdJournal(self.path)
+        self.assertFalse(journal.exists())
+        self.assertEqual(journal.replay(), set())
+    
+    def test_rewrite_replaces_contents(self):
+        journal = ProcessedIdJournal(self.path)
+        journal.append(["a", "b"])
+        journal.rewrite(["c", "c", "d"])
+        journal.append(["e"])
+        journal.close()
+        self.assertEqual(ProcessedIdJournal(self.path).replay(), {"c", "d", "e"})
+    
+    def test_compaction_keeps_distinct_ids(self):
+        journal = ProcessedIdJournal(self.path, compact_threshold=10 ** 9)
+        journal.append(["a", "b", "a", "b", "c"])
+        journal._compact()
+        journal.append(["d"])
+        journal.close()
+        with open(self.path, encoding='utf-8') as f:
+            self.assertEqual(f.read(), "a\nb\nc\nd\n")
+        self.assertEqual(journal.stats["compactions"], 1)
@@ -0,0 +1,102 @@
+import time
+import unittest
+from unittest import mock
+
+import job_queue
+
+
+def _merge(queued, incoming):
+    return {"count": queued["count"] + incoming["count"]}
+
+
+class JobQueueTest(unittest.TestCase):
+    
+    def setUp(self):
+        with job_queue._lock:
+            job_queue.get_connection().execute("DELETE FROM jobs")
+    
+    def _make_ready(self, job_id: int):
+        with job_queue._lock:
+            job_queue.get_connection().execute("UPDATE jobs SET available_at = 0 WHERE id = ?", (job_id,))
+    
+    def test_dedupe_key_adds_a_job_once(self):
+        self.assertIsNotNone(job_queue.enqueue("process", {"n": 1}, dedupe_key="m1"))
+        self.assertIsNone(job_queue.enqueue("process", {"n": 2}, dedupe_key="m1"))
+        # The key stays taken after the job is done, so re-delivered work is skipped
+        job_queue.complete(job_queue.claim("process")[0]['id'])
+        self.assertIsNone(job_queue.enqueue("process", {"n": 3}, dedupe_key="m1"))
+    
+    def test_claims_oldest_first_and_only_once(self):
+        job_queue.enqueue("process", {"name": "first"})
+        job_queue.enqueue("process", {"name": "second"})
+        self.assertEqual(job_queue.claim("process")[0]['payload'], {"name": "first"})
+        self.assertEqual(job_queue.claim("process", limit=5)[0]['payload'], {"name": "second"})
+        self.assertEqual(job_queue.claim("process"), [])
+    
+    def test_expired_lease_makes_a_running_job_claimable(self):
+        job_queue.enqueue("process", {})
+        with mock.patch.object(job_queue, 'LEASE_SECONDS', 0):
+            [first] = job_queue.claim("process")
+        [again] = job_queue.claim("process")
+        self.assertEqual(again['id'], first['id'])
+        self.assertEqual(again['attempts'], 2)
+        # Within the lease it isn't handed out twice
+        self.assertEqual(job_queue.claim("process"), [])
+    
+    def test_failure_backs_off_then_dead_letters(self):
+        job_id = job_queue.enqueue("process", {}, max_attempts=2)
+        [job] = job_queue.claim("process")
+        before = time.time()
+        self.assertEqual(job_queue.fail(job, "boom"), "pending")
+        
+        with job_queue._lock:
+            available_at = job_queue.get_connection().execute(
+                "SELECT available_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()[0]
+        self.assertGreaterEqual(available_at, before + job_queue.BACKOFF_BASE_SECONDS * 0.5)
+        self.assertLessEqual(available_at, time.time() + job_queue.BACKOFF_BASE_SECONDS)
+        self.assertEqual(job_queue.claim("process"), [])
+        
+        self._make_ready(job_id)
+        [job] = job_queue.claim("process")
+        self.assertEqual(job['attempts'], 2)
+        self.assertEqual(job_queue.fail(job, "boom again"), "dead")
+        self.assertEqual([j['id'] for j in job_queue.list_jobs("dead")], [job_id])
+        
+        self.assertTrue(job_queue.retry(job_id))
+        self.assertEqual(job_queue.claim("process")[0]['attempts'], 1)
+    
+    def test_coalesces_jobs_of_a_group_until_it_starts(self):
+        first = job_queue.enqueue_coalesced("sync", "mailbox", {"count": 1}, 0, _merge)
+        second = job_queue.enqueue_coalesced("sync", "mailbox", {"count": 2}, 0, _merge)
+        self.assertFalse(first['coalesced'])
+        self.assertTrue(second['coalesced'])
+        self.assertEqual(second['job_id'], first['job_id'])
+        self.assertEqual(second['merged'], 1)
+        
+        [job] = job_queue.claim("sync", limit=5)
+        self.assertEqual(job['payload'], {"count": 3})
+        
+        # Once it runs, new submissions queue one job behind it without starting it
+        third = job_queue.enqueue_coalesced("sync", "mailbox", {"count": 4}, 0, _merge)
+        self.assertFalse(third['coalesced'])
+        self.assertEqual(job_queue.claim("sync"), [])
+        job_queue.complete(job['id'])
+        self.assertEqual(job_queue.claim("sync")[0]['id'], third['job_id'])
+    
+    def test_coalescing_window_delays_the_job(self):
+        job_queue.enqueue_coalesced("sync", "mailbox", {"count": 1}, 60, _merge)
+        self.assertEqual(job_queue.claim("sync"), [])
+    
+    def test_claims_highest_priority_first(self):
+        job_queue.enqueue("process", {"name": "low"}, priority=1)
+        job_queue.enqueue("process", {"name": "high"}, priority=5)
+        self.assertEqual(job_queue.highest_ready_priority("process"), 5)
+        jobs = job_queue.claim("process", limit=2)
+        self.assertEqual([job['payload']['name'] for job in jobs], ["high", "low"])
+    
+    def test_released_jobs_are_claimable_without_losing_an_attempt(self):
+        job_queue.enqueue("process", {})
+        [job] = job_queue.claim("process")
+        job_queue.release([job])
+        self.assertEqual(job_queue.claim("process")[0]['attempts'], 1)
@@ -0,0 +1,65 @@
+import collections
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import llm_cache
+
+
+class LlmCacheTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        for name, value in {
+            "CACHE_ENABLED": True,
+            "CACHE_MAX_ENTRIES": 3,
+            "CACHE_TTL_SECONDS": 60,
+            "_cache_file": os.path.join(self.dir.name, 'cache.json'),
+            "_entries": collections.OrderedDict(),
+            "_loaded": True,
+            "_dirty": False,
+            "_save_timer": None,
+        }.items():
+            patcher = mock.patch.object(llm_cache, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # Runs first, so the pending save goes to the temporary file
+        self.addCleanup(llm_cache.flush)
+    
+    def test_key_ignores_whitespace_but_not_model_or_tone(self):
+        key = llm_cache.make_key("llama3.2", "casual", "Hello\r\n  world ")
+        self.assertEqual(key, llm_cache.make_key("llama3.2", "casual", "Hello world"))
+        self.assertNotEqual(key, llm_cache.make_key("llama3.2", "formal", "Hello world"))
+        self.assertNotEqual(key, llm_cache.make_key("mistral", "casual", "Hello world"))
+    
+    def test_hit_returns_a_copy(self):
+        llm_cache.put("k", {"summary": "cached"})
+        hit = llm_cache.get("k")
+        self.assertEqual(hit, {"summary": "cached"})
+        hit['summary'] = "changed"
+        self.assertEqual(llm_cache.get("k"), {"summary": "cached"})
+        self.assertIsNone(llm_cache.get("other"))
+    
+    def test_expired_entry_is_a_miss(self):
+        with mock.patch.object(llm_cache.time, 'time', return_value=1000.0):
+            llm_cache.put("k", {"summary": "old"})
+        with mock.patch.object(llm_cache.time, 'time', return_value=1061.0):
+            self.assertIsNone(llm_cache.get("k"))
+    
+    def test_evicts_least_recently_used(self):
+        for key in ("a", "b", "c"):
+            llm_cache.put(key, {"summary": key})
+        llm_cache.get("a")
+        llm_cache.put("d", {"summary": "d"})
+        self.assertIsNone(llm_cache.get("b"))
+        for key in ("a", "c", "d"):
+            self.assertIsNotNone(llm_cache.get(key))
+    
+    def test_entries_survive_a_restart(self):
+        llm_cache.put("k", {"summary": "kept"})
+        llm_cache.flush()
+        llm_cache._entries.clear()
+        llm_cache._loaded = False
+        self.assertEqual(llm_cache.get("k"), {"summary": "kept"})
@@ -0,0 +1,64 @@
+import unittest
+from unittest import mock
+
+import metrics
+
+
+class RenderTest(unittest.TestCase):
+    
+    def setUp(self):
+        for patch in (mock.patch.object(metrics, '_histogram_values', {name: {} for name in metrics.HISTOGRAMS}),
+                      mock.patch.object(metrics, '_counter_values', {name: {} for name in metrics.COUNTERS})):
+            patch.start()
+            self.addCleanup(patch.stop)
+    
+    def _samples(self, name: str) -> dict:
+        """Sample lines of one metric, as series -> value."""
+        samples = {}
+        for line in metrics.render().splitlines():
+            if line.startswith(name) and not line.startswith('#'):
+                series, value = line.rsplit(' ', 1)
+                samples[series] = value
+        return samples
+    
+    def test_every_metric_has_help_and_type(self):
+        lines = metrics.render().splitlines()
+        for name in metrics.HISTOGRAMS:
+            self.assertIn(f"# HELP {name} {metrics.HISTOGRAMS[name][0]}", lines)
+            self.assertIn(f"# TYPE {name} histogram", lines)
+        for name in metrics.COUNTERS:
+            self.assertIn(f"# TYPE {name} counter", lines)
+    
+    def test_histogram_buckets_are_cumulative(self):
+        metrics.observe("automail_mime_parse_seconds", 0.003)
+        metrics.observe("automail_mime_parse_seconds", 0.2)
+        metrics.observe("automail_mime_parse_seconds", 1000)
+        
+        samples = self._samples("automail_mime_parse_seconds")
+        
+        self.assertEqual(samples['automail_mime_parse_seconds_bucket{le="0.001"}'], "0")
+        self.assertEqual(samples['automail_mime_parse_seconds_bucket{le="0.005"}'], "1")
+        self.assertEqual(samples['automail_mime_parse_seconds_bucket{le="0.25"}'], "2")
+        self.assertEqual(samples['automail_mime_parse_seconds_bucket{le="300"}'], "2")
+        self.assertEqual(samples['automail_mime_parse_seconds_bucket{le="+Inf"}'], "3")
+        self.assertEqual(samples['automail_mime_parse_seconds_count'], "3")
+        self.assertAlmostEqual(float(samples['automail_mime_parse_seconds_sum']), 1000.203)
+    
+    def test_counters_with_labels(self):
+        metrics.inc("automail_llm_requests_total", model="llama3.2", outcome="ok")
+        metrics.inc("automail_llm_requests_total", model="llama3.2", outcome="ok")
+        metrics.inc("automail_llm_prompt_tokens_total", 0.5, model='say "hi"\\\n')
+        
+        self.assertEqual(self._samples("automail_llm_requests_total"),
+                         {'automail_llm_requests_total{model="llama3.2",outcome="ok"}': "2"})
+        self.assertEqual(self._samples("automail_llm_prompt_tokens_total"),
+                         {'automail_llm_prompt_tokens_total{model="say \\"hi\\"\\\\\\n"}': "0.5"})
+    
+    def test_llm_breakdown_from_an_ollama_response(self):
+        metrics.record_llm("llama3.2", {"load_duration": 2e9, "eval_count": 42}, latency=3)
+        
+        self.assertEqual(self._samples("automail_llm_load_seconds_count"),
+                         {'automail_llm_load_seconds_count{model="llama3.2"}': "1"})
+        self.assertEqual(self._samples("automail_llm_generation_seconds_count"), {})
+        self.assertEqual(self._samples("automail_llm_eval_tokens_total"),
+                         {'automail_llm_eval_tokens_total{model="llama3.2"}': "42"})
@@ -0,0 +1,68 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from id_journal import ProcessedIdJournal
+import notify
+import storage
+
+
+class JsonMigrationTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        ids_file = os.path.join(self.dir.name, 'ids.json')
+        with open(ids_file, 'w') as f:
+            json.dump({"email_ids": ["a", "b"]}, f)
+        
+        self.journal = ProcessedIdJournal(os.path.join(self.dir.name, 'ids.journal'))
+        self.addCleanup(self.journal.close)
+        for name, value in {
+            "_emails_store_file": os.path.join(self.dir.name, 'emails.json'),
+            "_processed_ids_file": ids_file,
+            "_processed_ids_journal": self.journal,
+            "processed_emails_store": [],
+            "_processed_email_ids": set(),
+        }.items():
+            patcher = mock.patch.object(notify, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        
+        migrated = storage.get_meta('json_migrated')
+        if migrated:
+            self.addCleanup(storage.set_meta, 'json_migrated', migrated)
+        with storage._lock:
+            storage.get_connection().execute("DELETE FROM meta WHERE key = 'json_migrated'")
+    
+    def test_imported_ids_are_journaled_before_the_flag_is_set(self):
+        notify.load_emails_from_disk()
+        
+        self.assertEqual(notify._processed_email_ids, {"a", "b"})
+        self.assertEqual(self.journal.replay(), {"a", "b"})
+        self.assertIsNotNone(storage.get_meta('json_migrated'))
+    
+    def test_failed_journal_write_leaves_the_import_to_the_next_start(self):
+        with mock.patch.object(self.journal, 'rewrite', side_effect=OSError("disk full")):
+            notify.load_emails_from_disk()
+        self.assertIsNone(storage.get_meta('json_migrated'))
+        
+        notify.load_emails_from_disk()
+        self.assertEqual(notify._processed_email_ids, {"a", "b"})
+    
+    def test_legacy_table_is_dropped_only_after_its_ids_are_journaled(self):
+        with storage._lock:
+            conn = storage.get_connection()
+            conn.execute("CREATE TABLE processed_ids (email_id TEXT PRIMARY KEY)")
+            conn.execute("INSERT INTO processed_ids VALUES ('c')")
+        self.addCleanup(storage.drop_legacy_processed_ids)
+        
+        with mock.patch.object(self.journal, 'rewrite', side_effect=OSError("disk full")):
+            notify.load_emails_from_disk()
+        self.assertEqual(storage.load_legacy_processed_ids(), {"c"})
+        
+        notify.load_emails_from_disk()
+        self.assertEqual(notify._processed_email_ids, {"a", "b", "c"})
+        self.assertEqual(storage.load_legacy_processed_ids(), set())
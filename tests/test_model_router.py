@@ -0,0 +1,79 @@
+import asyncio
+import contextlib
+import io
+import unittest
+from unittest import mock
+
+import main
+import model_router
+
+
+class RouteTest(unittest.TestCase):
+    
+    def test_first_matching_rule_wins(self):
+        routes = [
+            {"task": "summary", "max_tokens": 400, "models": ["small", "default"]},
+            {"task": "reply", "min_priority": 100, "models": ["large"], "timeout": 120},
+        ]
+        with mock.patch.object(model_router, 'ROUTES', routes), \
+                mock.patch.object(model_router, 'DEFAULT_MODEL', "default"):
+            self.assertEqual(model_router.route("summary", tokens=100)['models'], ["small", "default"])
+            self.assertEqual(model_router.route("summary", tokens=1000)['models'], ["default"])
+            self.assertEqual(model_router.route("reply", priority=150)['timeout'], 120)
+            self.assertIsNone(model_router.route("reply", priority=50)['rule'])
+
+
+class FallbackTest(unittest.TestCase):
+    
+    def _stats(self, model: str) -> dict:
+        return model_router.get_stats()['models'][model]
+    
+    def test_failed_model_falls_back_to_the_next(self):
+        def generate(model, prompt, **options):
+            if model == "broken-a":
+                raise ConnectionError("connection refused")
+            return {"response": f"answer from {model}"}
+        
+        route = {"models": ["broken-a", "working-a"], "timeout": 5, "rule": 0}
+        with mock.patch.object(main.model_manager, 'generate', side_effect=generate), \
+                contextlib.redirect_stdout(io.StringIO()):
+            response = main._generate("prompt", route)
+        
+        self.assertEqual(response['model'], "working-a")
+        self.assertEqual(response['response'], "answer from working-a")
+        self.assertEqual(self._stats("broken-a")['errors'], 1)
+        self.assertEqual(self._stats("working-a")['fallbacks'], 1)
+    
+    def test_error_of_the_last_model_is_raised(self):
+        route = {"models": ["broken-b", "broken-c"], "timeout": 5, "rule": 0}
+        with mock.patch.object(main.model_manager, 'generate', side_effect=ConnectionError("down")), \
+                contextlib.redirect_stdout(io.StringIO()), self.assertRaises(ConnectionError):
+            main._generate("prompt", route)
+    
+    def test_streamed_generation_falls_back_on_timeout(self):
+        async def stream_model(model, prompt, on_token=None, **options):
+            if model == "slow-d":
+                await asyncio.sleep(5)
+            on_token("hi")
+            return {"response": "hi", "done": True}, 0.01
+        
+        route = {"models": ["slow-d", "fast-d"], "timeout": 0.05, "rule": 0}
+        tokens = []
+        with mock.patch.object(main, '_stream_model_async', stream_model), \
+                contextlib.redirect_stdout(io.StringIO()):
+            response, _ = asyncio.run(main._stream_generate_async("prompt", tokens.append, route))
+        
+        self.assertEqual(response['model'], "fast-d")
+        self.assertEqual(tokens, ["hi"])
+        self.assertEqual(self._stats("slow-d")['timeouts'], 1)
+    
+    def test_no_fallback_once_text_was_streamed(self):
+        async def stream_model(model, prompt, on_token=None, **options):
+            on_token("partial")
+            raise ConnectionError("connection reset")
+        
+        route = {"models": ["flaky-e", "spare-e"], "timeout": 5, "rule": 0}
+        with mock.patch.object(main, '_stream_model_async', stream_model), \
+                contextlib.redirect_stdout(io.StringIO()), self.assertRaises(ConnectionError):
+            asyncio.run(main._stream_generate_async("prompt", None, route))
+        self.assertNotIn("spare-e", model_router.get_stats()['models'])
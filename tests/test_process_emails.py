@@ -0,0 +1,105 @@
+import asyncio
+import contextlib
+import io
+import threading
+import time
+import unittest
+from unittest import mock
+
+import main
+
+
+class ProcessEmailsTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.emails = [
+            {
+                "id": f"m{i}",
+                "from": "Sam <sam@example.com>",
+                "subject": f"Report {i}",
+                "body": "Could you send me the quarterly report by Friday? Thanks a lot for your help.",
+            }
+            for i in range(5)
+        ]
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+    
+    def _fake_call(self, field: str):
+        def call(email_data, *args, **kwargs):
+            with self.lock:
+                self.running += 1
+                self.peak = max(self.peak, self.running)
+            try:
+                # Later emails finish first
+                time.sleep(0.01 * (5 - int(email_data['id'][1:])))
+                if email_data['id'] == "m2":
+                    raise RuntimeError("model crashed")
+                return {field: f"{field} of {email_data['id']}", "status": "success", "processing_time": 0.01}
+            finally:
+                with self.lock:
+                    self.running -= 1
+        return call
+    
+    def _process(self, max_in_flight: int):
+        with mock.patch.object(main, 'summarize_email', self._fake_call("summary")), \
+                mock.patch.object(main, 'generate_draft_reply', self._fake_call("draft_reply")), \
+                contextlib.redirect_stdout(io.StringIO()):
+            return main.process_emails(self.emails, mode="separate", max_in_flight=max_in_flight)
+    
+    def test_results_keep_input_order_and_failures_stay_per_email(self):
+        for max_in_flight in (1, 3):
+            with self.subTest(max_in_flight=max_in_flight):
+                results = self._process(max_in_flight)
+                
+                self.assertEqual([r['email_id'] for r in results], ["m0", "m1", "m2", "m3", "m4"])
+                self.assertIn("model crashed", results[2]['error'])
+                for result in results[:2] + results[3:]:
+                    self.assertEqual(result['summary'], f"summary of {result['email_id']}")
+                    self.assertEqual(result['draft_reply'], f"draft_reply of {result['email_id']}")
+                    self.assertNotIn('error', result)
+    
+    def test_pool_bounds_concurrent_calls(self):
+        self._process(3)
+        self.assertGreater(self.peak, 1)
+        self.assertLessEqual(self.peak, 3)
+        
+        self.peak = 0
+        self._process(1)
+        self.assertEqual(self.peak, 1)
+
+
+class LlmCallCountTest(unittest.TestCase):
+    """Combined mode falling back to separate calls makes three Ollama requests per email."""
+    
+    def setUp(self):
+        self.emails = [
+            {"id": f"c{i}", "from": "Sam <sam@example.com>", "subject": "Report",
+             "body": "Could you send me the quarterly report by Friday? Thanks a lot for your help."}
+            for i in range(2)
+        ]
+        classify = mock.patch.object(main.classifier, 'classify', wraps=main.classifier.classify)
+        self.classify = classify.start()
+        self.addCleanup(classify.stop)
+    
+    def test_sync_paths_count_the_calls_made(self):
+        for max_in_flight in (1, 3):
+            with self.subTest(max_in_flight=max_in_flight):
+                self.classify.reset_mock()
+                with mock.patch.object(main.model_manager, 'generate', return_value={"response": "not json"}):
+                    results = main.process_emails(self.emails, mode="combined", max_in_flight=max_in_flight)
+                
+                self.assertTrue(all(r.get('combined_fallback') for r in results))
+                self.assertEqual(main.get_last_batch_stats()['llm_calls'], 6)
+                self.assertEqual(self.classify.call_count, 2)
+    
+    def test_async_path_counts_the_calls_made(self):
+        async def stream_model(model, prompt, on_token=None, **options):
+            return {"response": "not json", "done": True}, 0.01
+        
+        with mock.patch.object(main, '_stream_model_async', stream_model):
+            results = asyncio.run(main.process_emails_async(self.emails, mode="combined", max_in_flight=2))
+        
+        self.assertTrue(all(r.get('combined_fallback') for r in results))
+        self.assertEqual(main.get_last_batch_stats()['llm_calls'], 6)
+        self.assertEqual(self.classify.call_count, 2)
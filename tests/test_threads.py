@@ -0,0 +1,17 @@
+import unittest
+from unittest import mock
+
+import threads
+
+
+class ThreadKeyTest(unittest.TestCase):
+    
+    def test_accepts_gmail_and_stored_field_names(self):
+        with mock.patch.object(threads, 'THREAD_SUMMARIES', True):
+            self.assertEqual(threads.thread_key({"threadId": "t1"}), "t1")
+            self.assertEqual(threads.thread_key({"thread_id": "t2"}), "t2")
+            self.assertIsNone(threads.thread_key({"id": "m1"}))
+    
+    def test_per_message_mode(self):
+        with mock.patch.object(threads, 'THREAD_SUMMARIES', False):
+            self.assertIsNone(threads.thread_key({"threadId": "t1"}))